@@ -0,0 +1,108 @@
+#
+# 数据模型内存占用基准测试，输出每篇文章的平均内存开销
+#
+# python benchmarks/bench_models.py [--posts=50000]
+#
+# 对比旧版本 dict 子类数据模型（"before" 数据）时，将本脚本复制到旧版本的 worktree 中运行，
+# 脚本总是导入其所在仓库中的 treehole，convert() 会自动兼容旧版本数据模型：
+#
+#   git worktree add /tmp/treehole-before "$(git log --format=%h -1 --grep='slotted records')^"
+#   mkdir -p /tmp/treehole-before/benchmarks && cp benchmarks/bench_models.py /tmp/treehole-before/benchmarks/
+#   cp treehole/__version__.py /tmp/treehole-before/treehole/  # setuptools-scm 生成的版本文件不在 git 中
+#   python /tmp/treehole-before/benchmarks/bench_models.py --posts=50000
+#   git worktree remove --force /tmp/treehole-before
+#
+
+import argparse
+import gc
+import logging
+import os.path
+import sys
+import time
+import tracemalloc
+
+# 注意：直接运行脚本时 sys.path 中只有 benchmarks 目录，此处加入仓库根目录，保证导入的是当前仓库中的 treehole
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from treehole.github import GithubIssue
+from treehole.treehole import TreeHolePost
+
+
+def make_issue(number: int):
+    """生成与 Github 接口返回结构一致的原始 issue 数据，包含大量博客不使用的字段
+    """
+    login = "mywaiting"
+    return {
+        "url": f"https://api.github.com/repos/{login}/treehole/issues/{number}",
+        "repository_url": f"https://api.github.com/repos/{login}/treehole",
+        "labels_url": f"https://api.github.com/repos/{login}/treehole/issues/{number}/labels{{/name}}",
+        "comments_url": f"https://api.github.com/repos/{login}/treehole/issues/{number}/comments",
+        "events_url": f"https://api.github.com/repos/{login}/treehole/issues/{number}/events",
+        "html_url": f"https://github.com/{login}/treehole/issues/{number}",
+        "id": 1000000 + number,
+        "node_id": f"I_kwDOAAAA{number:08d}",
+        "number": number,
+        "title": f"Post number {number}",
+        "user": {
+            "login": login,
+            "id": 1,
+            "node_id": "MDQ6VXNlcjE=",
+            "avatar_url": "https://avatars.githubusercontent.com/u/1?v=4",
+            "html_url": f"https://github.com/{login}",
+            "type": "User",
+            "site_admin": False,
+        },
+        "labels": [
+            { "id": 1, "node_id": "LA_1", "name": "python", "color": "ededed", "default": False, "description": None },
+            { "id": 2, "node_id": "LA_2", "name": ["life", "misc"][number % 2], "color": "ededed", "default": False, "description": None },
+        ],
+        "state": "open",
+        "locked": False,
+        "comments": 0,
+        "created_at": f"2020-01-{number % 28 + 1:02d}T00:00:{number % 60:02d}Z",
+        "updated_at": f"2020-02-{number % 28 + 1:02d}T00:00:{number % 60:02d}Z",
+        "author_association": "OWNER",
+        "body": f"# Title {number}\n\nShort body for post {number}.",
+        "reactions": {
+            "url": f"https://api.github.com/repos/{login}/treehole/issues/{number}/reactions",
+            "total_count": 0, "+1": 0, "-1": 0, "laugh": 0, "hooray": 0,
+            "confused": 0, "heart": 0, "rocket": 0, "eyes": 0,
+        },
+    }
+
+
+def convert(issue: dict):
+    # 注意：兼容旧版本 dict 子类数据模型，方便在历史版本上运行对比
+    if issubclass(TreeHolePost, dict):
+        return dict(TreeHolePost(dict(GithubIssue(issue))))
+    return TreeHolePost(GithubIssue(issue))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=50000)
+    args = parser.parse_args()
+
+    # 注意：每篇文章都会输出 `parsed title=` 日志，此处关闭 treehole 的 info 日志，避免日志输出影响耗时
+    logging.getLogger("treehole").setLevel(logging.WARNING)
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    posts = []
+    for number in range(1, args.posts + 1):
+        posts.append(convert(make_issue(number)))
+
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"posts={len(posts)}, model={TreeHolePost.__mro__[1].__name__}")
+    print(f"retained={current / 1024 / 1024:.1f}MiB, per_post={current / len(posts):.0f}B, peak={peak / 1024 / 1024:.1f}MiB")
+    print(f"elapsed={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#
+# 站内搜索索引基准测试，输出索引体积、构建耗时、增量更新耗时以及查询延迟
+#
+# python benchmarks/bench_search.py [--posts=10000]
+#
+
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import os.path
+import random
+import statistics
+import sys
+import time
+
+# 注意：直接运行脚本时 sys.path 中只有 benchmarks 目录，此处加入仓库根目录，保证导入的是当前仓库中的 treehole
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from treehole.search import SearchIndex, tokenize
+from treehole.utils import Record
+
+
+class BenchPost(Record):
+    """只包含搜索索引使用字段的文章数据，避免基准测试被 markdown 渲染耗时干扰
+    """
+    __slots__ = ("id", "updated_at", "datetime", "title", "summary", "body_html", "permanent_url")
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+
+class MemoryFiles:
+    def __init__(self):
+        self.files = {}
+
+    def write(self, filepath: str, filetext: str):
+        self.files[filepath.replace("./search/", "")] = filetext.encode("utf-8")
+
+
+def make_vocabulary(rng: random.Random):
+    """生成近似 Zipf 分布的中英文词表，中文词语由常用汉字随机组合
+    """
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    english = [ "".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(5000) ]
+    chars = [ chr(0x4e00 + rng.randint(0, 2500)) for _ in range(2500) ]
+    chinese = [ "".join(rng.choice(chars) for _ in range(rng.randint(2, 4))) for _ in range(8000) ]
+    weights = [ 1 / (rank + 1) for rank in range(max(len(english), len(chinese))) ]
+    return english, chinese, weights
+
+
+def make_post(number: int, rng: random.Random, vocabulary: tuple, chinese_ratio: float = 0.6):
+    english, chinese, weights = vocabulary
+    is_chinese = rng.random() < chinese_ratio
+    words = chinese if is_chinese else english
+    sep = "" if is_chinese else " "
+
+    def sentence(k: int):
+        return sep.join(rng.choices(words, weights=weights[:len(words)], k=k))
+
+    paragraphs = [ sentence(rng.randint(20, 80)) for _ in range(rng.randint(2, 8)) ]
+    dt = datetime.datetime(2015, 1, 1) + datetime.timedelta(hours=number * 9)
+    return BenchPost(
+        id=number,
+        updated_at=dt.isoformat(),
+        datetime=dt,
+        title=sentence(rng.randint(3, 8)),
+        summary=paragraphs[0][:130],
+        body_html="".join(f"<p>{paragraph}</p>\n" for paragraph in paragraphs),
+        permanent_url=f"/{dt.year}/{dt.month:02d}/{dt.day:02d}/{number}/",
+    )
+
+
+def query(files: dict, compressed: dict, cache: dict, meta: dict, text: str):
+    """与 app.js 中 search_query 相同的查询流程，返回 (结果数量, 本次新加载的 gzip 字节数)
+    """
+    fetched = 0
+
+    def load(name: str):
+        nonlocal fetched
+        if name not in cache:
+            fetched += compressed.get(name, 0)
+            cache[name] = json.loads(files.get(name, b"{}"))
+        return cache[name]
+
+    tokens = tokenize(text)
+    scores = None
+    for i, token in enumerate(tokens):
+        shard = load(f"{SearchIndex.shard_name(token)}.json")
+        terms = [ term for term in shard if term.startswith(token) ] if i == len(tokens) - 1 else [ token ]
+        matched = {}
+        for term in terms:
+            post_id = 0
+            postings = shard.get(term, [])
+            for k in range(0, len(postings), 2):
+                post_id += postings[k]
+                matched[post_id] = matched.get(post_id, 0) + postings[k + 1]
+        if scores is None:
+            scores = matched
+        else:
+            scores = { post_id: score + matched[post_id] for post_id, score in scores.items() if post_id in matched }
+
+    ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], -item[0]))[:20]
+    for post_id, _ in ranked:
+        load(f"d{post_id // meta['chunk']}.json")
+    return (len(ranked), fetched)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    # 注意：关闭 treehole 的 info 日志，避免日志输出影响耗时
+    logging.getLogger("treehole").setLevel(logging.WARNING)
+
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(rng)
+    posts = [ make_post(number, rng, vocabulary) for number in range(1, args.posts + 1) ]
+
+    # 完整构建
+    started = time.perf_counter()
+    index = SearchIndex()
+    index.update(posts)
+    writer = MemoryFiles()
+    index.write(writer)
+    build_elapsed = time.perf_counter() - started
+
+    files = writer.files
+    shards = { name: body for name, body in files.items() if not name.startswith("d") and name != "meta.json" }
+    docs = { name: body for name, body in files.items() if name.startswith("d") }
+    raw = sum(len(body) for body in files.values())
+    compressed = { name: len(gzip.compress(body)) for name, body in files.items() }
+
+    print(f"posts={len(posts)}, terms={len(index.postings)}, files={len(files)}, build={build_elapsed:.2f}s")
+    print(f"size={raw / 1024 / 1024:.1f}MiB, gzip={sum(compressed.values()) / 1024 / 1024:.1f}MiB")
+    print(
+        f"shards={len(shards)}, shard_gzip_avg={statistics.mean(compressed[name] for name in shards) / 1024:.0f}KiB, "
+        f"shard_gzip_max={max(compressed[name] for name in shards) / 1024:.0f}KiB, "
+        f"docs_gzip_avg={statistics.mean(compressed[name] for name in docs) / 1024:.0f}KiB"
+    )
+
+    # 增量更新：修改 1% 的文章，只重新输出受影响的分片
+    changed = rng.sample(posts, max(1, len(posts) // 100))
+    started = time.perf_counter()
+    for post in changed:
+        post.updated_at = f"{post.updated_at}+1"
+        post.title = f"{post.title} updated"
+    index.update(posts)
+    writer = MemoryFiles()
+    rewritten = index.write(writer)
+    print(f"incremental, changed={len(changed)}, files={rewritten}, elapsed={(time.perf_counter() - started) * 1000:.0f}ms")
+
+    # 查询延迟：每次查询使用空缓存（首次查询），统计解析分片/匹配的总耗时，不包含网络传输耗时
+    meta = json.loads(files["meta.json"])
+    texts = []
+    for _ in range(args.queries):
+        post = rng.choice(posts)
+        words = tokenize(post.title)
+        texts.append(" ".join(words[:2]) if words else "a")
+
+    latencies, fetched = [], []
+    for text in texts:
+        started = time.perf_counter()
+        _, size = query(files, compressed, {}, meta, text)
+        latencies.append((time.perf_counter() - started) * 1000)
+        fetched.append(size)
+    latencies.sort()
+    print(
+        f"query cold, p50={latencies[len(latencies) // 2]:.1f}ms, p95={latencies[int(len(latencies) * 0.95)]:.1f}ms, "
+        f"fetched_gzip_avg={statistics.mean(fetched) / 1024:.0f}KiB"
+    )
+
+    cache = {}
+    for text in texts:
+        query(files, compressed, cache, meta, text)
+    latencies = []
+    for text in texts:
+        started = time.perf_counter()
+        query(files, compressed, cache, meta, text)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"query warm, p50={latencies[len(latencies) // 2]:.2f}ms, p95={latencies[int(len(latencies) * 0.95)]:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
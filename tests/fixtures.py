@@ -0,0 +1,170 @@
+#
+# 测试公共数据，按 Github 接口返回格式生成 issues/comments，并写入 data_path 中的本地缓存 store
+#
+
+import copy
+import json
+import os
+import os.path
+
+import tornado.locale
+
+from treehole.github import GithubComment, GithubIssue
+from treehole.store import TreeHoleStore
+from treehole.treehole import TreeHoleApp, base_dir
+
+
+
+OWNER = "mywaiting"
+REPO = "treehole"
+SECRET = "s3cret"
+
+data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+tornado.locale.load_gettext_translations(os.path.join(base_dir, "locale"), "treehole")
+
+
+
+def make_user(login: str = OWNER):
+    return {
+        "login": login,
+        "id": 1,
+        "avatar_url": f"https://avatars.githubusercontent.com/{login}",
+        "html_url": f"https://github.com/{login}",
+        "type": "User",
+    }
+
+
+def make_issue(number: int, created_at: str, title: str = None, body: str = None, **fields):
+    """返回与 Github 接口结构一致的 issue 数据，fields 覆盖其中的字段
+    """
+    issue = {
+        "url": f"https://api.github.com/repos/{OWNER}/{REPO}/issues/{number}",
+        "html_url": f"https://github.com/{OWNER}/{REPO}/issues/{number}",
+        "number": number,
+        "title": title or f"Post number {number}",
+        "user": make_user(),
+        "labels": [
+            { "id": 1, "name": "life", "color": "ededed", "description": None, "default": False },
+            { "id": 2, "name": ["python", "misc"][number % 2], "color": "ededed", "description": None, "default": False },
+        ],
+        "state": "open",
+        "comments": 0,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "body": body or f"# Post number {number}\n\nParagraph **{number}** with [link](https://example.com).\n\n- one\n- two\n",
+        "reactions": {
+            "url": f"https://api.github.com/repos/{OWNER}/{REPO}/issues/{number}/reactions",
+            "total_count": number % 3, "+1": number % 3, "-1": 0, "laugh": 0, "hooray": 0,
+            "confused": 0, "heart": 0, "rocket": 0, "eyes": 0,
+        },
+    }
+    issue.update(fields)
+    return issue
+
+
+def make_comment(comment_id: int, number: int, created_at: str, body: str = None, **fields):
+    comment = {
+        "url": f"https://api.github.com/repos/{OWNER}/{REPO}/issues/comments/{comment_id}",
+        "html_url": f"https://github.com/{OWNER}/{REPO}/issues/{number}#issuecomment-{comment_id}",
+        "issue_url": f"https://api.github.com/repos/{OWNER}/{REPO}/issues/{number}",
+        "id": comment_id,
+        "user": make_user("visitor"),
+        "created_at": created_at,
+        "updated_at": created_at,
+        "body": body or f"Comment {comment_id} on post {number}",
+        "reactions": {
+            "url": f"https://api.github.com/repos/{OWNER}/{REPO}/issues/comments/{comment_id}/reactions",
+            "total_count": 0, "+1": 0, "-1": 0, "laugh": 0, "hooray": 0,
+            "confused": 0, "heart": 0, "rocket": 0, "eyes": 0,
+        },
+    }
+    comment.update(fields)
+    return comment
+
+
+def make_data():
+    """返回 (issues, comments)，文章分布在 2019/2020 两年，同时包含不会出现在网站中的 issues
+
+    - 1~8 为 2019 年文章，9~14 为 2020 年文章，3/4 以及 10/11 分别发布在同一天
+    - 15 已经关闭，16 为 pull request，17 由其他用户创建
+    """
+    dates = {
+        1: "2019-01-05T08:00:00Z", 2: "2019-02-11T09:30:00Z", 3: "2019-02-20T10:00:00Z", 4: "2019-02-20T18:00:00Z",
+        5: "2019-06-01T12:00:00Z", 6: "2019-06-15T12:00:00Z", 7: "2019-11-30T23:00:00Z", 8: "2019-12-31T10:00:00Z",
+        9: "2020-01-01T01:00:00Z", 10: "2020-03-08T07:00:00Z", 11: "2020-03-08T21:00:00Z", 12: "2020-05-05T05:00:00Z",
+        13: "2020-08-17T16:00:00Z", 14: "2020-12-24T20:00:00Z",
+    }
+    issues = [ make_issue(number, created_at) for number, created_at in dates.items() ]
+    issues[5]["title"] = "树洞里的第六篇文章"
+    issues.append(make_issue(15, "2019-04-01T00:00:00Z", state="closed"))
+    issues.append(make_issue(16, "2019-04-02T00:00:00Z", pull_request={ "url": f"https://api.github.com/repos/{OWNER}/{REPO}/pulls/16" }))
+    issues.append(make_issue(17, "2019-04-03T00:00:00Z", user=make_user("someone")))
+
+    comments = [
+        make_comment(201, 2, "2019-02-12T00:00:00Z"),
+        make_comment(202, 2, "2019-02-13T00:00:00Z"),
+        make_comment(203, 2, "2019-02-14T00:00:00Z"),
+        make_comment(901, 9, "2020-01-02T00:00:00Z"),
+        make_comment(902, 9, "2020-01-03T00:00:00Z"),
+        make_comment(1501, 15, "2019-04-02T00:00:00Z"),
+    ]
+    for issue in issues:
+        issue["comments"] = sum( 1 for comment in comments if comment["issue_url"] == issue["url"] )
+    return (issues, comments)
+
+
+def write_store(data_path: str, issues: list, comments: list):
+    """将 Github 接口格式的 issues/comments 写入 data_path 中的本地缓存，构建时 debug=True 直接读取此缓存
+    """
+    os.makedirs(data_path, exist_ok=True)
+    with TreeHoleStore(os.path.join(data_path, "_treehole.sqlite3")) as store:
+        store.save_issues([ GithubIssue(issue) for issue in issues ])
+        store.save_comments([ GithubComment(comment) for comment in comments ])
+
+
+def make_settings(data_path: str, **settings):
+    return {
+        "debug": True,
+        "default_locale": "en",
+        "locale_domain": "treehole",
+        "base_url": "https://treehole.example.com",
+        "site_title": "TreeHole",
+        "site_desc": "Microblog platform based Github issues",
+        "data_path": data_path,
+        "github_owner": OWNER,
+        "github_repo": REPO,
+        "github_token": "token",
+        **settings,
+    }
+
+
+def make_app(data_path: str, data: tuple = None, **settings):
+    """写入测试数据并返回 TreeHoleApp，data 未指定时使用 make_data()
+    """
+    issues, comments = copy.deepcopy(data) if data is not None else make_data()
+    write_store(data_path, issues, comments)
+    return TreeHoleApp(**make_settings(data_path, **settings))
+
+
+def read_tree(path: str):
+    """返回目录中全部文件 相对路径 → 文件内容
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            with open(filepath, "rb") as fd:
+                files[os.path.relpath(filepath, path).replace(os.sep, "/")] = fd.read()
+    return files
+
+
+def load_payload(name: str):
+    """返回 tests/data 中保存的 Webhook 原始请求内容
+    """
+    with open(os.path.join(data_dir, name), "rb") as fd:
+        return fd.read()
+
+
+def load_json(name: str):
+    return json.loads(load_payload(name))
@@ -0,0 +1,172 @@
+#
+# Github 速率限制测试，使用 tornado 实现的本地 Github 接口按 token 返回 X-RateLimit-* 响应头
+#
+
+import email.utils
+import json
+import time
+
+import tornado.httpclient
+import tornado.testing
+import tornado.web
+
+from treehole.github import GithubClient
+
+from .fixtures import OWNER, REPO, make_issue
+
+
+
+class MockGithub:
+    """按 Authorization 记录每个 token 的额度，limit 次请求之后返回 403 直到 window 秒之后重置
+
+    - 注意：retry_after 中的页码第一次请求时返回 403 并带有对应的 Retry-After，模拟 secondary rate limit
+    """
+    def __init__(self, pages: int = 3, limit: int = 100, window: int = 3600):
+        self.pages = pages
+        self.limit = limit
+        self.window = window
+        self.quotas = {}        # token → [used, reset]
+        self.requests = []      # (token, page, status)
+        self.retry_after = {}   # page → Retry-After
+        self.forbidden = False
+
+    def quota(self, token: str):
+        now = time.time()
+        quota = self.quotas.setdefault(token, [0, int(now) + self.window])
+        if now >= quota[1]:
+            quota[:] = [0, int(now) + self.window]
+        return quota
+
+
+class MockIssuesHandler(tornado.web.RequestHandler):
+
+    def initialize(self, github: MockGithub):
+        self.github = github
+
+    def get(self, owner: str, repo: str):
+        token = self.request.headers.get("Authorization", "").removeprefix("Bearer ")
+        page = int(self.get_argument("page", "1"))
+        quota = self.github.quota(token)
+
+        if self.github.forbidden:
+            self.respond(token, page, 403, { "message": "Resource not accessible by integration" })
+            return
+        if page in self.github.retry_after:
+            self.set_header("Retry-After", self.github.retry_after.pop(page))
+            self.respond(token, page, 403, { "message": "You have exceeded a secondary rate limit" })
+            return
+
+        self.set_header("X-RateLimit-Limit", str(self.github.limit))
+        self.set_header("X-RateLimit-Reset", str(quota[1]))
+        if quota[0] >= self.github.limit:
+            self.set_header("X-RateLimit-Remaining", "0")
+            self.respond(token, page, 403, { "message": "API rate limit exceeded" })
+            return
+        quota[0] += 1
+        self.set_header("X-RateLimit-Remaining", str(self.github.limit - quota[0]))
+        if page < self.github.pages:
+            self.set_header("Link", f'<{self.request.protocol}://{self.request.host}{self.request.path}?page={page + 1}>; rel="next"')
+        self.respond(token, page, 200, [ make_issue(page, "2019-01-05T08:00:00Z") ])
+
+    def respond(self, token: str, page: int, status: int, data):
+        self.github.requests.append((token, page, status))
+        self.set_status(status)
+        self.write(json.dumps(data))
+
+
+class RateLimitTest(tornado.testing.AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.github = MockGithub()
+        self.waits = []
+        super().setUp()
+
+    def get_app(self):
+        return tornado.web.Application([
+            (r"/repos/([^/]+)/([^/]+)/issues", MockIssuesHandler, { "github": self.github }),
+        ])
+
+    def make_client(self, tokens: str):
+        client = GithubClient(tokens)
+        client.base_url = self.get_url("")
+        # 注意：本地时间与 mock 接口完全一致，无需额外等待；记录每次等待的秒数
+        client.tokens.reset_margin = 0.1
+        sleep = client.tokens.sleep
+        async def recording_sleep(wait: float):
+            self.waits.append(wait)
+            await sleep(wait)
+        client.tokens.sleep = recording_sleep
+        return client
+
+    async def get_issues(self, client: GithubClient):
+        return [ issue["number"] async for issue in client.get_repo_issues(OWNER, REPO) ]
+
+    @tornado.testing.gen_test
+    async def test_switch_token_when_exhausted(self):
+        self.github.quotas["tokA"] = [self.github.limit, int(time.time()) + 3600]
+        client = self.make_client("tokA, tokB")
+        self.assertEqual(await self.get_issues(client), [1, 2, 3])
+
+        # tokA 额度耗尽之后标记到 reset 时间，其余请求全部使用 tokB，无需等待
+        self.assertEqual(self.github.requests, [("tokA", 1, 403), ("tokB", 1, 200), ("tokB", 2, 200), ("tokB", 3, 200)])
+        token_a, token_b = client.tokens.tokens
+        self.assertEqual((token_a.rate_limited, token_a.remaining), (1, 0))
+        self.assertEqual((token_b.rate_limited, token_b.remaining), (0, self.github.limit - 3))
+        self.assertEqual(self.waits, [])
+        self.assertEqual(client.tokens.waited, 0)
+
+    @tornado.testing.gen_test(timeout=10)
+    async def test_wait_until_reset(self):
+        self.github.limit = 2
+        self.github.window = 2
+        client = self.make_client("tokA")
+        start = time.time()
+        self.assertEqual(await self.get_issues(client), [1, 2, 3])
+
+        # 第二个请求返回 X-RateLimit-Remaining=0 之后等待到 reset 时间再请求，不会触发 403
+        self.assertEqual([ status for _, _, status in self.github.requests ], [200, 200, 200])
+        self.assertEqual(len(self.waits), 1)
+        self.assertGreater(self.waits[0], 0)
+        self.assertGreater(time.time() - start, self.waits[0] - 0.1)
+        self.assertGreater(client.tokens.waited, 0)
+        self.assertEqual(client.tokens.tokens[0].rate_limited, 0)
+
+    @tornado.testing.gen_test(timeout=10)
+    async def test_retry_after(self):
+        self.github.retry_after[2] = "1"
+        client = self.make_client("tokA")
+        self.assertEqual(await self.get_issues(client), [1, 2, 3])
+
+        self.assertEqual([ (page, status) for _, page, status in self.github.requests ], [(1, 200), (2, 403), (2, 200), (3, 200)])
+        self.assertEqual(self.waits, [1])
+        self.assertEqual(client.tokens.tokens[0].rate_limited, 1)
+
+    @tornado.testing.gen_test(timeout=10)
+    async def test_retry_after_date(self):
+        # 注意：Retry-After 同样可以是 HTTP-date 格式，按与当前时间的差值等待
+        self.github.retry_after[1] = email.utils.formatdate(time.time() + 2, usegmt=True)
+        client = self.make_client("tokA")
+        self.assertEqual(await self.get_issues(client), [1, 2, 3])
+
+        self.assertEqual([ (page, status) for _, page, status in self.github.requests ], [(1, 403), (1, 200), (2, 200), (3, 200)])
+        self.assertEqual(len(self.waits), 1)
+        self.assertTrue(0 < self.waits[0] <= 2, self.waits)
+
+    def test_parse_retry_after(self):
+        client = GithubClient("tokA")
+        self.assertEqual(client.parse_retry_after("30"), 30)
+        self.assertEqual(client.parse_retry_after("-5"), 0)
+        self.assertEqual(client.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        self.assertEqual(client.parse_retry_after("soon"), client.retry_after)
+        self.assertEqual(client.parse_retry_after(""), client.retry_after)
+
+    @tornado.testing.gen_test
+    async def test_other_errors_raised(self):
+        # 注意：没有速率限制响应头的 403 不重试，直接抛出异常
+        self.github.forbidden = True
+        client = self.make_client("tokA")
+        with self.assertRaises(tornado.httpclient.HTTPClientError) as cm:
+            await self.get_issues(client)
+        self.assertEqual(cm.exception.code, 403)
+        self.assertEqual(len(self.github.requests), 1)
+        self.assertEqual(self.waits, [])
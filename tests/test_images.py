@@ -0,0 +1,172 @@
+#
+# 图片本地镜像测试，使用本地 http.server 作为图片服务器
+#
+
+import collections
+import hashlib
+import http.server
+import json
+import os
+import os.path
+import struct
+import tempfile
+import threading
+import unittest
+import zlib
+
+from treehole.images import image_size
+
+from .fixtures import make_data, make_app, read_tree
+
+
+
+def make_png(width: int, height: int, color: bytes = b"\xff\x00\x00"):
+    """生成最简单的 RGB PNG 图片
+    """
+    def chunk(kind: bytes, data: bytes):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join( b"\x00" + color * width for _ in range(height) )
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(rows)),
+        chunk(b"IEND", b""),
+    ])
+
+
+def make_gif(width: int, height: int):
+    return b"GIF89a" + struct.pack("<HH", width, height) + b"\x00\x00\x00;"
+
+
+class ImageHost(http.server.ThreadingHTTPServer):
+    """本地图片服务器，记录每个路径的请求次数，未知路径返回 404
+    """
+    def __init__(self, images: dict):
+        self.images = images # path → (Content-Type, body)
+        self.requests = collections.Counter()
+        super().__init__(("127.0.0.1", 0), ImageHandler)
+
+    def url(self, path: str):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class ImageHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests[self.path] += 1
+        if self.path not in self.server.images:
+            self.send_error(404)
+            return
+        content_type, body = self.server.images[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ImageMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.png = make_png(3, 2)
+        self.gif = make_gif(40, 30)
+        self.host = ImageHost({
+            "/a.png": ("image/png", self.png),
+            "/copy-of-a.png": ("application/octet-stream", self.png),
+            "/c.gif": ("image/gif", self.gif),
+        })
+        thread = threading.Thread(target=self.host.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.host.server_close)
+        self.addCleanup(self.host.shutdown)
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_path = tmpdir.name
+
+        issues, comments = make_data()
+        issues[0]["body"] = (
+            f"# Post with images\n\n"
+            f"![a]({self.host.url('/a.png')})\n\n"
+            f"![same content]({self.host.url('/copy-of-a.png')})\n\n"
+            f"![missing]({self.host.url('/missing.png')})\n"
+        )
+        issues[1]["body"] = f"# Another post\n\n![c]({self.host.url('/c.gif')})\n\n![external](https://example.com/x.png)\n"
+        self.data = (issues, comments)
+
+    def build(self):
+        app = make_app(self.data_path, data=self.data, mirror_images=True, mirror_images_hosts="127.0.0.1")
+        app.run()
+        return read_tree(os.path.join(self.data_path, "output"))
+
+    def output_name(self, data: bytes, ext: str):
+        return f"images/{hashlib.sha256(data).hexdigest()[:16]}{ext}"
+
+    def test_mirror_images(self):
+        files = self.build()
+        png_name = self.output_name(self.png, ".png")
+        gif_name = self.output_name(self.gif, ".gif")
+
+        # 相同内容的图片按 sha256 只保存/输出一份
+        self.assertEqual(sorted( name for name in files if name.startswith("images/") ), sorted([png_name, gif_name]))
+        self.assertEqual(files[png_name], self.png)
+        stored = [ filename for _, _, filenames in os.walk(os.path.join(self.data_path, "_images")) for filename in filenames ]
+        self.assertEqual(sorted(stored), sorted([
+            f"{hashlib.sha256(self.png).hexdigest()}.png",
+            f"{hashlib.sha256(self.gif).hexdigest()}.gif",
+        ]))
+
+        # 改写为本地链接并加上原始尺寸
+        page = files["2019/01/05/post-number-1/index.html"].decode("utf-8")
+        self.assertEqual(page.count(f'src="/{png_name}"'), 2)
+        self.assertIn('width="3" height="2"', page)
+        self.assertIn(f"https://treehole.example.com/{png_name}", page) # og:image 使用完整链接
+        page = files["2019/02/11/post-number-2/index.html"].decode("utf-8")
+        self.assertIn(f'src="/{gif_name}"', page)
+        self.assertIn('width="40" height="30"', page)
+
+        # 下载失败以及其他域名的图片保留原始链接
+        self.assertIn(f'src="{self.host.url("/missing.png")}"', files["2019/01/05/post-number-1/index.html"].decode("utf-8"))
+        self.assertIn('src="https://example.com/x.png"', page)
+
+    def test_reuse_across_builds(self):
+        self.build()
+        self.assertEqual(self.host.requests, { "/a.png": 1, "/copy-of-a.png": 1, "/c.gif": 1, "/missing.png": 1 })
+        with open(os.path.join(self.data_path, "_images.json")) as fd:
+            self.assertEqual(len(json.load(fd)["images"]), 3)
+
+        # 再次构建时已经下载的图片直接使用本地存储，只重试下载失败的图片
+        first = self.build()
+        self.assertEqual(self.host.requests, { "/a.png": 1, "/copy-of-a.png": 1, "/c.gif": 1, "/missing.png": 2 })
+
+        # 失败的图片修复之后下次构建下载并改写
+        self.host.images["/missing.png"] = ("image/png", make_png(5, 4, b"\x00\x00\xff"))
+        second = self.build()
+        self.assertEqual(self.host.requests["/missing.png"], 3)
+        page = second["2019/01/05/post-number-1/index.html"].decode("utf-8")
+        self.assertIn('width="5" height="4"', page)
+        self.assertNotIn(self.host.url("/missing.png"), page)
+        self.assertEqual(len([ name for name in first if name.startswith("images/") ]) + 1,
+            len([ name for name in second if name.startswith("images/") ]))
+
+    def test_shard_mirrors_own_posts(self):
+        issues, comments = self.data
+        issues[8]["body"] = f"# Post in 2020\n\n![c]({self.host.url('/c.gif')})\n"
+        self.data = (issues, comments)
+
+        # 分片构建只下载当前分片文章中的图片，并且只改写当前分片的文章页面
+        app = make_app(self.data_path, data=self.data, mirror_images=True, mirror_images_hosts="127.0.0.1", shard="2020")
+        app.run()
+        self.assertEqual(self.host.requests, { "/c.gif": 1 })
+        files = read_tree(os.path.join(self.data_path, "output"))
+        self.assertIn(f'src="/{self.output_name(self.gif, ".gif")}"', files["2020/01/01/post-number-9/index.html"].decode("utf-8"))
+        self.assertNotIn("2019/01/05/post-number-1/index.html", files)
+
+    def test_image_size(self):
+        self.assertEqual(image_size(self.png), (".png", 3, 2))
+        self.assertEqual(image_size(self.gif), (".gif", 40, 30))
+        self.assertEqual(image_size(b'<?xml version="1.0"?><svg xmlns="http://www.w3.org/2000/svg"/>'), (".svg", None, None))
+        self.assertEqual(image_size(b"not an image"), (None, None, None))
@@ -0,0 +1,278 @@
+#
+# 常驻进程模式 Webhook 测试，投递 tests/data 中保存的 issues/issue_comment 请求内容
+#
+
+import hashlib
+import hmac
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+import tornado.testing
+import tornado.web
+
+from treehole.server import TreeHoleServer, WebhookHandler
+
+from .fixtures import SECRET, load_payload, make_app, read_tree
+
+
+
+class RecordingWriter:
+    """记录 renderer 写入/删除的页面，其余接口直接转发到原来的 writer
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.written = set()
+        self.removed = set()
+
+    def write(self, filepath: str, filetext: str):
+        self.written.add(os.path.normpath(filepath))
+        self.writer.write(filepath, filetext)
+
+    def remove(self, filepath: str):
+        self.removed.add(os.path.normpath(filepath))
+        self.writer.remove(filepath)
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
+class WebhookTestCase(tornado.testing.AsyncHTTPTestCase):
+    settings = {}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = TreeHoleServer(make_app(self.tmpdir.name, webhook_secret=SECRET, **self.settings))
+        self.server.warm_up()
+        self.output_dir = self.server.settings.get("output_dir")
+        self.writer = RecordingWriter(self.server.renderers["en"].writer)
+        self.server.renderers["en"].writer = self.writer
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        if self.server.store:
+            self.server.store.close()
+        self.tmpdir.cleanup()
+
+    def get_app(self):
+        return tornado.web.Application([
+            (r"/webhook", WebhookHandler, { "server": self.server }),
+        ])
+
+    def sign(self, body: bytes, secret: str = SECRET):
+        return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+    def post_webhook(self, event: str, body: bytes, signature: str = None):
+        headers = { "X-GitHub-Event": event, "Content-Type": "application/json" }
+        if signature is not None:
+            headers["X-Hub-Signature-256"] = signature
+        return self.fetch("/webhook", method="POST", body=body, headers=headers)
+
+    def deliver(self, event: str, name: str):
+        body = load_payload(name)
+        response = self.post_webhook(event, body, self.sign(body))
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def exists(self, filepath: str):
+        return os.path.exists(os.path.join(self.output_dir, filepath))
+
+    def read(self, filepath: str):
+        with open(os.path.join(self.output_dir, filepath), encoding="utf-8") as fd:
+            return fd.read()
+
+
+class WebhookTest(WebhookTestCase):
+
+    def test_bad_signature_rejected(self):
+        body = load_payload("issues_edited.json")
+        for signature in (None, "sha256=0000", self.sign(body, "wrong-secret"), self.sign(body + b" ")):
+            response = self.post_webhook("issues", body, signature)
+            self.assertEqual(response.code, 403)
+        self.assertEqual(self.writer.written, set())
+        self.assertTrue(self.exists("2019/06/01/post-number-5/index.html"))
+        self.assertEqual(self.server.posts[5].get("title"), "Post number 5")
+
+    def test_issue_edited(self):
+        result = self.deliver("issues", "issues_edited.json")
+        self.assertEqual((result["number"], result["rendered"], result["removed"]), (5, 7, 1))
+        # 文章本身、修改前后的相邻文章、所在 daily/monthly/yearly 归档以及首页
+        self.assertEqual(self.writer.written, {
+            "2019/06/01/edited-post-number-five/index.html",
+            "2019/02/20/post-number-4/index.html",
+            "2019/06/15/6/index.html",
+            "2019/06/01/index.html",
+            "2019/06/index.html",
+            "2019/index.html",
+            "index.html",
+        })
+        # 标题修改之后链接随之改变，旧页面删除
+        self.assertEqual(self.writer.removed, { "2019/06/01/post-number-5/index.html" })
+        self.assertFalse(self.exists("2019/06/01/post-number-5/index.html"))
+        self.assertIn("The body was edited.", self.read("2019/06/01/edited-post-number-five/index.html"))
+        self.assertIn("/2019/06/01/edited-post-number-five/", self.read("2019/06/15/6/index.html"))
+
+    def test_issue_closed_removes_post(self):
+        result = self.deliver("issues", "issues_closed.json")
+        self.assertEqual((result["number"], result["rendered"]), (7, 7))
+        # 相邻文章以及相似文章列表中引用了该文章的文章
+        self.assertEqual(self.writer.written, {
+            "2019/06/15/6/index.html",
+            "2019/12/31/post-number-8/index.html",
+            "2020/01/01/post-number-9/index.html",
+            "2020/03/08/post-number-11/index.html",
+            "2020/08/17/post-number-13/index.html",
+            "2019/index.html",
+            "index.html",
+        })
+        # 该日期/月份只有此文章，对应的归档页面同时删除
+        self.assertEqual(self.writer.removed, {
+            "2019/11/30/post-number-7/index.html",
+            "2019/11/30/index.html",
+            "2019/11/index.html",
+        })
+        for filepath in self.writer.removed:
+            self.assertFalse(self.exists(filepath))
+        self.assertNotIn(7, self.server.posts)
+        self.assertNotIn("/2019/11/30/post-number-7/", self.read("2019/12/31/post-number-8/index.html"))
+
+    def test_pull_request_removes_post(self):
+        result = self.deliver("issues", "issues_edited_pull_request.json")
+        self.assertEqual((result["number"], result["rendered"], result["removed"]), (4, 6, 1))
+        self.assertEqual(self.writer.written, {
+            "2019/02/20/post-number-3/index.html",
+            "2019/06/01/post-number-5/index.html",
+            "2019/02/20/index.html",
+            "2019/02/index.html",
+            "2019/index.html",
+            "index.html",
+        })
+        self.assertEqual(self.writer.removed, { "2019/02/20/post-number-4/index.html" })
+        self.assertFalse(self.exists("2019/02/20/post-number-4/index.html"))
+        # 同一天还有其他文章，daily 归档页面保留
+        self.assertTrue(self.exists("2019/02/20/index.html"))
+        self.assertNotIn(4, self.server.posts)
+
+    def test_comment_created(self):
+        result = self.deliver("issue_comment", "issue_comment_created.json")
+        self.assertEqual((result["number"], result["rendered"], result["removed"]), (2, 1, 0))
+        self.assertEqual(self.writer.written, { "2019/02/11/post-number-2/index.html" })
+        self.assertEqual(self.writer.removed, set())
+        self.assertIn("<strong>markdown</strong>", self.read("2019/02/11/post-number-2/index.html"))
+        self.assertEqual(len(self.server.comments[2]), 4)
+
+    def test_comment_deleted(self):
+        self.assertIn("Comment 901 on post 9", self.read("2020/01/01/post-number-9/index.html"))
+        result = self.deliver("issue_comment", "issue_comment_deleted.json")
+        self.assertEqual((result["number"], result["rendered"], result["removed"]), (9, 1, 0))
+        self.assertEqual(self.writer.written, { "2020/01/01/post-number-9/index.html" })
+        self.assertNotIn("Comment 901 on post 9", self.read("2020/01/01/post-number-9/index.html"))
+        self.assertIn("Comment 902 on post 9", self.read("2020/01/01/post-number-9/index.html"))
+
+    def comment_payload(self, name: str, number: int, comment_id: int):
+        payload = json.loads(load_payload(name))
+        payload["issue"]["number"] = number
+        payload["comment"]["id"] = comment_id
+        payload["comment"]["issue_url"] = payload["comment"]["issue_url"].rsplit("/", 1)[0] + f"/{number}"
+        return json.dumps(payload).encode("utf-8")
+
+    def stored_comments(self, number: int):
+        rows = self.server.store.conn.execute("SELECT id FROM comments WHERE issue_number = ?", (number,))
+        return [ row["id"] for row in rows ]
+
+    def test_comment_on_hidden_issue_ignored(self):
+        # pull request/已关闭/其他用户 issue 中的评论不渲染，也不写入本地缓存以及内存
+        for number in (15, 16, 17):
+            body = self.comment_payload("issue_comment_created.json", number, number * 100 + 9)
+            response = self.post_webhook("issue_comment", body, self.sign(body))
+            self.assertEqual(response.code, 200)
+            result = json.loads(response.body)
+            self.assertEqual((result["number"], result["rendered"], result["removed"]), (number, 0, 0))
+            self.assertNotIn(number * 100 + 9, self.stored_comments(number))
+            self.assertNotIn(number * 100 + 9, self.server.comments.get(number, {}))
+        self.assertEqual(self.writer.written, set())
+
+        # 删除事件仍然删除本地缓存中已经存在的评论
+        self.assertEqual(self.stored_comments(15), [1501])
+        body = self.comment_payload("issue_comment_deleted.json", 15, 1501)
+        response = self.post_webhook("issue_comment", body, self.sign(body))
+        self.assertEqual(json.loads(response.body)["rendered"], 0)
+        self.assertEqual(self.stored_comments(15), [])
+
+    def test_other_repository_ignored(self):
+        payload = json.loads(load_payload("issues_closed.json"))
+        payload["repository"]["full_name"] = "someone/else"
+        body = json.dumps(payload).encode("utf-8")
+        response = self.post_webhook("issues", body, self.sign(body))
+        self.assertEqual(response.code, 200)
+        self.assertTrue(json.loads(response.body).get("ignored"))
+        self.assertEqual(self.writer.written, set())
+        self.assertTrue(self.exists("2019/11/30/post-number-7/index.html"))
+
+    def test_changes_written_back_to_store(self):
+        self.deliver("issues", "issues_closed.json")
+        self.deliver("issue_comment", "issue_comment_created.json")
+        self.server.store.close()
+
+        # 重启之后使用同一份本地缓存完整构建，结果与 Webhook 修改一致
+        self.server.store = None
+        posts, comments = make_app(self.tmpdir.name, data=([], [])).run()
+        self.assertNotIn(7, [ post.id for post in posts ])
+        self.assertIn(204, [ comment.id for comment in comments ])
+
+
+class WebhookApiTest(WebhookTestCase):
+    """开启 json_api 时 Webhook 只更新受影响的 JSON 文件，结果与完整构建一致
+    """
+    settings = { "json_api": True }
+
+    def setUp(self):
+        super().setUp()
+        self.api_writer = RecordingWriter(self.server.app.writer)
+        self.server.app.writer = self.api_writer
+
+    def full_build(self):
+        """使用 Webhook 写回之后的本地缓存完整构建到另一个 data_path，返回全部 JSON 文件
+        """
+        self.server.store.close()
+        self.server.store = None
+        data_path = os.path.join(self.tmpdir.name, "full")
+        os.makedirs(data_path)
+        shutil.copy(os.path.join(self.tmpdir.name, "_treehole.sqlite3"), data_path)
+        make_app(data_path, data=([], []), **self.settings).run()
+        return read_tree(os.path.join(data_path, "output", "api"))
+
+    def test_api_matches_full_build(self):
+        for event, name, written, removed in (
+            ("issues", "issues_edited.json", {
+                "api/post/5.json", "api/posts/1.json",
+                "api/archive/2019/06/01/1.json", "api/archive/2019/06/1.json", "api/archive/2019/1.json",
+            }, set()),
+            # 该日期/月份只有此文章，对应的归档分页同时删除，首页 index.json 中的年份统计随之更新
+            ("issues", "issues_closed.json", {
+                "api/index.json", "api/posts/1.json", "api/archive/2019/1.json",
+            }, { "api/post/7.json", "api/archive/2019/11/30/1.json", "api/archive/2019/11/1.json" }),
+            # 评论只影响文章本身以及列表中的评论数量
+            ("issue_comment", "issue_comment_created.json", {
+                "api/post/2.json", "api/posts/1.json",
+                "api/archive/2019/02/11/1.json", "api/archive/2019/02/1.json", "api/archive/2019/1.json",
+            }, set()),
+            ("issue_comment", "issue_comment_deleted.json", {
+                "api/post/9.json", "api/posts/1.json",
+                "api/archive/2020/01/01/1.json", "api/archive/2020/01/1.json", "api/archive/2020/1.json",
+            }, set()),
+        ):
+            self.api_writer.written.clear()
+            self.api_writer.removed.clear()
+            self.deliver(event, name)
+            self.assertEqual({ filepath for filepath in self.api_writer.written if filepath.startswith("api/") }, written, name)
+            self.assertEqual(self.api_writer.removed, removed, name)
+        self.assertSameApi(read_tree(os.path.join(self.output_dir, "api")), self.full_build())
+
+    def assertSameApi(self, first: dict, second: dict):
+        self.assertEqual(sorted(first), sorted(second))
+        for filepath in first:
+            self.assertEqual(json.loads(first[filepath]), json.loads(second[filepath]), f"{filepath} differ")
@@ -0,0 +1,79 @@
+#
+# 完整构建测试，比较不同构建方式的输出结果
+#
+
+import os
+import os.path
+import tempfile
+import unittest
+import unittest.mock
+
+from .fixtures import make_app, read_tree
+
+
+
+class BuildTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # 注意：feedmap 更新时间默认为当前时间，此处固定为 SOURCE_DATE_EPOCH 保证多次构建的输出逐字节一致
+        patcher = unittest.mock.patch.dict(os.environ, { "SOURCE_DATE_EPOCH": "1609459200" })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+
+    def build(self, name: str, **settings):
+        """使用相同的测试数据构建到 tmpdir/name，返回全部输出文件
+        """
+        data_path = os.path.join(self.tmpdir, name)
+        make_app(data_path, **settings).run()
+        return read_tree(os.path.join(data_path, "output"))
+
+    def assertSameFiles(self, first: dict, second: dict):
+        self.assertEqual(sorted(first), sorted(second))
+        for filepath in first:
+            self.assertEqual(first[filepath], second[filepath], f"{filepath} differ")
+
+
+class RenderWorkersTest(BuildTestCase):
+
+    def test_workers_output_identical(self):
+        settings = { "locales": "zh_CN", "comments_per_page": 2 }
+        serial = self.build("serial", render_workers=1, **settings)
+        parallel = self.build("parallel", render_workers=2, **settings)
+
+        self.assertIn("2019/02/11/post-number-2/index.html", serial)
+        self.assertIn("zh_CN/2019/02/11/post-number-2/index.html", serial)
+        self.assertSameFiles(serial, parallel)
+
+    def test_workers_artifact_identical(self):
+        # 注意：写入压缩包时 worker 不直接写文件，渲染结果按任务顺序返回主进程写入
+        for render_workers in (1, 2):
+            self.build(f"artifact-{render_workers}", render_workers=render_workers,
+                output_artifact=os.path.join(self.tmpdir, f"site-{render_workers}.tar.gz"))
+
+        with open(os.path.join(self.tmpdir, "site-1.tar.gz"), "rb") as fd:
+            serial = fd.read()
+        with open(os.path.join(self.tmpdir, "site-2.tar.gz"), "rb") as fd:
+            parallel = fd.read()
+        self.assertEqual(serial, parallel)
+
+
+class ShardsTest(BuildTestCase):
+
+    def test_merged_shards_identical(self):
+        settings = { "locales": "zh_CN", "comments_per_page": 2, "search": True, "json_api": True }
+        full = self.build("full", **settings)
+
+        shard_dirs = []
+        for shard, other in (("2019", "2020"), ("2020", "2019")):
+            files = self.build(f"shard-{shard}", shard=shard, **settings)
+            # 注意：分片只输出该年份的文章页面以及归档页面，首页/feedmap 等由合并构建输出
+            self.assertIn(f"{shard}/index.html", files)
+            self.assertNotIn(f"{other}/index.html", files)
+            self.assertNotIn("index.html", files)
+            shard_dirs.append(os.path.join(self.tmpdir, f"shard-{shard}", "output"))
+
+        merged = self.build("merged", merge_shards=",".join(shard_dirs), **settings)
+        self.assertSameFiles(full, merged)
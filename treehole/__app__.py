@@ -1,5 +1,6 @@
 import logging
 import os.path
+import sys
 
 import tornado.log
 import tornado.options
@@ -7,12 +8,14 @@ import tornado.options
 from tornado.options import define, options
 
 from .treehole import TreeHoleApp
+from .server import TreeHoleServer, TreeHolePreview
 
 
 
 define("debug", type=bool, default=True, help="debug flag for treehole")
 define("config", type=str, help="local config file path")
 define("default_locale", type=str, default="en", help="default locale for i18n")
+define("locales", type=str, help="comma separated locales to build, others than default_locale are built under /<locale>/")
 define("locale_domain", type=str, default="treehole", help="default domain for i18n")
 define("base_url", type=str, default="https://treehole.io", help="base url for the website, include http[s]://")
 define("site_title", type=str, default="Treehole", help="the title for the website")
@@ -20,8 +23,38 @@ define("site_desc", type=str, default="Microblog platform based Github issues",
 define("data_path", type=str, default="./data", help="data path for building the website")
 define("github_owner", type=str, help="github owner")
 define("github_repo", type=str, help="github repo")
-define("github_token", type=str, help="github api access_token")
-define("preview", type=bool, default=False, help="run preview server after building")
+define("github_repos", type=str, help="comma separated owner/repo list to aggregate into one site, overrides github_owner/github_repo")
+define("github_token", type=str, help="github api access_token, comma separated tokens are used as a rate-limit aware token pool")
+define("render_workers", type=int, default=1, help="processes for rendering pages, 1 renders serially")
+define("shard", type=str, help="build only the posts and archives of a year range, e.g. 2019 or 2019-2021")
+define("merge_shards", type=str, help="comma separated shard output dirs to merge with the global pages")
+define("comments_per_page", type=int, default=0, help="comments per lazily loaded comments page, 0 renders all comments into post pages")
+define("search", type=bool, default=False, help="build the client-side search index")
+define("hash_assets", type=bool, default=False, help="minify css/js and write content-hashed filenames for long-term caching")
+define("headers_file", type=bool, default=False, help="write _headers with immutable caching for hashed assets (Netlify/Cloudflare Pages)")
+define("mirror_images", type=bool, default=False, help="download github hosted post images and serve them from /images/")
+define("mirror_images_hosts", type=str, help="comma separated image hosts to mirror, defaults to github user content hosts")
+define("counters", type=bool, default=False, help="write reaction/comment counts to counters.json hydrated by app.js instead of rendering them into pages")
+define("offline", type=bool, default=False, help="write a service worker precaching hashed assets and recent posts for offline reading")
+define("json_api", type=bool, default=False, help="write static paginated json endpoints under /api/ alongside html pages")
+define("json_api_per_page", type=int, default=20, help="posts per page for json api listings")
+define("minify_html", type=bool, default=False, help="minify rendered html pages, keeping pre/code/math content untouched")
+define("backup_archive", type=bool, default=False, help="also append changed posts/comments to a single gzip json lines archive backup_dir/treehole.jsonl.gz")
+define("output_artifact", type=str, help="stream the built site into a .tar/.tar.gz/.tgz/.zip file instead of writing output_dir")
+define("output_generations", type=int, default=0, help="build into a new generation dir and atomically swap the output_dir symlink, keeping this many generations, 0 writes output_dir in place")
+define("publish", type=bool, default=False, help="sync output_dir to an S3 compatible bucket after building")
+define("s3_endpoint", type=str, help="S3 compatible endpoint for publish, e.g. https://s3.us-east-1.amazonaws.com")
+define("s3_bucket", type=str, help="bucket for publish")
+define("s3_prefix", type=str, default="", help="key prefix inside the bucket for publish")
+define("s3_region", type=str, default="us-east-1", help="region used for signing publish requests")
+define("s3_access_key", type=str, help="access key for publish, defaults to AWS_ACCESS_KEY_ID")
+define("s3_secret_key", type=str, help="secret key for publish, defaults to AWS_SECRET_ACCESS_KEY")
+define("publish_concurrency", type=int, default=8, help="concurrent uploads for publish")
+define("persist_cache", type=bool, default=False, help="keep the sqlite cache updated in non-debug builds so it can be exported with export-cache")
+define("cache_bundle", type=str, help="cache bundle path for export-cache/import-cache, e.g. ./treehole-cache.tar.gz")
+define("preview", type=bool, default=False, help="run in-memory preview server instead of building to output_dir")
+define("port", type=int, default=8080, help="port for preview/serve server")
+define("webhook_secret", type=str, help="github webhook secret for serve mode")
 
 
 
@@ -31,7 +64,14 @@ logger = logging.getLogger("treehole")
 
 
 def main():
-    tornado.options.parse_command_line()
+    # 注意：tornado.options 遇到第一个非选项参数就停止解析，此处继续解析子命令之后的选项
+    # 注意：目前只支持 `serve`/`counters`/`publish`/`export-cache`/`import-cache` 子命令，未指定子命令时执行一次完整构建
+    args = tornado.options.parse_command_line()
+    command = args[0] if args else None
+    if command is not None:
+        if command not in ("serve", "counters", "publish", "export-cache", "import-cache"):
+            raise SystemExit(f"unknown command: {command}")
+        tornado.options.parse_command_line([sys.argv[0]] + args[1:])
 
     # loaded default_settings.py
     if options.config:
@@ -56,8 +96,37 @@ def main():
     # logger.info(f'support locales={tornado.locale.get_supported_locales()}, default_locale={options.default_locale}')
 
     app = TreeHoleApp(**options.as_dict())
-    app.run()
 
-    # 构建完成是否启用 Preview 预览服务器，方便直接预览整个网站实现
+    # 只刷新 counters.json 中的 reactions/评论数量，不重新渲染页面
+    if command == "counters":
+        app.run_counters()
+        return
+
+    # 只同步已经构建好的 output_dir 到对象存储，不重新构建
+    if command == "publish":
+        app.publish()
+        return
+
+    # 导出/恢复 data_path 中的构建缓存，用于 CI 等临时环境之间保存缓存
+    if command in ("export-cache", "import-cache"):
+        if not options.cache_bundle:
+            raise SystemExit(f"cache_bundle is required for {command}")
+        if command == "export-cache":
+            app.export_cache(options.cache_bundle)
+        else:
+            app.import_cache(options.cache_bundle)
+        return
+
+    # 常驻进程模式，完整构建之后接收 Github Webhook 增量渲染
+    if command == "serve":
+        TreeHoleServer(app).serve(port=options.port)
+        return
+
+    # 内存预览服务器，全部页面只渲染到内存中，修改模板/缓存数据之后自动重新渲染
     if options.preview:
-        app.preview()
+        TreeHolePreview(app).serve(port=options.port)
+        return
+
+    app.run()
+    if options.publish:
+        app.publish()
@@ -0,0 +1,2 @@
+version = __version__ = "0.0.0"
+version_tuple = __version_tuple__ = (0, 0, 0)
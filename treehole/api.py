@@ -0,0 +1,224 @@
+#
+# 静态 JSON API，与 HTML 页面一起输出，供其他前端/移动端小部件直接读取，无需请求 Github API
+#
+
+import collections
+import hashlib
+import json
+import logging
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+class StaticApi:
+    """输出 `api/` 目录下的静态 JSON 接口，全部数据与 HTML 页面使用的归档数据一致
+
+    - `api/index.json` 接口目录，包含文章总数、分页参数以及全部年份归档的链接
+    - `api/posts/<n>.json` 全部文章按最新排序的分页列表
+    - `api/post/<post.id>.json` 单一文章，包含 body_html/labels/reactions/评论数量
+    - `api/archive/<yyyy>/<n>.json`、`api/archive/<yyyy>/<mm>/<n>.json`、`api/archive/<yyyy>/<mm>/<dd>/<n>.json`
+        按年/月/日归档的分页列表，文章顺序与对应的 yearly/monthly/daily 归档页面一致
+    - 注意：每个文件生成之后直接写入 writer，不在内存中保留全部文件内容
+    - 注意：按文件内容 hash 记录上一次输出的结果，内容没有变化的文件不再重新写入，
+        常驻进程/预览模式中每次更新只重新写入发生变化的文件，并删除已经不存在的文件
+    - 注意：常驻进程模式中单一文章/评论变化时使用 update() 只重新生成受影响的文件，不再重新生成全部归档
+    - 注意：version 为接口格式版本，格式修改时需要同步修改此版本号
+    """
+    version = 1
+    prefix = "api"
+
+    def __init__(self, base_url: str, per_page: int = 20):
+        self.base_url = (base_url or "").rstrip("/")
+        self.per_page = max(1, per_page)
+        self.digests = {} # filepath → 上一次输出内容的 sha256
+        self.total = None # 上一次输出的文章总数
+
+    def url(self, path: str):
+        return f"/{self.prefix}/{path}"
+
+    def put(self, writer, filepath: str, data: dict):
+        """写入单一接口文件，内容与上一次输出一致时跳过，返回是否写入
+        """
+        filetext = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        digest = hashlib.sha256(filetext.encode("utf-8")).hexdigest()
+        if self.digests.get(filepath) == digest:
+            return False
+        writer.write(filepath, filetext)
+        self.digests[filepath] = digest
+        return True
+
+    def drop(self, writer, filepaths: list[str]):
+        """删除已经不存在的接口文件，返回删除文件数
+        """
+        for filepath in filepaths:
+            writer.remove(filepath)
+            self.digests.pop(filepath, None)
+        return len(filepaths)
+
+    def write(self, writer, posts: list, comments: list, archives: dict):
+        """输出全部接口文件，只写入内容发生变化的文件，返回 (写入文件数, 未变化文件数, 删除文件数)
+
+        - 注意：archives 为 yearly/monthly/daily 归档，与 HTML 页面使用同一份归档数据
+        """
+        comments_count = collections.Counter( comment.get("post_id") for comment in comments )
+
+        filepaths = set()
+        written = 0
+        for filepath, data in self.iter_files(posts, comments_count, archives):
+            filepaths.add(filepath)
+            written += self.put(writer, filepath, data)
+        removed = self.drop(writer, [ filepath for filepath in self.digests if filepath not in filepaths ])
+
+        self.total = len(posts)
+        logger.info(f'json api, files={len(filepaths)}, written={written}, unchanged={len(filepaths) - written}, removed={removed}')
+        return (written, len(filepaths) - written, removed)
+
+    def update(self, writer, posts: list, comments_count: dict, post_ids: list[int], positions: list[int], archives: list[tuple]):
+        """常驻进程模式中只重新输出受单一文章/评论变化影响的接口文件，返回 (写入文件数, 未变化文件数, 删除文件数)
+
+        - 注意：posts 为全部文章并且已经按最新排序，comments_count 为 post.id → 评论数量
+        - 注意：post_ids 为内容发生变化的文章，已经不在 posts 中的文章删除对应的 `post/<id>.json`
+        - 注意：positions 为变化文章修改前后在 posts 中的位置，文章总数不变时只重新输出覆盖这些位置的 `posts/` 分页，
+            文章总数变化时全部分页的 total/pages 均发生变化，重新输出全部 `posts/` 分页
+        - 注意：archives 为受影响的 (归档路径, 归档文章列表)，比如 `("2019/03/02", [...])`，归档中没有文章时删除该归档的全部分页
+        - 注意：接口文件中只包含文章本身的数据，不包含前后相邻文章，此处无需像页面一样重新输出相邻文章
+        """
+        files = [ self.index_file(posts) ]
+
+        pages = self.pages(len(posts))
+        if self.total != len(posts) or not positions:
+            first, last = 1, pages
+        else:
+            first = min(positions) // self.per_page + 1
+            last = min(max(positions) // self.per_page + 1, pages)
+        files.extend(self.iter_pages("posts", posts, comments_count, first, last))
+        stale = self.stale_pages("posts", pages)
+
+        ids = set(post_ids)
+        current = { post.id: post for post in posts if post.id in ids }
+        for post_id in post_ids:
+            if post_id in current:
+                files.append(self.post_file(current[post_id], comments_count))
+            elif f"./{self.prefix}/post/{post_id}.json" in self.digests:
+                stale.append(f"./{self.prefix}/post/{post_id}.json")
+
+        for path, archive_posts in archives:
+            if archive_posts:
+                files.extend(self.iter_pages(f"archive/{path}", archive_posts, comments_count))
+            stale.extend(self.stale_pages(f"archive/{path}", self.pages(len(archive_posts)) if archive_posts else 0))
+
+        written = 0
+        for filepath, data in files:
+            written += self.put(writer, filepath, data)
+        removed = self.drop(writer, stale)
+
+        self.total = len(posts)
+        logger.info(f'json api update, files={len(files)}, written={written}, unchanged={len(files) - written}, removed={removed}')
+        return (written, len(files) - written, removed)
+
+    def stale_pages(self, path: str, pages: int):
+        """返回 path 下上一次输出但是已经超出 pages 的分页文件，分页总是从 1 开始连续输出
+        """
+        stale = []
+        page = pages + 1
+        while f"./{self.prefix}/{path}/{page}.json" in self.digests:
+            stale.append(f"./{self.prefix}/{path}/{page}.json")
+            page += 1
+        return stale
+
+    def iter_files(self, posts: list, comments_count: collections.Counter, archives: dict):
+        """逐个返回 (filepath, data)，文件按顺序生成，调用者写入之后即可释放
+        """
+        posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
+
+        yield self.index_file(posts)
+
+        yield from self.iter_pages("posts", posts, comments_count)
+
+        for post in posts:
+            yield self.post_file(post, comments_count)
+
+        for archive in ("yearly", "monthly", "daily"):
+            for page in archives.get(archive) or []:
+                yield from self.iter_pages(f"archive/{self.archive_path(page['filepath'])}", self.archive_posts(page), comments_count)
+
+    def index_file(self, posts: list):
+        """接口目录，年份归档按最新排序，与 yearly 归档页面一致
+        """
+        years = collections.Counter( post.datetime.year for post in posts )
+        return (f"./{self.prefix}/index.json", {
+            "version": self.version,
+            "total": len(posts),
+            "per_page": self.per_page,
+            "pages": self.pages(len(posts)),
+            "posts": self.url("posts/1.json"),
+            "years": [
+                { "year": year, "count": years[year], "url": self.url(f"archive/{year}/1.json") }
+                for year in sorted(years, reverse=True)
+            ],
+        })
+
+    def post_file(self, post, comments_count: collections.Counter):
+        return (f"./{self.prefix}/post/{post.id}.json", {
+            "version": self.version,
+            **self.post_item(post, comments_count),
+            "body_html": post.get("body_html"),
+        })
+
+    def iter_pages(self, path: str, posts: list, comments_count: collections.Counter, first: int = 1, last: int = None):
+        """按 per_page 分页返回文章列表，没有文章时同样输出空的第一页，first/last 指定只返回其中部分分页
+        """
+        pages = self.pages(len(posts))
+        for page in range(first, min(last or pages, pages) + 1):
+            items = posts[(page - 1) * self.per_page: page * self.per_page]
+            yield (f"./{self.prefix}/{path}/{page}.json", {
+                "version": self.version,
+                "page": page,
+                "pages": pages,
+                "per_page": self.per_page,
+                "total": len(posts),
+                "prev": self.url(f"{path}/{page - 1}.json") if page > 1 else None,
+                "next": self.url(f"{path}/{page + 1}.json") if page < pages else None,
+                "items": [ self.post_item(post, comments_count) for post in items ],
+            })
+
+    def pages(self, total: int):
+        return max(1, (total + self.per_page - 1) // self.per_page)
+
+    def archive_path(self, filepath: str):
+        """归档页面 `./2019/03/02/index.html` 对应的接口路径 `2019/03/02`
+        """
+        return filepath.removeprefix("./").removesuffix("/index.html")
+
+    def archive_posts(self, page: dict):
+        """归档页面中的全部文章，跳过 monthly/yearly 页面中按日/按月的导航链接
+        """
+        return [ post for post in page["template_vars"]["posts"] if not isinstance(post, dict) ]
+
+    def post_item(self, post, comments_count: collections.Counter):
+        user = post.get("user")
+        reactions = post.get("reactions")
+        return {
+            "id": post.id,
+            "repo": post.get("repo"),
+            "title": post.get("title"),
+            "slug": post.get("slug"),
+            "summary": post.get("summary"),
+            "image": post.get("image"),
+            "created_at": post.get("created_at"),
+            "updated_at": post.get("updated_at"),
+            "permanent_url": post.get("permanent_url"),
+            "html_url": f'{self.base_url}{post.get("permanent_url")}',
+            "api_url": self.url(f"post/{post.id}.json"),
+            "source_url": post.get("source_url"),
+            "labels": [
+                { "name": label.get("name"), "color": label.get("color"), "description": label.get("description") }
+                for label in post.get("labels") or ()
+            ],
+            "reactions": { reaction: reactions.get(reaction) or 0 for reaction in reactions.keys() } if reactions else {},
+            "user": { "login": user.get("login"), "avatar_url": user.get("avatar_url"), "user_url": user.get("user_url") } if user else None,
+            "comments": comments_count.get(post.id, 0),
+        }
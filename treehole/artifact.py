@@ -0,0 +1,117 @@
+#
+# 构建结果直接写入 tar/zip 压缩包，不生成中间的 output_dir 文件目录
+#
+
+import gzip
+import io
+import logging
+import os
+import os.path
+import tarfile
+import time
+import zipfile
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+# 注意：zip 格式无法表示 1980-01-01 之前的时间，未设置 SOURCE_DATE_EPOCH 时默认使用此时间
+DEFAULT_MTIME = 315532800
+
+
+def artifact_mtime():
+    """返回压缩包中全部文件使用的修改时间，兼容 reproducible-builds 的 SOURCE_DATE_EPOCH 环境变量
+    """
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    return max(int(epoch), DEFAULT_MTIME) if epoch and epoch.isdigit() else DEFAULT_MTIME
+
+
+class ArtifactWriter:
+    """将渲染结果按写入顺序直接追加到 tar/tar.gz/zip 压缩包中，与 FileWriter 使用相同的 write/copy 接口
+
+    - 注意：压缩包格式按文件扩展名判断，支持 `.tar`/`.tar.gz`/`.tgz`/`.zip`
+    - 注意：全部文件使用相同的修改时间、权限和属主，相同输入多次构建得到的压缩包逐字节一致
+    - 注意：先写入 `<path>.tmp` 临时文件，close() 之后再重命名，构建失败时不会覆盖上一次的压缩包
+    - 注意：压缩包只能追加不能修改，同一 filepath 重复写入时只保留第一次写入的内容
+    - 注意：没有 remove() 接口，需要删除旧文件的常驻进程/预览模式均在启动时直接拒绝 output_artifact
+    """
+    file_mode = 0o644
+    compresslevel = 6
+
+    def __init__(self, path: str, mtime: int = None):
+        self.path = path
+        self.mtime = mtime if mtime is not None else artifact_mtime()
+        self.names = set()
+        self.bytes = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.tmp_path = f"{path}.tmp"
+        self.fileobj = open(self.tmp_path, "wb")
+        self.gzip = None
+        self.tar = None
+        self.zip = None
+
+        name = path.lower()
+        if name.endswith(".zip"):
+            self.zip = zipfile.ZipFile(self.fileobj, "w", zipfile.ZIP_DEFLATED, compresslevel=self.compresslevel)
+        elif name.endswith((".tar.gz", ".tgz")):
+            # 注意：gzip 头部默认包含当前时间和文件名，此处必须固定
+            self.gzip = gzip.GzipFile(filename="", mode="wb", fileobj=self.fileobj, compresslevel=self.compresslevel, mtime=self.mtime)
+            self.tar = tarfile.open(fileobj=self.gzip, mode="w|", format=tarfile.PAX_FORMAT)
+        elif name.endswith(".tar"):
+            self.tar = tarfile.open(fileobj=self.fileobj, mode="w|", format=tarfile.PAX_FORMAT)
+        else:
+            self.fileobj.close()
+            os.remove(self.tmp_path)
+            raise ValueError(f'unsupported artifact format: {path}, use .tar/.tar.gz/.tgz/.zip')
+
+    def key(self, filepath: str):
+        return os.path.normpath(filepath).replace(os.sep, "/").lstrip("/")
+
+    def add(self, filepath: str, data: bytes):
+        name = self.key(filepath)
+        if name in self.names:
+            logger.warning(f'artifact duplicated file ignored: {name}')
+            return
+        self.names.add(name)
+        self.bytes += len(data)
+
+        if self.zip is not None:
+            info = zipfile.ZipInfo(name, time.gmtime(self.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 3
+            info.external_attr = (0o100000 | self.file_mode) << 16
+            self.zip.writestr(info, data, compresslevel=self.compresslevel)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.mtime
+            info.mode = self.file_mode
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, filepath: str, filetext: str):
+        self.add(filepath, filetext.encode("utf-8"))
+
+    def copy(self, src_path: str, filepath: str, link: bool = False):
+        with open(src_path, "rb") as fd:
+            self.add(filepath, fd.read())
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+        if self.tar is not None:
+            self.tar.close()
+        if self.gzip is not None:
+            self.gzip.close()
+        self.fileobj.close()
+        os.replace(self.tmp_path, self.path)
+        logger.info(f'artifact written, path={self.path}, files={len(self.names)}, bytes={self.bytes}, size={os.path.getsize(self.path)}')
+
+    def abort(self):
+        self.fileobj.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
@@ -0,0 +1,286 @@
+#
+# 静态文件处理，压缩 CSS/JS/HTML 并输出带内容 hash 的文件名，方便浏览器长期缓存
+#
+
+import hashlib
+import logging
+import os
+import os.path
+import re
+
+from .utils import fread, load_json_cache, save_json_cache
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+CSS_TOKEN_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+CSS_SPACE_RE = re.compile(r"\s+")
+CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(text: str):
+    """压缩 CSS 文本，删除注释和多余的空白
+
+    - 注意：保留 `/*! ... */` 形式的版权注释，字符串内容原样保留
+    - 注意：只删除 `{};,>` 两侧以及 `:` 之后的空白，`:` 之前的空白在选择器中有意义（比如 `a :hover`）不能删除
+    """
+    parts = []
+    code = []
+
+    def flush():
+        part = CSS_SPACE_RE.sub(" ", "".join(code))
+        part = CSS_PUNCT_RE.sub(r"\1", part)
+        part = part.replace(": ", ":").replace(";}", "}")
+        if not parts or parts[-1].endswith("\n"):
+            part = part.lstrip()
+        parts.append(part)
+        code.clear()
+
+    for i, part in enumerate(CSS_TOKEN_RE.split(text)):
+        if i % 2 == 0:
+            code.append(part)
+        elif part.startswith("/*!"):
+            flush()
+            parts.append(f"{part}\n")
+        elif part.startswith("/*"):
+            # 注意：注释等同于空白，删除之后仍然需要分隔前后的内容
+            code.append(" ")
+        else:
+            flush()
+            parts.append(part)
+    flush()
+    return "".join(parts).strip() + "\n"
+
+
+JS_REGEX_PREFIX = set("(,=:[!&|?{};+-*%<>~^")
+JS_REGEX_KEYWORDS = { "return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "yield", "await" }
+JS_WORD_RE = re.compile(r"[\w$]+$")
+
+
+def minify_js(text: str):
+    """保守压缩 JS 文本，只删除注释、缩进、行尾空白和空行
+
+    - 注意：app.js 不使用分号而依赖自动分号插入（ASI），此处必须保留全部换行，也不删除运算符两侧的空白
+    - 注意：字符串/模板字符串/正则表达式内容原样保留，保留 `/*! ... */` 形式的版权注释
+    """
+    out = []
+    i, n = 0, len(text)
+    line_start = True
+
+    def last_token():
+        for k in range(len(out) - 1, -1, -1):
+            if not out[k].isspace():
+                return out[k]
+        return ""
+
+    def regex_allowed():
+        token = last_token()
+        if not token:
+            return True
+        if token[-1] in JS_REGEX_PREFIX:
+            return True
+        word = JS_WORD_RE.search(token)
+        return bool(word) and word.group() in JS_REGEX_KEYWORDS
+
+    while i < n:
+        c = text[i]
+        if c in "'\"`":
+            # 字符串/模板字符串
+            j = i + 1
+            while j < n and text[j] != c:
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+            line_start = False
+        elif text.startswith("//", i):
+            # 单行注释，保留换行
+            j = text.find("\n", i)
+            i = n if j < 0 else j
+        elif text.startswith("/*", i):
+            j = text.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            if text.startswith("/*!", i):
+                out.append(text[i:j])
+                line_start = False
+            elif "\n" in text[i:j] and not line_start:
+                # 注意：跨行注释等同于换行，此处必须保留换行以免影响 ASI
+                out.append("\n")
+                line_start = True
+            i = j
+        elif c == "/" and regex_allowed():
+            # 正则表达式，注意 `[...]` 字符集合中的 `/` 不是结束符
+            j = i + 1
+            in_class = False
+            while j < n and (in_class or text[j] != "/") and text[j] != "\n":
+                if text[j] == "\\":
+                    j += 1
+                elif text[j] == "[":
+                    in_class = True
+                elif text[j] == "]":
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and (text[j].isalnum()):
+                j += 1
+            out.append(text[i:j])
+            i = j
+            line_start = False
+        elif c == "\n":
+            while out and out[-1] == " ":
+                out.pop()
+            if out and not line_start:
+                out.append("\n")
+            line_start = True
+            i += 1
+        elif c.isspace():
+            j = i
+            while j < n and text[j].isspace() and text[j] != "\n":
+                j += 1
+            if not line_start:
+                out.append(" ")
+            i = j
+        else:
+            j = i
+            while j < n and text[j] not in "'\"`/\n" and not text[j].isspace():
+                j += 1
+            out.append(text[i:j] if j > i else c)
+            i = max(j, i + 1)
+            line_start = False
+
+    return "".join(out).strip() + "\n"
+
+
+# 注意：以下内容原样保留，math 为 mistune math 插件输出的 TeX 公式，属性值中的连续空白同样不能合并
+HTML_PRESERVE_RE = re.compile(
+    r'(<(pre|code|textarea|script|style)\b.*?</\2\s*>'
+    r'|<(span|div) class="math">.*?</\3>'
+    r'|<!--.*?-->'
+    r'|="[^"]*")',
+    re.S | re.I
+)
+HTML_BLOCK_TAGS = (
+    "html|head|body|meta|link|title|header|footer|main|nav|aside|article|section|div|p|h[1-6]"
+    "|ul|ol|li|menu|dl|dt|dd|table|thead|tbody|tr|th|td|blockquote|figure|figcaption|hr|details|summary"
+)
+HTML_BLOCK_START_RE = re.compile(rf"</?(?:{HTML_BLOCK_TAGS})\b")
+HTML_BLOCK_END_RE = re.compile(rf"</?(?:{HTML_BLOCK_TAGS})\b[^<]*>$")
+HTML_SPACE_RE = re.compile(r"[ \t\r\f\v]{2,}|[\t\r\f\v]")
+HTML_SCRIPT_TYPE_RE = re.compile(r'^<script type="text/javascript"', re.I)
+HTML_PLACEHOLDER_RE = re.compile(r"\x00(\d+)\x00")
+
+
+def minify_html(text: str):
+    """压缩 HTML 文本，渲染之后写入之前执行，只使用按行处理和少量线性的正则替换以免拖慢构建
+
+    - 注意：`<pre>/<code>/<textarea>/<script>/<style>`、math 公式以及属性值内容原样保留
+    - 注意：删除全部 HTML 注释（`<!--[if ...` 条件注释除外），删除缩进和空行，行内连续空白合并为一个空格
+    - 注意：只删除块级标签两侧的换行，行内标签（比如 `<a> <small>`）之间的换行会影响显示不能删除
+    - 注意：`<script>` 默认即为 `type="text/javascript"`，此处直接删除
+    """
+    preserved = []
+
+    def keep(match):
+        part = match.group(1)
+        if part.startswith("<!--") and not part.startswith("<!--[if"):
+            return ""
+        preserved.append(HTML_SCRIPT_TYPE_RE.sub("<script", part))
+        return f"\x00{len(preserved) - 1}\x00"
+
+    # 注意：保留内容首先替换为占位符，处理空白之后再还原，占位符中不包含换行
+    text = HTML_PRESERVE_RE.sub(keep, text)
+
+    parts = []
+    block = True
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if not block and not HTML_BLOCK_START_RE.match(line):
+            parts.append("\n")
+        parts.append(line)
+        block = HTML_BLOCK_END_RE.search(line) is not None
+
+    text = HTML_SPACE_RE.sub(" ", "".join(parts))
+    text = HTML_PLACEHOLDER_RE.sub(lambda match: preserved[int(match.group(1))], text)
+    return text + "\n"
+
+
+class AssetPipeline:
+    """压缩 static_path 根目录下的 CSS/JS 文件，并输出带内容 hash 的文件名，比如 `app.css` → `app.1a2b3c4d5e6f.css`
+
+    - 注意：模板通过 `static_url("app.css")` 引用压缩之后的文件，其余静态文件仍由 copy_file 原样复制
+    - 注意：原始文件名的文件同样原样复制，已经缓存旧页面的浏览器仍然可以正常加载
+    - 注意：manifest 缓存在 `data_path/_assets.json`，源文件 (mtime, size) 未变化时直接使用缓存的压缩结果，无需重新压缩计算 hash
+    - 注意：hash 文件名的内容永远不会改变，可以使用 `Cache-Control: immutable` 长期缓存
+    """
+    version = "1"
+    minifiers = {
+        ".css": minify_css,
+        ".js": minify_js,
+    }
+    cache_control = "public, max-age=31536000, immutable"
+
+    def __init__(self, static_path: str, cache_path: str = None):
+        self.static_path = static_path
+        self.cache_path = cache_path
+        self.assets = {} # name → dict(mtime, size, filename, text)
+
+    def load_cache(self):
+        cache = load_json_cache(self.cache_path, self.version) or {}
+        return cache.get("assets") or {}
+
+    def save_cache(self, assets: dict):
+        save_json_cache(self.cache_path, self.version, { "assets": assets })
+
+    def build(self):
+        """处理全部 CSS/JS 文件，只重新压缩发生变化的文件，返回 name → url 映射
+        """
+        cache = self.load_cache()
+        assets = {}
+        changed = 0
+        for name in sorted(os.listdir(self.static_path)):
+            root, ext = os.path.splitext(name)
+            path = os.path.join(self.static_path, name)
+            if ext not in self.minifiers or not os.path.isfile(path):
+                continue
+
+            stat = os.stat(path)
+            cached = cache.get(name)
+            if cached and cached.get("mtime") == stat.st_mtime_ns and cached.get("size") == stat.st_size:
+                assets[name] = cached
+                continue
+
+            text = self.minifiers[ext](fread(path))
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+            assets[name] = {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "filename": f"{root}.{digest}{ext}",
+                "text": text,
+            }
+            changed += 1
+
+        self.assets = assets
+        if changed:
+            self.save_cache(assets)
+        logger.info(f'build assets, items={len(assets)}, cached={len(assets) - changed}, changed={changed}')
+        return self.urls()
+
+    def urls(self):
+        return { name: f'/{asset["filename"]}' for name, asset in self.assets.items() }
+
+    def write(self, writer):
+        for asset in self.assets.values():
+            writer.write(asset["filename"], asset["text"])
+
+    def headers(self):
+        """返回 Netlify/Cloudflare Pages 等支持的 `_headers` 文件内容，hash 文件名的文件使用 immutable 长期缓存
+        """
+        lines = []
+        for asset in sorted(self.assets.values(), key=lambda asset: asset["filename"]):
+            lines.append(f'/{asset["filename"]}')
+            lines.append(f'  Cache-Control: {self.cache_control}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,167 @@
+#
+# 文章 markdown 备份，只重新写入发生变化的文章，并可选输出包含全部文章/评论的单一压缩归档文件
+#
+
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import logging
+import os
+import os.path
+import re
+
+from .utils import fwrite, load_json_cache, save_json_cache
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+# 注意：此处为备份文件名中全部非法字符的过滤规则
+FILENAME_RE = re.compile(r"[\/\\\:\*\?\"\<\>\|\n\r]")
+BACKUP_FILE_RE = re.compile(r"^(\d+)_.*\.md$")
+
+
+def backup_filename(post):
+    """返回文章备份文件名，按照 `[ISSUE_ID]_[ISSUE_TITLE].md` 规则生成
+    """
+    return f'{post.get("id")}_{FILENAME_RE.sub("-", post.get("title") or "")}.md'
+
+
+def backup_text(post):
+    return f'# [{post.get("title")}]({post.get("source_url")}) \n\n {post.get("body")}'
+
+
+class MarkdownBackup:
+    """将全部文章备份为 backup_dir 中的 markdown 文件
+
+    - 注意：manifest 缓存在 `data_path/_backup.json`，记录每篇文章备份文件名以及内容 hash，内容未变化的文章不再重复写入
+    - 注意：文章标题修改之后文件名随之改变，同一 issue_id 旧文件名的备份文件会被删除
+    - 注意：已经关闭/删除的 issue 不会出现在 posts 中，其备份文件仍然保留
+    - 注意：启用 archive 时同时将全部文章/评论以 JSON Lines 格式追加写入 `backup_dir/treehole.jsonl.gz`
+        - 每次构建只追加 updated_at 发生变化的文章/评论，作为一个新的 gzip member 追加到文件末尾，无需重写整个文件
+        - 读取时使用 `gzip.open()` 按行读取全部 member，同一 (type, id) 以最后一条记录为准
+    """
+    version = "1"
+    workers = 8
+    archive_name = "treehole.jsonl.gz"
+
+    def __init__(self, backup_dir: str, cache_path: str = None, archive: bool = False):
+        self.backup_dir = backup_dir
+        self.cache_path = cache_path
+        self.archive = archive
+        self.manifest = self.load_cache()
+
+    def load_cache(self):
+        manifest = { "files": {}, "archived": {} }
+        cache = load_json_cache(self.cache_path, self.version)
+        if cache is None:
+            return manifest
+        manifest["files"] = cache.get("files") or {}
+        # 注意：归档文件已经不存在时，需要重新写入全部记录
+        if os.path.exists(os.path.join(self.backup_dir, self.archive_name)):
+            manifest["archived"] = cache.get("archived") or {}
+        return manifest
+
+    def save_cache(self):
+        save_json_cache(self.cache_path, self.version, self.manifest)
+
+    def existing_files(self):
+        """返回 backup_dir 中已经存在的全部备份文件，按 issue_id 分组
+        """
+        files = {}
+        if not os.path.isdir(self.backup_dir):
+            return files
+        for name in os.listdir(self.backup_dir):
+            match = BACKUP_FILE_RE.match(name)
+            if match:
+                files.setdefault(match.group(1), []).append(name)
+        return files
+
+    def write_markdown(self, posts: list):
+        """只写入内容发生变化的文章，并删除同一 issue_id 旧文件名的备份文件，返回 (写入数量, 删除数量)
+        """
+        files = self.manifest["files"]
+        existing = self.existing_files()
+        writes = []
+        removes = []
+        for post in posts:
+            post_id = str(post.get("id"))
+            filename = backup_filename(post)
+            filetext = backup_text(post)
+            digest = hashlib.sha256(filetext.encode("utf-8")).hexdigest()
+
+            for name in existing.get(post_id, ()):
+                if name != filename:
+                    removes.append(name)
+
+            cached = files.get(post_id)
+            if cached and cached.get("filename") == filename and cached.get("digest") == digest and filename in existing.get(post_id, ()):
+                continue
+            writes.append((filename, filetext))
+            files[post_id] = { "filename": filename, "digest": digest }
+
+        # 注意：文件写入主要为 IO 等待，此处使用线程池并行写入
+        if writes:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(lambda item: fwrite(os.path.join(self.backup_dir, item[0]), item[1]), writes))
+        for name in removes:
+            os.remove(os.path.join(self.backup_dir, name))
+        return (len(writes), len(removes))
+
+    def write_archive(self, posts: list, comments: list):
+        """将 updated_at 发生变化的文章/评论追加写入归档文件，返回追加的记录数量
+        """
+        archived = self.manifest["archived"]
+        records = []
+        for post in posts:
+            key = f'p{post.get("id")}'
+            if archived.get(key) != post.get("updated_at"):
+                records.append((key, post.get("updated_at"), {
+                    "type": "post",
+                    "id": post.get("id"),
+                    "created_at": post.get("created_at"),
+                    "updated_at": post.get("updated_at"),
+                    "title": post.get("title"),
+                    "source_url": post.get("source_url"),
+                    "labels": [ label.get("name") for label in post.get("labels") or () ],
+                    "user": (post.get("user") or {}).get("login"),
+                    "body": post.get("body"),
+                }))
+        for comment in comments:
+            key = f'c{comment.get("id")}'
+            if archived.get(key) != comment.get("updated_at"):
+                records.append((key, comment.get("updated_at"), {
+                    "type": "comment",
+                    "id": comment.get("id"),
+                    "post_id": comment.get("post_id"),
+                    "created_at": comment.get("created_at"),
+                    "updated_at": comment.get("updated_at"),
+                    "source_url": comment.get("source_url"),
+                    "user": (comment.get("user") or {}).get("login"),
+                    "body": comment.get("body"),
+                }))
+        if not records:
+            return 0
+
+        # 注意：按行流式写入压缩文件，不在内存中拼接全部内容
+        os.makedirs(self.backup_dir, exist_ok=True)
+        with gzip.open(os.path.join(self.backup_dir, self.archive_name), "at", encoding="utf-8") as fd:
+            for key, updated_at, record in records:
+                fd.write(json.dumps(record, ensure_ascii=False))
+                fd.write("\n")
+                archived[key] = updated_at
+        return len(records)
+
+    def run(self, posts: list, comments: list = None):
+        written, removed = self.write_markdown(posts)
+        archived = self.write_archive(posts, comments or []) if self.archive else 0
+        if written or removed or archived:
+            self.save_cache()
+        logger.info(
+            f'backup posts, items={len(posts)}, written={written}, unchanged={len(posts) - written}, '
+            f'removed={removed}, archived={archived}'
+        )
+        return (written, removed, archived)
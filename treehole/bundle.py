@@ -0,0 +1,188 @@
+#
+# 构建缓存打包，将 data_path 中可复用的缓存打包为单一压缩文件，方便在 CI 等临时环境之间恢复
+#
+
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import os.path
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import zlib
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+class CacheBundle:
+    """将 data_path 中的全部可复用缓存打包为带版本和校验和的 `.tar.gz` 文件，并可以在新的环境中恢复
+
+    - 注意：files 为 包内文件名 → 本地路径，本地路径为目录时打包其中的全部文件，不存在的文件直接跳过
+    - 注意：包内第一个文件为 `manifest.json`，记录格式版本、仓库、store schema_version、渲染器版本以及全部文件的 size/sha256
+    - 注意：sqlite 缓存使用 backup API 导出一致的快照，不直接复制正在使用的数据库文件（WAL 模式下文件内容可能不完整）
+    - 注意：恢复时首先解压到临时目录并逐个校验 size/sha256，全部通过之后才替换本地文件，
+        损坏（压缩数据错误/校验和不一致/文件缺失）或者过期（格式版本/仓库/schema_version 不一致）的缓存包直接忽略
+    """
+    format = "treehole-cache"
+    version = 1
+    manifest_name = "manifest.json"
+
+    def __init__(self, files: dict[str, str], identity: dict, work_dir: str):
+        self.files = files
+        self.identity = identity # 必须全部一致才能使用的字段，比如 repo/schema_version
+        self.work_dir = work_dir # 恢复时的临时目录，必须与缓存文件位于同一文件系统，保证 os.replace() 可用
+
+    def local_files(self, tmpdir: str):
+        """返回需要打包的 (包内文件名, 本地路径) 列表，按包内文件名排序
+        """
+        entries = []
+        for name, path in sorted(self.files.items()):
+            if not path or not os.path.exists(path):
+                continue
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        src = os.path.join(dirpath, filename)
+                        entries.append((f'{name}/{os.path.relpath(src, path).replace(os.sep, "/")}', src))
+            elif name.endswith(".sqlite3"):
+                snapshot = os.path.join(tmpdir, name)
+                with sqlite3.connect(path) as source, sqlite3.connect(snapshot) as target:
+                    source.backup(target)
+                source.close()
+                target.close()
+                entries.append((name, snapshot))
+            else:
+                entries.append((name, path))
+        return entries
+
+    def export(self, bundle_path: str, **info):
+        """导出缓存包，返回 manifest
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            entries = self.local_files(tmpdir)
+            files = {}
+            for name, path in entries:
+                with open(path, "rb") as fd:
+                    files[name] = {
+                        "size": os.path.getsize(path),
+                        "sha256": hashlib.sha256(fd.read()).hexdigest(),
+                    }
+            manifest = {
+                "format": self.format,
+                "version": self.version,
+                "created_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                **self.identity,
+                **info,
+                "files": files,
+            }
+
+            os.makedirs(os.path.dirname(os.path.abspath(bundle_path)), exist_ok=True)
+            tmp_path = f"{bundle_path}.tmp"
+            with tarfile.open(tmp_path, "w:gz", format=tarfile.PAX_FORMAT) as tar:
+                data = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+                tarinfo = tarfile.TarInfo(self.manifest_name)
+                tarinfo.size = len(data)
+                tar.addfile(tarinfo, io.BytesIO(data))
+                for name, path in entries:
+                    tar.add(path, arcname=name, recursive=False)
+            os.replace(tmp_path, bundle_path)
+
+        logger.info(
+            f'export cache bundle, path={bundle_path}, files={len(files)}, '
+            f'bytes={sum(item["size"] for item in files.values())}, size={os.path.getsize(bundle_path)}'
+        )
+        return manifest
+
+    def check(self, manifest: dict):
+        """返回缓存包不能使用的原因，可以使用时返回 None
+        """
+        if manifest.get("format") != self.format or manifest.get("version") != self.version:
+            return f'unsupported format={manifest.get("format")}, version={manifest.get("version")}'
+        for key, value in self.identity.items():
+            if manifest.get(key) != value:
+                return f'{key} mismatch, bundle={manifest.get(key)}, current={value}'
+        return None
+
+    def target(self, name: str):
+        """返回包内文件名对应的本地路径，不在 files 中的文件返回 None
+        """
+        if name in self.files and not name.endswith("/"):
+            return self.files[name]
+        root, _, rel_path = name.partition("/")
+        parts = rel_path.split("/")
+        if root in self.files and rel_path and all( part not in ("", ".", "..") for part in parts ):
+            return os.path.join(self.files[root], *parts)
+        return None
+
+    def load(self, bundle_path: str):
+        """校验并恢复缓存包，返回是否恢复成功，损坏或者过期的缓存包只输出警告并保持本地文件不变
+        """
+        if not os.path.exists(bundle_path):
+            logger.warning(f'cache bundle not found, path={bundle_path}')
+            return False
+
+        tmpdir = None
+        try:
+            with tarfile.open(bundle_path, "r:gz") as tar:
+                member = tar.next()
+                if member is None or member.name != self.manifest_name:
+                    raise ValueError(f'{self.manifest_name} not found')
+                manifest = json.loads(tar.extractfile(member).read())
+                reason = self.check(manifest)
+                if reason:
+                    logger.warning(f'cache bundle ignored, stale bundle, path={bundle_path}, {reason}')
+                    return False
+
+                files = manifest.get("files") or {}
+                tmpdir = tempfile.mkdtemp(prefix=".bundle-", dir=self.work_dir)
+                extracted = {}
+                for member in tar:
+                    if member.name == self.manifest_name:
+                        continue
+                    expected = files.get(member.name)
+                    target = self.target(member.name)
+                    if not member.isfile() or expected is None or target is None:
+                        raise ValueError(f'unexpected member: {member.name}')
+                    tmp_path = os.path.join(tmpdir, str(len(extracted)))
+                    digest = hashlib.sha256()
+                    size = 0
+                    with tar.extractfile(member) as src, open(tmp_path, "wb") as dst:
+                        for chunk in iter(lambda: src.read(1 << 20), b""):
+                            digest.update(chunk)
+                            size += len(chunk)
+                            dst.write(chunk)
+                    if size != expected["size"] or digest.hexdigest() != expected["sha256"]:
+                        raise ValueError(f'checksum mismatch: {member.name}')
+                    extracted[member.name] = (tmp_path, target)
+
+            missing = set(files) - set(extracted)
+            if missing:
+                raise ValueError(f'missing files: {",".join(sorted(missing)[:10])}')
+
+        except (tarfile.TarError, OSError, EOFError, zlib.error, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'cache bundle ignored, corrupt bundle, path={bundle_path}, exception={e}')
+            if tmpdir:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            return False
+
+        # 注意：全部文件校验通过之后才替换本地文件
+        for name, (tmp_path, target) in extracted.items():
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            if name.endswith(".sqlite3"):
+                # 注意：旧数据库残留的 WAL/SHM 文件会与新的数据库文件混用，此处必须删除
+                for suffix in ("-wal", "-shm"):
+                    if os.path.exists(f"{target}{suffix}"):
+                        os.remove(f"{target}{suffix}")
+            os.replace(tmp_path, target)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+        logger.info(f'import cache bundle, path={bundle_path}, files={len(extracted)}, created_at={manifest.get("created_at")}')
+        return manifest
@@ -0,0 +1,84 @@
+#
+# 分代输出目录，每次构建输出到新的 generation 目录，完成之后原子切换 output_dir 符号链接
+#
+
+import datetime
+import logging
+import os
+import os.path
+import shutil
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+class OutputGenerations:
+    """将 output_dir 作为指向 `<output_dir>.generations/<generation>` 的符号链接，实现构建过程中网站始终完整可用
+
+    - 注意：每次构建输出到新的 generation 目录，构建完成之后使用 `os.replace()` 原子替换 output_dir 符号链接
+    - 注意：构建过程中 output_dir 始终指向上一次完整的构建结果，正在读取旧 generation 的请求不受影响
+    - 注意：符号链接使用相对路径，整个 data_path 目录可以直接移动
+    - 注意：output_dir 原来为普通目录时，首次切换前将其移动到 generations 目录中作为上一个 generation，此处存在极短的不可用时间
+    - 注意：只保留最新的 keep 个 generation，其余直接删除
+    """
+    def __init__(self, output_dir: str, keep: int = 2):
+        self.output_dir = os.path.normpath(output_dir)
+        self.root = f"{self.output_dir}.generations"
+        self.keep = max(1, keep)
+
+    def current(self):
+        """返回当前 output_dir 对应的 generation 目录，不存在时返回 None
+        """
+        if os.path.islink(self.output_dir):
+            path = os.path.realpath(self.output_dir)
+            return path if os.path.isdir(path) else None
+        if os.path.isdir(self.output_dir):
+            return self.output_dir
+        return None
+
+    def create(self):
+        """创建新的空 generation 目录，目录名按创建时间排序
+        """
+        name = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%S%f")
+        path = os.path.join(self.root, f"{name}-{os.getpid()}")
+        os.makedirs(path)
+        return path
+
+    def publish(self, generation: str):
+        """将 output_dir 原子切换到 generation 目录，并删除多余的旧 generation
+        """
+        if os.path.isdir(self.output_dir) and not os.path.islink(self.output_dir):
+            os.replace(self.output_dir, os.path.join(self.root, "00000000000000000000-legacy"))
+
+        link = f"{self.output_dir}.tmp-{os.getpid()}"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.relpath(generation, os.path.dirname(os.path.abspath(self.output_dir))), link)
+        os.replace(link, self.output_dir)
+        logger.info(f'publish generation, output_dir={self.output_dir}, generation={os.path.basename(generation)}')
+        self.prune(generation)
+
+    def prune(self, generation: str):
+        names = sorted(os.listdir(self.root), reverse=True)
+        keep = set(names[:self.keep]) | { os.path.basename(generation) }
+        for name in names:
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def discard(self, generation: str):
+        """删除构建失败的 generation，output_dir 保持不变
+        """
+        shutil.rmtree(generation, ignore_errors=True)
+
+    def stats(self, generation: str):
+        """返回 generation 中的 (文件数量, 硬链接复用的文件数量)
+        """
+        files = linked = 0
+        for dirpath, _, filenames in os.walk(generation):
+            for filename in filenames:
+                files += 1
+                if os.lstat(os.path.join(dirpath, filename)).st_nlink > 1:
+                    linked += 1
+        return (files, linked)
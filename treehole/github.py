@@ -2,30 +2,170 @@
 # 使用 tornado.httpclient 实现的 Github APIv3 异步客户端
 # 
 
+import asyncio
+import datetime
+import email.utils
 import json
 import logging
+import time
 import urllib.parse
 
 import tornado.httpclient
 import tornado.httputil
 
+from .utils import Record, intern
+
 
 
 logger = logging.getLogger("treehole")
 
 
 
+# 
+# rate limit
+# 
+
+class GithubToken:
+    """token 池中单一 token 的额度状态，全部数据来自最近一次响应的 X-RateLimit-* 响应头
+    """
+    __slots__ = ("name", "token", "limit", "remaining", "reset", "requests", "rate_limited")
+
+    def __init__(self, name: str, token: str):
+        self.name = name            # 日志中只输出 token 序号，不输出 token 本身
+        self.token = token
+        self.limit = None           # X-RateLimit-Limit，未收到响应头之前为 None
+        self.remaining = None       # X-RateLimit-Remaining，分配请求时预先扣减，未知时为 None
+        self.reset = 0              # X-RateLimit-Reset，额度重置的 UTC 时间戳
+        self.requests = 0           # 本次构建分配到当前 token 的请求数量
+        self.rate_limited = 0       # 本次构建当前 token 触发速率限制的次数
+
+    def __repr__(self):
+        return self.name
+
+
+class GithubTokenPool:
+    """多个 token 组成的 token 池，按响应头记录每个 token 的剩余额度，每次请求分配剩余额度最多的 token
+
+    - 注意：分配 token 时预先扣减一次剩余额度，并发请求不会超出 token 的剩余额度
+    - 注意：额度未知（尚未收到响应头）的 token 优先使用，额度相同时使用请求数量最少的 token
+    - 注意：全部 token 额度耗尽时等待到最早的 X-RateLimit-Reset 时间再继续分配，不直接失败
+    - 注意：tokens 为逗号分隔的字符串或者列表，为空时不带 Authorization 请求（匿名请求每小时只有 60 次额度）
+    """
+    reset_margin = 1 # reset 时间之后额外等待的秒数，避免本地时间与 Github 服务器时间的误差
+
+    def __init__(self, tokens):
+        if tokens is None or isinstance(tokens, str):
+            tokens = ( token.strip() for token in (tokens or "").split(",") )
+        tokens = [ token for token in tokens if token ] or [ None ]
+        self.tokens = [ GithubToken(f"#{index + 1}", token) for index, token in enumerate(tokens) ]
+        self.waited = 0.0     # 本次构建等待速率限制的总秒数，并发请求同时等待只计算一次
+        self.wait_until = 0.0
+
+    def pick(self, now: float):
+        available = []
+        for token in self.tokens:
+            # 注意：已经过了 reset 时间的 token 额度恢复为 limit，并发请求同样按 limit 预先扣减
+            if token.remaining is not None and token.reset <= now:
+                token.remaining = token.limit
+            if token.remaining is None or token.remaining > 0:
+                available.append(token)
+        if not available:
+            return None
+        return max(available, key=lambda token: (
+            float("inf") if token.remaining is None else token.remaining, -token.requests
+        ))
+
+    async def acquire(self):
+        """返回下一个请求使用的 token，全部 token 额度耗尽时等待到最早的额度重置时间
+        """
+        while True:
+            now = time.time()
+            token = self.pick(now)
+            if token is not None:
+                if token.remaining is not None:
+                    token.remaining -= 1
+                token.requests += 1
+                return token
+
+            reset = min( token.reset for token in self.tokens )
+            wait = max(0, reset - now) + self.reset_margin
+            logger.warning(
+                f'github rate limit exhausted, tokens={len(self.tokens)}, wait={wait:.0f}s, '
+                f'reset={datetime.datetime.fromtimestamp(reset, datetime.timezone.utc).isoformat()}'
+            )
+            await self.sleep(wait)
+
+    async def sleep(self, wait: float):
+        """等待速率限制，同时累计本次构建的等待时间
+        """
+        now = time.time()
+        self.waited += max(0, now + wait - max(now, self.wait_until))
+        self.wait_until = max(self.wait_until, now + wait)
+        await asyncio.sleep(wait)
+
+    def update(self, token: GithubToken, headers: tornado.httputil.HTTPHeaders):
+        """按响应头 X-RateLimit-* 更新 token 的剩余额度
+
+        - 注意：并发请求的响应顺序不确定，同一个 reset 周期内只保留最小的剩余额度（包含预先扣减的额度）
+        """
+        if not headers or "X-RateLimit-Remaining" not in headers:
+            return
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset = int(headers.get("X-RateLimit-Reset", 0))
+            limit = int(headers.get("X-RateLimit-Limit", 0)) or None
+        except ValueError:
+            return
+
+        if reset != token.reset or token.remaining is None:
+            token.reset = reset
+            token.remaining = remaining
+        else:
+            token.remaining = min(token.remaining, remaining)
+        token.limit = limit
+
+    def exhaust(self, token: GithubToken, headers: tornado.httputil.HTTPHeaders):
+        """触发速率限制时将 token 标记为额度耗尽，直到 X-RateLimit-Reset 时间
+        """
+        token.rate_limited += 1
+        token.remaining = 0
+        try:
+            token.reset = max(token.reset, int(headers.get("X-RateLimit-Reset", 0)))
+        except ValueError:
+            pass
+        # 注意：没有 reset 时间时按 Github 文档建议至少等待一分钟
+        if token.reset <= time.time():
+            token.reset = int(time.time()) + 60
+
+    def report(self):
+        """输出本次构建每个 token 的请求数量以及剩余额度
+        """
+        for token in self.tokens:
+            reset = datetime.datetime.fromtimestamp(token.reset, datetime.timezone.utc).isoformat() if token.reset else None
+            logger.info(
+                f'github quota, token={token}, requests={token.requests}, rate_limited={token.rate_limited}, '
+                f'remaining={token.remaining}/{token.limit}, reset={reset}'
+            )
+        logger.info(f'github quota, tokens={len(self.tokens)}, requests={sum( token.requests for token in self.tokens )}, waited={self.waited:.0f}s')
+
+
+
 # 
 # client
 # 
 
 class GithubClient:
     """Github API Client
+
+    - 注意：全部请求经过 GithubTokenPool 分配 token，触发速率限制时等待额度重置之后重试，不直接失败
     """
     base_url = "https://api.github.com"
     user_agent = "python-github-client"
     api_version = "2022-11-28"
     api_reference = "https://docs.github.com/"
+    concurrency = 8 # 并发请求数量上限
+    retries = 5     # 触发速率限制之后的重试次数上限
+    retry_after = 60 # Retry-After 无法解析时等待的秒数
 
     def __init__(self, token, accept="application/vnd.github.raw+json"):
         """
@@ -36,15 +176,67 @@ class GithubClient:
                 而且对应的图片由 `<a href=""></a>` 包裹，此处需要替换其链接实现
             - 处理好的图片链接最多只有五分钟的访问有效期，无法在文章输出中使用
             - 并且处理后的图片包裹对应图片链接，访问就直接出错，相当不友好
+        - 注意：token 为逗号分隔的多个 token 或者 token 列表时，请求按剩余额度分配到不同的 token
         """
-        self.token = token
+        self.tokens = token if isinstance(token, GithubTokenPool) else GithubTokenPool(token)
         self.accept = accept
         self.headers = {
             "Accept": f"{accept}",
-            "Authorization": f"Bearer {token}",
             "X-GitHub-Api-Version": f"{self.api_version}"
         }
 
+    async def fetch(self, url: str):
+        """发送 GET 请求并返回 response，出错时抛出 tornado.httpclient.HTTPClientError
+
+        - 注意：响应 403/429 并且 X-RateLimit-Remaining=0 时为额度耗尽，标记当前 token 之后换用其他 token 重试
+        - 注意：响应 403/429 并且带有 Retry-After 时为 secondary rate limit，等待指定秒数之后重试
+        """
+        httpclient = tornado.httpclient.AsyncHTTPClient()
+        for attempt in range(self.retries + 1):
+            token = await self.tokens.acquire()
+            headers = dict(self.headers)
+            if token.token:
+                headers["Authorization"] = f"Bearer {token.token}"
+            request = tornado.httpclient.HTTPRequest(url=url,
+                method="GET",
+                headers=headers,
+                user_agent=self.user_agent
+            )
+            response = await httpclient.fetch(request, raise_error=False)
+            self.tokens.update(token, response.headers)
+
+            if response.code in (403, 429) and attempt < self.retries:
+                if response.headers.get("X-RateLimit-Remaining") == "0":
+                    logger.warning(f'github rate limited, token={token}, url={url}, attempt={attempt + 1}')
+                    self.tokens.exhaust(token, response.headers)
+                    continue
+                if "Retry-After" in response.headers:
+                    wait = self.parse_retry_after(response.headers["Retry-After"])
+                    logger.warning(f'github secondary rate limited, token={token}, url={url}, wait={wait:.0f}s, attempt={attempt + 1}')
+                    token.rate_limited += 1
+                    await self.tokens.sleep(wait)
+                    continue
+
+            response.rethrow()
+            return response
+
+    def parse_retry_after(self, value: str):
+        """返回 Retry-After 对应的等待秒数
+
+        - 注意：Retry-After 可以是秒数或者 HTTP-date 两种格式，均无法解析时按 retry_after 秒等待
+        """
+        try:
+            return max(0, int(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return self.retry_after
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+        return max(0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
     async def get_repo_issues(self,
         owner: str,
         repo: str,
@@ -65,26 +257,17 @@ class GithubClient:
         url = f"{self.base_url}/repos/{owner}/{repo}/issues?{urllib.parse.urlencode(params)}"
         
         logger.info(f'get_repo_issues, owner={owner}, repo={repo}, per_page={per_page}')
-        httpclient = tornado.httpclient.AsyncHTTPClient()
-
         while True:
-            request = tornado.httpclient.HTTPRequest(url=url,
-                method="GET",
-                headers=self.headers,
-                user_agent=self.user_agent
-            )
             try:
-                response = await httpclient.fetch(request)
+                response = await self.fetch(url)
                 issues = json.loads(response.body)
             except tornado.httpclient.HTTPClientError as e:
-                logger.error(f"httpclient error: {e}", exc_info=True)
-                response = e.response
-                # 注意：此处出错则直接返回
-                return
+                logger.error(f"httpclient error: {e}, url={url}")
+                # 注意：此处出错必须抛出异常，直接返回会使用不完整的 issues 继续构建并覆盖缓存
+                raise
             except Exception as e:
-                logger.error(f"httpclent unknown: {e}", exc_info=True)
-                # 注意：此处出错则直接返回
-                return
+                logger.error(f"httpclent unknown: {e}, url={url}", exc_info=True)
+                raise
             
             # 注意：此处返回迭代器方便直接使用当前返回结果
             # 注意：此处使用迭代器方便边拉取数据边使用数据，节省内存
@@ -104,40 +287,38 @@ class GithubClient:
     async def get_issue_comments(self,
         owner: str,
         repo: str,
-        per_page = 100
+        per_page = 100,
+        issue_number: int = None
     ):
-        """返回对应 issues 全部 comments
+        """返回对应 issues 全部 comments，指定 issue_number 时只返回该 issue 的 comments
 
         - 注意：使用 accept=application/vnd.github.html+json 才能返回 body_html 字段方便后续直接使用
         - 注意：返回数据中已经默认带上每个 comment 对应的 reactions
+        - 注意：未指定 issue_number 时返回仓库中全部 issues/pull_requests 的 comments，包括不会出现在网站中的 comments
+        - 注意：任意一页拉取失败时直接抛出异常，不返回部分 comments
         """
         # GET /repos/{owner}/{repo}/issues/comments <https://docs.github.com/en/rest/reference/issues#comments>
+        # GET /repos/{owner}/{repo}/issues/{issue_number}/comments
         params = {
             "per_page": per_page
         }
-        url = f"{self.base_url}/repos/{owner}/{repo}/issues/comments?{urllib.parse.urlencode(params)}"
-
-        logger.info(f'get_issue_comments, owner={owner}, repo={repo}, per_page={per_page}')
-        httpclient = tornado.httpclient.AsyncHTTPClient()
+        if issue_number is None:
+            url = f"{self.base_url}/repos/{owner}/{repo}/issues/comments?{urllib.parse.urlencode(params)}"
+        else:
+            url = f"{self.base_url}/repos/{owner}/{repo}/issues/{issue_number}/comments?{urllib.parse.urlencode(params)}"
 
+        logger.info(f'get_issue_comments, owner={owner}, repo={repo}, issue_number={issue_number}, per_page={per_page}')
         while True:
-            request = tornado.httpclient.HTTPRequest(url=url,
-                method="GET",
-                headers=self.headers,
-                user_agent=self.user_agent
-            )
             try:
-                response = await httpclient.fetch(request)
+                response = await self.fetch(url)
                 comments = json.loads(response.body)
             except tornado.httpclient.HTTPClientError as e:
-                logger.error(f"httpclient error: {e}", exc_info=True)
-                response = e.response
-                # 注意：此处出错则直接返回
-                return
+                logger.error(f"httpclient error: {e}, url={url}")
+                # 注意：此处出错必须抛出异常，直接返回会使用不完整的 comments 继续构建并覆盖缓存
+                raise
             except Exception as e:
-                logger.error(f"httpclent unknown: {e}", exc_info=True)
-                # 注意：此处出错则直接返回
-                return
+                logger.error(f"httpclent unknown: {e}, url={url}", exc_info=True)
+                raise
             
             # 注意：此处返回迭代器方便直接使用当前返回结果
             # 注意：此处使用迭代器方便边拉取数据边使用数据，节省内存
@@ -176,35 +357,46 @@ class GithubClient:
 # models
 # 
 
-class GithubIssue(dict):
+class GithubIssue(Record):
     """Github Issue 数据模型，方便转换到博客使用的数据类型
+
+    - 注意：此处不再保留原始接口数据，只保留博客使用的字段
     """
-    def __init__(self, issue: dict):
-        self._origin_data = issue
+    __slots__ = (
+        "issue_url", "issue_number", "title", "created_at", "updated_at",
+        "state", "is_pull_request", "body", "comments", "labels", "reactions", "user"
+    )
 
-        self["issue_url"] = issue.get("html_url")
-        self["issue_number"] = issue.get("number")
+    def __init__(self, issue: dict):
+        self.issue_url = issue.get("html_url")
+        self.issue_number = issue.get("number")
         # issue
-        self["title"] = issue.get("title")
-        self["created_at"] = issue.get("created_at")
-        self["updated_at"] = issue.get("updated_at")
-        self["state"] = issue.get("state")
-        self["body"] = issue.get("body")
-        # self["body_html"] = issue.get("body_html")
+        self.title = issue.get("title")
+        self.created_at = issue.get("created_at")
+        self.updated_at = issue.get("updated_at")
+        self.state = issue.get("state")
+        # 注意：Github 接口中 pull_request 也作为 issue 返回，此处保留标识方便后续筛选
+        self.is_pull_request = "pull_request" in issue
+        self.body = issue.get("body")
+        # 注意：comments 为评论数量，只存在于接口数据中，store 中读取的 issue 为 None
+        self.comments = issue.get("comments")
         # labels
-        self["labels"] = [ dict(GithubLabel(label)) for label in issue.get("labels") ]
+        self.labels = tuple( GithubLabel(label).shared() for label in issue.get("labels") )
         # reactions
-        self["reactions"] = dict(GithubReactions(issue.get("reactions")))
+        self.reactions = GithubReactions(issue.get("reactions")).shared()
         # user
-        self["user"] = dict(GithubUser(issue.get("user")))
+        self.user = GithubUser(issue.get("user")).shared()
 
 
-class GithubComment(dict):
+class GithubComment(Record):
     """Github Issue Comment 数据模型，方便转换到博客使用的数据类型
     """
-    def __init__(self, comment: dict):
-        self._origin_data = comment
+    __slots__ = (
+        "issue_url", "issue_number", "comment_url", "comment_id",
+        "created_at", "updated_at", "body", "reactions", "user"
+    )
 
+    def __init__(self, comment: dict):
         # https://api.github.com/repos/[owner]/[repo]/issues/[issue_number]
         # 注意：此处是直接替换得到对应 issue 网页版本的链接
         issue_url = comment.get("issue_url").replace("https://api.github.com/repos/", "https://github.com/")
@@ -212,57 +404,74 @@ class GithubComment(dict):
         _, issue_number = issue_url.split("/issues/", 1)
 
         # issue
-        self["issue_url"] = issue_url
-        self["issue_number"] = issue_number
+        self.issue_url = issue_url
+        self.issue_number = int(issue_number)
         # comment
-        self["comment_url"] = comment.get("html_url")
-        self["comment_id"] = comment.get("id")
-        self["created_at"] = comment.get("created_at")
-        self["updated_at"] = comment.get("updated_at")
-        self["body"] = comment.get("body")
-        # self["body_html"] = comment.get("body_html")
+        self.comment_url = comment.get("html_url")
+        self.comment_id = comment.get("id")
+        self.created_at = comment.get("created_at")
+        self.updated_at = comment.get("updated_at")
+        self.body = comment.get("body")
         # reactions
-        self["reactions"] = dict(GithubReactions(comment.get("reactions")))
+        self.reactions = GithubReactions(comment.get("reactions")).shared()
         # user
-        self["user"] = dict(GithubUser(comment.get("user")))
+        self.user = GithubUser(comment.get("user")).shared()
 
 
-class GithubLabel(dict):
+class GithubLabel(Record):
     """Github Issue Label 数据模型，方便转换到博客使用的数据类型
     """
+    __slots__ = ("name", "color", "description")
+
     def __init__(self, label: dict):
-        self._origin_data = label
-        
-        self["name"] = label.get("name")
-        self["color"] = label.get("color")
-        self["description"] = label.get("description")
+        self.name = intern(label.get("name"))
+        self.color = label.get("color")
+        self.description = label.get("description")
 
 
-class GithubReactions(dict):
+class GithubReactions(Record):
     """Github Issue Reactions 数据模型，方便转换到博客使用的数据类型
+
+    - 注意：此处 `+1/-1` 不是合法的属性名，使用 keys 映射对应的字段
+    - 注意：大量 issues/comments 的 reactions 完全相同（比如全部为 0），使用 shared() 共享同一实例
     """
+    __slots__ = ("up", "down", "laugh", "hooray", "confused", "heart", "rocket", "eyes")
+
+    reactions_maps = {
+        "+1": "up",
+        "-1": "down",
+        "laugh": "laugh",
+        "hooray": "hooray",
+        "confused": "confused",
+        "heart": "heart",
+        "rocket": "rocket",
+        "eyes": "eyes",
+    }
+
     def __init__(self, reactions: dict):
-        self._origin_data = reactions
+        for reaction, field in self.reactions_maps.items():
+            setattr(self, field, reactions.get(reaction))
 
-        self["+1"] = reactions.get("+1")
-        self["-1"] = reactions.get("-1")
-        self["laugh"] = reactions.get("laugh")
-        self["hooray"] = reactions.get("hooray")
-        self["confused"] = reactions.get("confused")
-        self["heart"] = reactions.get("heart")
-        self["rocket"] = reactions.get("rocket")
-        self["eyes"] = reactions.get("eyes")    
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data)
 
+    def get(self, key, default=None):
+        return getattr(self, self.reactions_maps.get(key, key), default)
 
-class GithubUser(dict):
+    def keys(self):
+        return tuple(self.reactions_maps.keys())
+
+
+class GithubUser(Record):
     """Github User 数据模型，方便转换到博客使用的数据类型
     """
-    def __init__(self, user: dict):
-        self._origin_data = user
+    __slots__ = ("login", "avatar_url", "user_url")
 
-        self["login"] = user.get("login")
-        self["avatar_url"] = user.get("avatar_url")
-        self["user_url"] = user.get("html_url")
+    def __init__(self, user: dict):
+        self.login = intern(user.get("login"))
+        self.avatar_url = user.get("avatar_url")
+        self.user_url = user.get("html_url")
 
 
 # 
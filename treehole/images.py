@@ -0,0 +1,251 @@
+#
+# 文章图片本地镜像，并发下载 Github 图片到按内容 hash 寻址的本地存储，并改写文章中的图片链接
+#
+
+import asyncio
+import hashlib
+import html
+import logging
+import os
+import os.path
+import re
+import struct
+import urllib.parse
+
+import tornado.httpclient
+
+from .utils import load_json_cache, save_json_cache
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.I)
+IMG_SRC_RE = re.compile(r'\ssrc="([^"]*)"', re.I)
+IMG_SIZE_RE = re.compile(r"\s(?:width|height)=", re.I)
+
+IMAGE_TYPES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/svg+xml": ".svg",
+}
+
+
+def image_size(data: bytes):
+    """返回 PNG/GIF/JPEG/WebP 图片的 (扩展名, 宽度, 高度)，只读取文件头部，无法识别时返回 (None, None, None)
+
+    - 注意：SVG 没有固定的像素尺寸，只返回扩展名
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return (".png", width, height)
+
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        width, height = struct.unpack("<HH", data[6:10])
+        return (".gif", width, height)
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return (".webp", width & 0x3fff, height & 0x3fff)
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (".webp", (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+        if chunk == b"VP8X":
+            width = int.from_bytes(data[24:27], "little") + 1
+            height = int.from_bytes(data[27:30], "little") + 1
+            return (".webp", width, height)
+        return (".webp", None, None)
+
+    if data[:2] == b"\xff\xd8":
+        # 注意：JPEG 按 segment 依次跳过，直到 SOF0-SOF15（不包括 DHT/JPG/DAC）读取尺寸
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xff:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker == 0xff:
+                i += 1
+                continue
+            if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+                i += 2
+                continue
+            length = struct.unpack(">H", data[i + 2:i + 4])[0]
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                return (".jpg", width, height)
+            i += 2 + length
+        return (".jpg", None, None)
+
+    head = data[:512].lstrip().lower()
+    if head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in head):
+        return (".svg", None, None)
+    return (None, None, None)
+
+
+class ImageMirror:
+    """将文章中指定域名的图片下载到本地，并改写 body_html/image 为带内容 hash 的本地链接
+
+    - 注意：图片按内容 sha256 保存在 `data_path/_images/` 目录，相同内容的图片只保存一份，多次构建之间复用
+    - 注意：manifest 缓存在 `data_path/_images.json`，记录 url → (sha256, 扩展名, 宽度, 高度)，已下载的链接不再重复请求
+    - 注意：同一链接只下载一次，最多 concurrency 个请求同时进行，下载失败的图片保留原始链接并在下次构建时重试
+    - 注意：输出文件名为 `images/<sha256 前 16 位>.<ext>`，内容不变时文件名不变，可以长期缓存
+    - 注意：改写后的 `<img>` 同时加上原始尺寸 width/height，页面加载图片时不会发生布局偏移
+    """
+    version = "1"
+    hosts = (
+        "user-images.githubusercontent.com",
+        "private-user-images.githubusercontent.com",
+        "raw.githubusercontent.com",
+        "camo.githubusercontent.com",
+        "github.com",
+    )
+    output_prefix = "images"
+    request_timeout = 60
+
+    def __init__(self, store_path: str, cache_path: str = None, hosts: list[str] = None, concurrency: int = 8):
+        self.store_path = store_path
+        self.cache_path = cache_path
+        self.hosts = tuple(hosts or self.hosts)
+        self.concurrency = max(1, concurrency)
+        self.images = self.load_cache() # url → dict(sha256, ext, width, height)
+        self.used = {}                  # 输出文件路径 → dict(sha256, ext, width, height)
+        self.written = set()            # 已经输出的文件路径
+
+    def load_cache(self):
+        cache = load_json_cache(self.cache_path, self.version) or {}
+        # 注意：本地存储中已经不存在的图片需要重新下载
+        return {
+            url: image for url, image in (cache.get("images") or {}).items()
+            if os.path.exists(self.store_file(image))
+        }
+
+    def save_cache(self):
+        save_json_cache(self.cache_path, self.version, { "images": self.images })
+
+    def store_file(self, image: dict):
+        digest = image["sha256"]
+        return os.path.join(self.store_path, digest[:2], f'{digest}{image["ext"]}')
+
+    def output_file(self, image: dict):
+        return f'{self.output_prefix}/{image["sha256"][:16]}{image["ext"]}'
+
+    def accept(self, url: str):
+        if not url:
+            return False
+        parsed = urllib.parse.urlparse(url)
+        return parsed.scheme in ("http", "https") and parsed.hostname in self.hosts
+
+    def post_urls(self, post):
+        """返回单一文章中需要镜像的全部图片链接，包括 image 头图以及 body_html 中的全部 `<img>`
+        """
+        urls = []
+        if self.accept(post.get("image")):
+            urls.append(post.get("image"))
+        for tag in IMG_TAG_RE.findall(post.get("body_html") or ""):
+            match = IMG_SRC_RE.search(tag)
+            if match and self.accept(html.unescape(match.group(1))):
+                urls.append(html.unescape(match.group(1)))
+        return urls
+
+    async def fetch(self, urls: list[str]):
+        """并发下载全部未下载过的图片，返回 (下载成功数, 下载失败数)
+        """
+        pending = sorted(set( url for url in urls if url not in self.images ))
+        if not pending:
+            return (0, 0)
+
+        httpclient = tornado.httpclient.AsyncHTTPClient()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_one(url: str):
+            async with semaphore:
+                try:
+                    response = await httpclient.fetch(url, request_timeout=self.request_timeout)
+                except Exception as e:
+                    logger.warning(f'fail to mirror image: {url}, exception={e}')
+                    return False
+
+            data = response.body
+            ext, width, height = image_size(data)
+            if ext is None:
+                content_type = (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                ext = IMAGE_TYPES.get(content_type)
+            if ext is None:
+                logger.warning(f'not an image: {url}')
+                return False
+
+            image = {
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "ext": ext,
+                "width": width,
+                "height": height,
+            }
+            path = self.store_file(image)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # 注意：先写入临时文件再重命名，中断时不会留下不完整的图片
+                with open(f"{path}.tmp", "wb") as fd:
+                    fd.write(data)
+                os.replace(f"{path}.tmp", path)
+            self.images[url] = image
+            return True
+
+        results = await asyncio.gather(*( fetch_one(url) for url in pending ))
+        fetched = sum(results)
+        if fetched:
+            self.save_cache()
+        return (fetched, len(results) - fetched)
+
+    def rewrite(self, post, base_url: str = None):
+        """将文章中已经下载的图片链接改写为本地链接，返回是否发生改写
+
+        - 注意：此处只使用已经下载的图片，不发起任何请求，常驻进程中可以直接同步调用
+        - 注意：头图 image 用于 og:image 需要使用包含 base_url 的完整链接
+        """
+        changed = False
+
+        def replace(match):
+            nonlocal changed
+            tag = match.group()
+            src = IMG_SRC_RE.search(tag)
+            image = src and self.images.get(html.unescape(src.group(1)))
+            if not image:
+                return tag
+            changed = True
+            self.used[self.output_file(image)] = image
+            tag = f'{tag[:src.start(1)]}/{self.output_file(image)}{tag[src.end(1):]}'
+            if image.get("width") and image.get("height") and not IMG_SIZE_RE.search(tag):
+                end = len(tag) - (2 if tag.endswith("/>") else 1)
+                head = tag[:end].rstrip()
+                tag = f'{head} width="{image["width"]}" height="{image["height"]}"{tag[len(head):]}'
+            return tag
+
+        body_html = post.get("body_html")
+        if body_html:
+            post.body_html = IMG_TAG_RE.sub(replace, body_html)
+
+        image = self.images.get(post.get("image"))
+        if image:
+            self.used[self.output_file(image)] = image
+            post.image = urllib.parse.urljoin(base_url or "/", f"/{self.output_file(image)}")
+            changed = True
+        return changed
+
+    def write(self, writer):
+        """将改写过程中使用的全部图片从本地存储复制到输出目录，优先使用硬链接，返回输出文件数量
+
+        - 注意：常驻进程中多次调用时，已经输出的图片不再重复复制
+        """
+        for filepath, image in self.used.items():
+            if filepath in self.written:
+                continue
+            writer.copy(self.store_file(image), filepath, link=True)
+            self.written.add(filepath)
+        return len(self.used)
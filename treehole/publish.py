@@ -0,0 +1,338 @@
+#
+# 发布 output_dir 到 S3 兼容的对象存储，只上传新增/修改的文件并删除已经不存在的文件
+#
+
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import mimetypes
+import os
+import os.path
+import re
+import urllib.parse
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+import tornado.httpclient
+
+from .assets import AssetPipeline
+from .utils import load_json_cache, save_json_cache
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+def sigv4_headers(method: str, url: str, headers: dict, payload_hash: str,
+    access_key: str, secret_key: str, region: str, service: str = "s3", now: datetime.datetime = None):
+    """返回 AWS Signature Version 4 签名之后的全部请求头，包括 Authorization/x-amz-date/x-amz-content-sha256
+
+    - 注意：headers 中的全部请求头均参与签名，Host 按请求链接自动加入
+    - 注意：S3 的路径只编码一次，其余服务需要编码两次，此处只用于 S3
+
+    docs: https://docs.aws.amazon.com/AmazonS3/latest/API/sig-v4-header-based-auth.html
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+
+    parsed = urllib.parse.urlsplit(url)
+    headers = {
+        **headers,
+        "Host": parsed.netloc,
+        "x-amz-date": amz_date,
+        "x-amz-content-sha256": payload_hash,
+    }
+    canonical_headers = sorted( (key.lower(), " ".join(str(value).split())) for key, value in headers.items() )
+    signed_headers = ";".join( key for key, _ in canonical_headers )
+
+    query = urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+    canonical_query = "&".join(
+        f'{urllib.parse.quote(key, safe="-_.~")}={urllib.parse.quote(value, safe="-_.~")}'
+        for key, value in sorted(query)
+    )
+    canonical_request = "\n".join([
+        method,
+        urllib.parse.quote(urllib.parse.unquote(parsed.path) or "/", safe="/-_.~"),
+        canonical_query,
+        "".join( f"{key}:{value}\n" for key, value in canonical_headers ),
+        signed_headers,
+        payload_hash,
+    ])
+
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+
+    key = f"AWS4{secret_key}".encode("utf-8")
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    headers["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return headers
+
+
+class S3Client:
+    """S3 兼容对象存储的最小异步客户端，只实现发布需要的 GET/PUT/批量删除，使用 path-style 链接
+
+    - 注意：endpoint 格式为 `https://s3.<region>.amazonaws.com`，MinIO/R2 等服务直接使用其 endpoint 即可
+    """
+    user_agent = "python-treehole-publish"
+    request_timeout = 60
+    retries = 2
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str, region: str = "us-east-1"):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+
+    def url(self, key: str = "", query: str = ""):
+        url = f'{self.endpoint}/{self.bucket}/{urllib.parse.quote(key, safe="/-_.~")}'
+        return f"{url}?{query}" if query else url
+
+    async def fetch(self, method: str, url: str, body: bytes = None, headers: dict = None):
+        """发送签名请求，5xx/网络错误时重试，返回 tornado.httpclient.HTTPResponse
+
+        - 注意：404 等 4xx 错误直接返回 response 由调用者处理，不抛出异常
+        """
+        httpclient = tornado.httpclient.AsyncHTTPClient()
+        payload_hash = hashlib.sha256(body or b"").hexdigest()
+        for attempt in range(self.retries + 1):
+            request = tornado.httpclient.HTTPRequest(url=url,
+                method=method,
+                headers=sigv4_headers(method, url, headers or {}, payload_hash, self.access_key, self.secret_key, self.region),
+                body=body,
+                user_agent=self.user_agent,
+                request_timeout=self.request_timeout,
+                decompress_response=False,
+                allow_nonstandard_methods=True,
+            )
+            try:
+                response = await httpclient.fetch(request, raise_error=False)
+                if response.code < 500:
+                    return response
+                error = f"code={response.code}"
+            except (OSError, tornado.httpclient.HTTPClientError) as e:
+                # 注意：raise_error=False 时连接失败/超时等错误仍然会抛出异常
+                if attempt == self.retries:
+                    raise
+                response = None
+                error = f"exception={e}"
+            logger.warning(f's3 request failed, method={method}, url={url}, {error}, attempt={attempt + 1}')
+            if attempt < self.retries:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        return response
+
+    async def get_object(self, key: str):
+        response = await self.fetch("GET", self.url(key))
+        if response.code == 404:
+            return None
+        if response.code != 200:
+            raise RuntimeError(f's3 get_object error, key={key}, code={response.code}, body={response.body[:200]!r}')
+        return response.body
+
+    async def put_object(self, key: str, body: bytes, headers: dict = None):
+        response = await self.fetch("PUT", self.url(key), body=body, headers={
+            "Content-Length": str(len(body)),
+            **(headers or {})
+        })
+        if response.code != 200:
+            raise RuntimeError(f's3 put_object error, key={key}, code={response.code}, body={response.body[:200]!r}')
+
+    async def delete_objects(self, keys: list[str]):
+        """批量删除，每次请求最多 1000 个 key，返回删除失败的 key 列表
+        """
+        failed = []
+        for i in range(0, len(keys), 1000):
+            body = "".join([
+                '<?xml version="1.0" encoding="UTF-8"?><Delete><Quiet>true</Quiet>',
+                *( f"<Object><Key>{escape(key)}</Key></Object>" for key in keys[i:i + 1000] ),
+                "</Delete>",
+            ]).encode("utf-8")
+            response = await self.fetch("POST", self.url(query="delete="), body=body, headers={
+                "Content-Type": "application/xml",
+                "Content-MD5": base64.b64encode(hashlib.md5(body).digest()).decode(),
+            })
+            if response.code != 200:
+                raise RuntimeError(f's3 delete_objects error, code={response.code}, body={response.body[:200]!r}')
+            # 注意：Quiet 模式下只返回删除失败的 key
+            for element in ET.fromstring(response.body).iter():
+                if element.tag.endswith("Error"):
+                    key = next(( child.text for child in element if child.tag.endswith("Key") ), None)
+                    if key is not None:
+                        failed.append(key)
+        return failed
+
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+    ".xml": "application/xml; charset=utf-8",
+    ".txt": "text/plain; charset=utf-8",
+    ".svg": "image/svg+xml",
+}
+HASHED_FILE_RE = re.compile(r"(\.[0-9a-f]{12}\.(css|js)$|^images/[0-9a-f]{16}\.\w+$)")
+
+
+def object_headers(key: str):
+    """返回每个文件类型对应的 Content-Type/Cache-Control
+
+    - 注意：带内容 hash 的 CSS/JS 以及本地镜像图片内容永远不会改变，使用 immutable 长期缓存
+    - 注意：sw.js/precache.json/counters.json 需要浏览器每次确认是否修改
+    - 注意：页面/feedmap/sitemap/JSON 内容随时可能修改，使用 max-age=0 并由 ETag 确认
+    """
+    ext = os.path.splitext(key)[1].lower()
+    content_type = CONTENT_TYPES.get(ext) or mimetypes.guess_type(key)[0]
+    if content_type is None:
+        content_type = "text/plain; charset=utf-8" if not ext else "application/octet-stream"
+
+    if HASHED_FILE_RE.search(key):
+        cache_control = AssetPipeline.cache_control
+    elif os.path.basename(key) in ("sw.js", "precache.json", "counters.json"):
+        cache_control = "no-cache"
+    elif ext in (".html", ".xml", ".json") or not ext:
+        cache_control = "public, max-age=0, must-revalidate"
+    else:
+        cache_control = "public, max-age=3600"
+    return { "Content-Type": content_type, "Cache-Control": cache_control }
+
+
+class S3Publisher:
+    """将 output_dir 同步到 S3 兼容的对象存储
+
+    - 注意：远端 `<prefix>.treehole-manifest.json` 记录全部已上传文件的 (sha256, Content-Type, Cache-Control)，只上传新增或者修改的文件
+    - 注意：本地 `data_path/_publish.json` 按 (size, mtime) 缓存文件 sha256，未修改的文件无需重新读取计算
+    - 注意：最多 concurrency 个上传请求同时进行，首先上传页面之外的文件，再上传页面，最后删除已经不存在的文件，
+        同步过程中新页面引用的静态文件均已存在
+    - 注意：部分上传失败时 manifest 只记录上传成功的文件，下次发布时重新上传失败的文件
+    """
+    version = 1
+    manifest_name = ".treehole-manifest.json"
+    page_exts = (".html", ".xml", ".json")
+
+    def __init__(self, client: S3Client, output_dir: str, prefix: str = "", concurrency: int = 8, cache_path: str = None):
+        self.client = client
+        self.output_dir = output_dir
+        self.prefix = f'{prefix.strip("/")}/' if prefix and prefix.strip("/") else ""
+        self.concurrency = max(1, concurrency)
+        self.cache_path = cache_path
+
+    def load_cache(self):
+        cache = load_json_cache(self.cache_path, self.version) or {}
+        return cache.get("files") or {}
+
+    def save_cache(self, files: dict):
+        save_json_cache(self.cache_path, self.version, { "files": files })
+
+    def local_files(self):
+        """返回 key → [sha256, Content-Type, Cache-Control]
+        """
+        cache = self.load_cache()
+        updated = {}
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.output_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.output_dir).replace(os.sep, "/")
+                stat = os.stat(path)
+                cached = cache.get(name)
+                if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                    digest = cached[2]
+                else:
+                    with open(path, "rb") as fd:
+                        digest = hashlib.sha256(fd.read()).hexdigest()
+                updated[name] = [stat.st_size, stat.st_mtime_ns, digest]
+                headers = object_headers(name)
+                files[self.prefix + name] = [digest, headers["Content-Type"], headers["Cache-Control"]]
+
+        if updated != cache:
+            self.save_cache(updated)
+        return files
+
+    async def remote_manifest(self):
+        body = await self.client.get_object(self.prefix + self.manifest_name)
+        if body is None:
+            return {}
+        try:
+            manifest = json.loads(body)
+        except ValueError:
+            logger.warning(f'invalid remote manifest, all files will be uploaded')
+            return {}
+        if manifest.get("version") != self.version:
+            return {}
+        return manifest.get("files") or {}
+
+    async def publish(self):
+        """同步 output_dir 到对象存储，返回 (上传数量, 删除数量, 未修改数量)
+        """
+        local = self.local_files()
+        remote = await self.remote_manifest()
+        uploads = [ key for key, entry in local.items() if remote.get(key) != entry ]
+        deletes = sorted( key for key in remote if key not in local )
+        logger.info(
+            f'publish diff, local={len(local)}, remote={len(remote)}, '
+            f'upload={len(uploads)}, delete={len(deletes)}, unchanged={len(local) - len(uploads)}'
+        )
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        manifest = dict(remote)
+        failed = []
+
+        async def upload(key: str):
+            digest, content_type, cache_control = local[key]
+            async with semaphore:
+                try:
+                    with open(os.path.join(self.output_dir, key[len(self.prefix):]), "rb") as fd:
+                        body = fd.read()
+                    await self.client.put_object(key, body, {
+                        "Content-Type": content_type,
+                        "Cache-Control": cache_control,
+                    })
+                except Exception as e:
+                    logger.warning(f'fail to upload: {key}, exception={e}')
+                    failed.append(key)
+                    return
+            manifest[key] = local[key]
+
+        pages = [ key for key in uploads if key.endswith(self.page_exts) ]
+        others = [ key for key in uploads if not key.endswith(self.page_exts) ]
+        try:
+            for keys in (others, pages):
+                await asyncio.gather(*( upload(key) for key in keys ))
+
+            if deletes and not failed:
+                errors = set(await self.client.delete_objects(deletes))
+                for key in deletes:
+                    if key not in errors:
+                        manifest.pop(key, None)
+                failed.extend(errors)
+        finally:
+            if manifest != remote:
+                await self.client.put_object(
+                    self.prefix + self.manifest_name,
+                    json.dumps({ "version": self.version, "files": manifest }, sort_keys=True).encode("utf-8"),
+                    { "Content-Type": "application/json", "Cache-Control": "no-cache" }
+                )
+
+        if failed:
+            raise RuntimeError(f'publish failed, items={len(failed)}, keys={",".join(failed[:10])}')
+        logger.info(f'publish finished, uploaded={len(uploads)}, deleted={len(deletes)}')
+        return (len(uploads), len(deletes), len(local) - len(uploads))
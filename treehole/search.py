@@ -0,0 +1,216 @@
+#
+# 站内全文搜索，构建阶段生成按词项前缀分片的倒排索引，app.js 只按需加载查询需要的分片
+#
+
+import collections
+import html
+import json
+import logging
+import re
+import unicodedata
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+# 注意：此处的分词规则必须与 app.js 中 search_tokenize 完全一致
+# 注意：拉丁字母/数字按整词切分，中日韩文字按连续两字（bigram）切分，单独一个中日韩文字则保留单字
+LATIN_RE = r"[0-9a-z\u00c0-\u024f]+"
+CJK_RE = r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+"
+TOKEN_RE = re.compile(f"{LATIN_RE}|{CJK_RE}")
+CJK_CHAR_RE = re.compile(CJK_RE)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def tokenize(text: str):
+    """返回文本全部的词项，中日韩文字按 bigram 切分
+
+    - 注意：拉丁字母词项长度为 2-32 个字符，更短/更长的（比如各种 hash 值）均直接忽略
+    """
+    tokens = []
+    if not text:
+        return tokens
+
+    text = unicodedata.normalize("NFKC", text).lower()
+    for match in TOKEN_RE.finditer(text):
+        token = match.group()
+        if CJK_CHAR_RE.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        elif 2 <= len(token) <= 32:
+            tokens.append(token)
+    return tokens
+
+
+def html_text(html_text: str):
+    """返回 HTML 片段中的纯文本内容
+    """
+    return html.unescape(TAG_RE.sub(" ", html_text or ""))
+
+
+class SearchIndex:
+    """站内搜索倒排索引，按词项首字符分片输出到 `search/` 目录
+
+    - 注意：`search/meta.json` 为索引参数，`search/<shard>.json` 为倒排索引分片，`search/d<n>.json` 为文章信息分片
+        - 拉丁字母/数字词项按前两个字符分片，比如 `python` 位于 `search/py.json`
+        - 中日韩文字等其余词项按首字符 Unicode 码位取模分片，比如 `中文` 位于 `search/u2d.json`
+    - 注意：倒排索引中每个词项为 [post_id 差值, 得分, post_id 差值, 得分, ...] 的扁平数组，post_id 递增排列
+    - 注意：索引按文章增量更新，只有 updated_at 发生变化的文章才会重新分词，只有发生变化的分片才会重新输出
+    - 注意：cache 为 store 中缓存的分词结果，未修改的文章直接使用而无需重新分词
+    """
+    version = "1"
+    weights = (("title", 10), ("summary", 3), ("body", 1))
+    shard_buckets = 256
+    docs_chunk = 500
+
+    def __init__(self, cache: dict = None):
+        self.cache = cache or {}                         # post.id → dict(updated_at, terms)
+        self.cache_updates = []                          # 本次重新分词的结果，需要写回 store
+        self.docs = {}                                   # post.id → [title, permanent_url, date]
+        self.terms = {}                                  # post.id → { term → score }
+        self.updated_at = {}                             # post.id → updated_at
+        self.postings = collections.defaultdict(dict)    # term → { post.id → score }
+        self.dirty_shards = set()
+        self.dirty_docs = set()
+        self.written = False
+
+    @classmethod
+    def shard_name(cls, term: str):
+        """返回词项所在的分片名称，拉丁字母/数字词项按前两个字符分片，其余按首字符码位取模分片
+        """
+        prefix = term[:2]
+        if len(prefix) == 2 and all("0" <= char <= "9" or "a" <= char <= "z" for char in prefix):
+            return prefix
+        return f"u{ord(term[0]) % cls.shard_buckets:02x}"
+
+    @classmethod
+    def make_terms(cls, post):
+        """返回单一文章全部词项及其得分，标题/简介/正文中出现的词项按不同权重累加
+        """
+        texts = {
+            "title": post.get("title"),
+            "summary": post.get("summary"),
+            "body": html_text(post.get("body_html")),
+        }
+        terms = collections.Counter()
+        for field, weight in cls.weights:
+            for token in tokenize(texts[field]):
+                terms[token] += weight
+        return dict(terms)
+
+    def add(self, post):
+        """新增/更新单一文章，返回是否发生变化
+        """
+        doc = [ post.get("title"), post.get("permanent_url"), post.datetime.strftime("%Y-%m-%d") ]
+        if self.updated_at.get(post.id) == post.updated_at and self.docs.get(post.id) == doc:
+            return False
+
+        self.remove(post.id)
+
+        cached = self.cache.get(post.id)
+        if cached is not None and cached.get("updated_at") == post.updated_at:
+            terms = cached.get("terms")
+        else:
+            terms = self.make_terms(post)
+            self.cache[post.id] = { "updated_at": post.updated_at, "terms": terms }
+            self.cache_updates.append({ "number": post.id, "updated_at": post.updated_at, "terms": terms })
+
+        self.docs[post.id] = doc
+        self.terms[post.id] = terms
+        self.updated_at[post.id] = post.updated_at
+        for term, score in terms.items():
+            self.postings[term][post.id] = score
+            self.dirty_shards.add(self.shard_name(term))
+        self.dirty_docs.add(post.id // self.docs_chunk)
+        return True
+
+    def remove(self, post_id: int):
+        terms = self.terms.pop(post_id, None)
+        if terms is None:
+            return False
+
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(post_id, None)
+            if not postings:
+                del self.postings[term]
+            self.dirty_shards.add(self.shard_name(term))
+        self.docs.pop(post_id, None)
+        self.updated_at.pop(post_id, None)
+        self.dirty_docs.add(post_id // self.docs_chunk)
+        return True
+
+    def update(self, posts: list):
+        """将索引同步为 posts 全部文章，返回 (新增/更新文章数, 删除文章数)
+        """
+        ids = set()
+        added = 0
+        for post in posts:
+            ids.add(post.id)
+            added += self.add(post)
+
+        removed = 0
+        for post_id in [ post_id for post_id in self.terms if post_id not in ids ]:
+            removed += self.remove(post_id)
+        return (added, removed)
+
+    def write(self, writer):
+        """只输出发生变化的索引分片，首次输出全部分片，返回输出文件数量
+        """
+        shards = collections.defaultdict(dict)
+        for term, postings in self.postings.items():
+            shard = self.shard_name(term)
+            if not self.written or shard in self.dirty_shards:
+                shards[shard][term] = postings
+
+        chunks = collections.defaultdict(dict)
+        for post_id, doc in self.docs.items():
+            chunk = post_id // self.docs_chunk
+            if not self.written or chunk in self.dirty_docs:
+                chunks[chunk][post_id] = doc
+
+        count = 0
+        if not self.written:
+            writer.write("./search/meta.json", self.dumps({
+                "version": self.version,
+                "buckets": self.shard_buckets,
+                "chunk": self.docs_chunk,
+            }))
+            count += 1
+
+        # 注意：分片中的词项全部删除之后仍然输出空分片，避免客户端读取到过期的分片
+        for shard in (self.dirty_shards if self.written else shards.keys()):
+            terms = shards.get(shard, {})
+            writer.write(f"./search/{shard}.json", self.dumps({
+                term: self.encode(terms[term]) for term in sorted(terms)
+            }))
+            count += 1
+
+        for chunk in (self.dirty_docs if self.written else chunks.keys()):
+            docs = chunks.get(chunk, {})
+            writer.write(f"./search/d{chunk}.json", self.dumps({
+                str(post_id): docs[post_id] for post_id in sorted(docs)
+            }))
+            count += 1
+
+        logger.info(f'search index, docs={len(self.docs)}, terms={len(self.postings)}, files={count}')
+        self.dirty_shards.clear()
+        self.dirty_docs.clear()
+        self.written = True
+        return count
+
+    def encode(self, postings: dict):
+        values = []
+        last = 0
+        for post_id in sorted(postings):
+            values.append(post_id - last)
+            values.append(postings[post_id])
+            last = post_id
+        return values
+
+    def dumps(self, data):
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,723 @@
+#
+# 常驻进程模式，接收 Github Webhook 并且只重新渲染受影响的页面
+# python -m treehole serve
+#
+# 内存预览服务器，修改模板/缓存数据之后只重新渲染受影响的页面
+# python -m treehole --preview
+#
+
+import asyncio
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import mimetypes
+import os
+import os.path
+import posixpath
+import re
+import time
+
+import tornado.ioloop
+import tornado.web
+
+from .github import GithubIssue, GithubComment
+from .search import SearchIndex
+from .store import TreeHoleStore
+from .treehole import (
+    TreeHoleApp, TreeHolePost, TreeHoleComment, TreeHoleRenderer,
+    IndexArchive, DailyArchive, MonthlyArchive, YearlyArchive, PostArchive,
+    markdown_extract
+)
+from .utils import Record
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+class TreeHoleServer:
+    """TreeHole 常驻进程，全部文章/评论/编译好的模板均常驻内存
+
+    - 注意：启动时首先执行一次完整构建，此后只处理 Github Webhook 的 issues/issue_comment 事件
+    - 注意：issue 修改时只重新渲染该文章、前后相邻文章、所在 daily/monthly/yearly 归档、首页以及 feedmap/sitemap
+    - 注意：comment 修改时只重新渲染该文章页面，评论只出现在文章页面中
+        启用评论分页片段时同时重新输出该文章全部评论分页片段，并删除多余的分页片段
+    - 注意：其他文章页面的相似文章（related_posts）列表中引用了该文章时，同时重新渲染这些页面，避免出现过期/失效的链接
+        修改之后才新进入其他文章相似文章列表的情况，由下一次完整构建更新
+    - 注意：全部事件在 IOLoop 中依次同步处理，不存在并发修改内存数据的情况
+    """
+    def __init__(self, app: TreeHoleApp):
+        self.app = app
+        self.settings = app.settings
+
+        self.posts = {}                                 # post.id → TreeHolePost
+        self.comments = collections.defaultdict(dict)   # post.id → { comment.id → TreeHoleComment }
+        self.ordered = []                               # 按照时间从最新到最旧排序的全部 posts
+        self.renderers = {}                             # locale_code → TreeHoleRenderer
+        self.related = {}                               # post.id → 相似文章 post.id 列表
+        self.related_by = collections.defaultdict(set)  # post.id → 相似文章列表中包含该文章的 post.id 集合
+        self.store = None
+
+    def warm_up(self):
+        """完整构建一次网站，并将构建使用的数据保留在内存中
+        """
+        if self.settings.get("shard") or self.settings.get("merge_shards"):
+            raise ValueError(f'serve mode can not be used with shard/merge_shards')
+        if self.settings.get("output_artifact"):
+            raise ValueError(f'serve mode can not be used with output_artifact')
+        if self.settings.get("github_repos"):
+            raise ValueError(f'serve mode can not be used with github_repos')
+
+        posts, comments = self.app.run()
+        for post in posts:
+            self.posts[post.id] = post
+        for comment in comments:
+            self.comments[comment.post_id][comment.id] = comment
+        self.ordered = self.sort_posts()
+
+        # 注意：此处使用全量两两计算得到全部文章当前的相似文章列表
+        for page in PostArchive(self.ordered, []):
+            template_vars = page["template_vars"]
+            self.set_related(template_vars["post"].id, template_vars["related_posts"])
+
+        # 注意：每个 locale 各自常驻一个 renderer 模板只在第一次使用时编译
+        self.renderers = {
+            locale_code: TreeHoleRenderer(self.settings, locale_code)
+            for locale_code in self.app.locales()
+        }
+
+        # 注意：只有本地缓存文件存在时才写回 store，保证重启之后的数据与 Webhook 修改一致
+        cache_store = self.settings.get("cache_store")
+        if cache_store and os.path.exists(cache_store):
+            self.store = TreeHoleStore(cache_store)
+
+        logger.info(f'serve warm up, posts={len(self.posts)}, locales={",".join(self.renderers.keys())}')
+
+    def sort_posts(self):
+        # 注意：此处先按 issue_number 排序再按时间排序，保证与完整构建中相同时间文章的顺序一致
+        posts = sorted(self.posts.values(), key=lambda post: post.id)
+        return sorted(posts, key=lambda post: post.datetime, reverse=True)
+
+    def sort_comments(self, post_id: int):
+        comments = sorted(self.comments[post_id].values(), key=lambda comment: comment.id)
+        return sorted(comments, key=lambda comment: comment.datetime, reverse=True)
+
+    def set_related(self, post_id: int, related_posts: list[TreeHolePost]):
+        for related_id in self.related.pop(post_id, ()):
+            self.related_by[related_id].discard(post_id)
+        if related_posts:
+            self.related[post_id] = [ post.id for post in related_posts ]
+            for related_id in self.related[post_id]:
+                self.related_by[related_id].add(post_id)
+
+    def verify_signature(self, body: bytes, signature: str):
+        """校验 Github Webhook 的 X-Hub-Signature-256 签名
+
+        docs: https://docs.github.com/webhooks/using-webhooks/validating-webhook-deliveries
+        """
+        secret = self.settings.get("webhook_secret")
+        if not secret or not signature:
+            return False
+
+        expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def handle(self, event: str, payload: dict):
+        """处理单一 Github Webhook 事件，返回本次处理的统计结果
+        """
+        started = time.perf_counter()
+        action = payload.get("action")
+        result = { "event": event, "action": action, "rendered": 0, "removed": 0 }
+
+        # 注意：只处理当前仓库的事件，其余仓库的事件直接忽略
+        full_name = (payload.get("repository") or {}).get("full_name")
+        if full_name and full_name != f'{self.settings.get("github_owner")}/{self.settings.get("github_repo")}':
+            logger.warning(f'webhook ignored, repository={full_name}')
+            result["ignored"] = True
+            return result
+
+        if event == "issues":
+            issue = payload.get("issue")
+            result["number"] = issue.get("number")
+            # 注意：删除/转移到其他仓库的 issue 均视为删除
+            if action in ("deleted", "transferred"):
+                rendered, removed = self.remove_issue(issue.get("number"))
+            else:
+                rendered, removed = self.update_issue(GithubIssue(issue))
+                # 注意：备份只写入内容发生变化的文章，此处只需传入当前文章
+                if issue.get("number") in self.posts:
+                    self.app.backup([self.posts[issue.get("number")]], [])
+
+        elif event == "issue_comment":
+            comment = GithubComment(payload.get("comment"))
+            result["number"] = comment.issue_number
+            rendered, removed = self.update_comment(comment, deleted=(action == "deleted"))
+
+        else:
+            # 注意：ping 等其他事件无需处理
+            result["ignored"] = True
+            return result
+
+        # 注意：reactions 变化不会触发 Webhook，此处只同步 issue/comment 增删导致的数量变化
+        if self.settings.get("counters"):
+            comments = [
+                comment for post_id, comments in self.comments.items() if post_id in self.posts
+                for comment in comments.values()
+            ]
+            self.app.render_counters(self.ordered, comments)
+
+        result["rendered"] = rendered
+        result["removed"] = removed
+        result["elapsed"] = round((time.perf_counter() - started) * 1000, 3)
+        logger.info(f'webhook handled, {", ".join(f"{k}={v}" for k, v in result.items())}')
+        return result
+
+    def update_issue(self, issue: GithubIssue):
+        if self.store:
+            self.store.save_issues([issue])
+
+        # 注意：此处筛选条件与完整构建一致，只有仓库拥有者创建的 open 状态 issue 才会出现在网站中
+        if not self.app.is_published(issue):
+            return self.replace_post(self.posts.get(issue.issue_number), None)
+
+        body_html, extraction = markdown_extract(issue.body)
+        rendered = {
+            "number": issue.issue_number,
+            "updated_at": issue.updated_at,
+            "body_html": body_html,
+            **extraction.to_dict()
+        }
+        if self.store:
+            self.store.save_rendered([rendered])
+
+        post = TreeHolePost(issue, rendered)
+
+        # 注意：常驻进程中不下载新图片，只改写已经下载过的图片链接，新图片在下次完整构建时下载
+        if self.app.images is not None and self.app.images.rewrite(post, self.settings.get("base_url")):
+            self.app.images.write(self.app.writer)
+
+        return self.replace_post(self.posts.get(issue.issue_number), post)
+
+    def remove_issue(self, number: int):
+        if self.store:
+            self.store.delete_issue(number)
+
+        # 注意：此处先删除页面再删除评论，删除页面时需要根据评论数量删除全部评论分页片段
+        result = self.replace_post(self.posts.get(number), None)
+        self.comments.pop(number, None)
+        return result
+
+    def update_comment(self, comment: GithubComment, deleted: bool = False):
+        """新增/修改/删除评论并重新渲染所在文章页面
+
+        - 注意：pull request/已关闭/其他用户 issue 的评论不会出现在网站中，与完整构建一致不写入本地缓存也不保存在内存中，
+            此类评论的删除事件仍然删除本地缓存中可能存在的旧评论
+        """
+        post = self.posts.get(comment.issue_number)
+        if post is None:
+            if deleted:
+                if self.store:
+                    self.store.delete_comment(comment.comment_id)
+                self.comments.get(comment.issue_number, {}).pop(comment.comment_id, None)
+            return (0, 0)
+
+        if self.store:
+            if deleted:
+                self.store.delete_comment(comment.comment_id)
+            else:
+                self.store.save_comments([comment])
+
+        old_filepaths = self.comments_filepaths(post)
+        if deleted:
+            self.comments[comment.issue_number].pop(comment.comment_id, None)
+        else:
+            self.comments[comment.issue_number][comment.comment_id] = TreeHoleComment(comment)
+
+        # 注意：评论删除之后分页数量减少时，删除多余的分页片段
+        filepaths = set(self.comments_filepaths(post))
+        result = self.render_pages(self.post_pages(post), [ filepath for filepath in old_filepaths if filepath not in filepaths ])
+
+        # 注意：JSON API 中文章及其所在列表的评论数量发生变化
+        self.update_api([post.id], [self.ordered.index(post)], self.archive_pages([post.datetime.date()]))
+        return result
+
+    def replace_post(self, old_post: TreeHolePost, new_post: TreeHolePost):
+        """使用 new_post 替换内存中的 old_post 并重新渲染受影响的页面，返回 (渲染页面数, 删除页面数)
+
+        - 注意：old_post=None 为新增文章，new_post=None 为删除/隐藏文章
+        """
+        if old_post is None and new_post is None:
+            return (0, 0)
+
+        touched = {} # post.id → TreeHolePost 需要重新渲染的文章页面
+        dates = set()
+        removed = []
+        positions = [] # 修改前后在 self.ordered 中的位置
+
+        # 修改之前的前后相邻文章
+        if old_post is not None:
+            i = self.ordered.index(old_post)
+            positions.append(i)
+            for neighbour in self.ordered[max(i - 1, 0):i + 2]:
+                touched[neighbour.id] = neighbour
+            # 相似文章列表中引用了 old_post 的文章
+            for post_id in self.related_by[old_post.id]:
+                touched[post_id] = self.posts[post_id]
+            dates.add(old_post.datetime.date())
+            del self.posts[old_post.id]
+            touched.pop(old_post.id, None)
+            self.set_related(old_post.id, [])
+
+            if new_post is None or new_post.filepath != old_post.filepath:
+                removed.append(old_post.filepath)
+                removed.extend(self.comments_filepaths(old_post))
+            if new_post is None or new_post.updated_at != old_post.updated_at:
+                for renderer in self.renderers.values():
+                    renderer.discard_post_cards(old_post.id)
+
+        if new_post is not None:
+            self.posts[new_post.id] = new_post
+            dates.add(new_post.datetime.date())
+        self.ordered = self.sort_posts()
+
+        # 修改之后的前后相邻文章
+        # 注意：此处只渲染仍然在内存中的文章，已经被替换/删除的文章对象直接跳过
+        indexes = { post.id: i for i, post in enumerate(self.ordered) }
+        if new_post is not None:
+            i = indexes[new_post.id]
+            positions.append(i)
+            for neighbour in self.ordered[max(i - 1, 0):i + 2]:
+                touched[neighbour.id] = neighbour
+        pages = [
+            page
+            for post in touched.values()
+            if self.posts.get(post.id) is post
+            for page in self.post_pages(post, indexes[post.id])
+        ]
+
+        # 所在 daily/monthly/yearly 归档页面，归档内没有文章时删除对应页面
+        archives = self.archive_pages(dates)
+        for filepath, page in archives:
+            if page is not None:
+                pages.append(page)
+            elif filepath not in removed:
+                removed.append(filepath)
+
+        # 首页
+        pages.extend(IndexArchive(self.ordered))
+
+        rendered, removed = self.render_pages(pages, removed)
+
+        # feedmap/sitemap 只在默认 locale 输出
+        self.app.render_generators(self.ordered)
+
+        # 站内搜索索引只重新输出该文章词项所在的分片
+        search_index = self.app.search_index
+        if search_index is not None:
+            if new_post is not None:
+                search_index.add(new_post)
+            else:
+                search_index.remove(old_post.id)
+            search_index.write(self.app.writer)
+            if self.store:
+                self.store.save_search_terms(search_index.cache_updates)
+            search_index.cache_updates = []
+
+        self.update_api([ post.id for post in (old_post, new_post) if post is not None ], positions, archives)
+        return (rendered, removed)
+
+    def archive_pages(self, dates: set):
+        """返回 dates 所在的 daily/monthly/yearly 归档页面 [(filepath, page)]，归档内没有文章时 page 为 None
+        """
+        archives = {}
+        for date in sorted(dates):
+            daily_posts = [ post for post in self.ordered if post.datetime.date() == date ]
+            monthly_posts = [ post for post in self.ordered if (post.datetime.year, post.datetime.month) == (date.year, date.month) ]
+            yearly_posts = [ post for post in self.ordered if post.datetime.year == date.year ]
+            for archive, archive_posts, filepath in (
+                (DailyArchive, daily_posts, f"./{date.year}/{date.month:02d}/{date.day:02d}/index.html"),
+                (MonthlyArchive, monthly_posts, f"./{date.year}/{date.month:02d}/index.html"),
+                (YearlyArchive, yearly_posts, f"./{date.year}/index.html"),
+            ):
+                # 注意：只包含单一日期/月份/年份的文章，此处只会生成一个页面
+                archives[filepath] = next(iter(archive(archive_posts))) if archive_posts else None
+        return list(archives.items())
+
+    def update_api(self, post_ids: list[int], positions: list[int], archives: list[tuple]):
+        """JSON API 只重新输出受影响的文章、`posts/` 分页以及归档分页，不再重新生成全部归档
+        """
+        static_api = self.app.static_api
+        if static_api is None:
+            return
+        comments_count = { post_id: len(comments) for post_id, comments in self.comments.items() }
+        static_api.update(self.app.writer, self.ordered, comments_count, post_ids, positions, [
+            (static_api.archive_path(filepath), static_api.archive_posts(page) if page is not None else [])
+            for filepath, page in archives
+        ])
+
+    def post_pages(self, post: TreeHolePost, i: int = None):
+        """返回单一文章页面以及该文章全部评论分页片段的页面数据
+        """
+        if i is None:
+            i = self.ordered.index(post)
+        related_posts = PostArchive.find_related(post, self.ordered)
+        self.set_related(post.id, related_posts)
+        comments = self.sort_comments(post.id)
+        comments_per_page = self.settings.get("comments_per_page") or 0
+        return [
+            PostArchive.make_page(self.ordered, i, related_posts, comments, comments_per_page),
+            *PostArchive.make_comments_pages(post, comments, comments_per_page),
+        ]
+
+    def comments_filepaths(self, post: TreeHolePost):
+        """返回单一文章当前全部评论分页片段的文件路径
+        """
+        comments_per_page = self.settings.get("comments_per_page") or 0
+        if not comments_per_page:
+            return []
+        pages = -(-len(self.comments.get(post.id, ())) // comments_per_page)
+        return [ filepath for _, _, filepath in PostArchive.comments_filepaths(post, pages) ]
+
+    def render_pages(self, pages: list[dict], removed: list[str]):
+        """在全部 locale 中重新渲染 pages 并删除 removed 对应的页面文件
+        """
+        count = 0
+        for renderer in self.renderers.values():
+            for page in pages:
+                renderer.render_page(page)
+                count += 1
+
+            for filepath in removed:
+                renderer.writer.remove(os.path.join(renderer.url_prefix.lstrip("/"), filepath))
+
+        return (count, len(removed) * len(self.renderers))
+
+    def serve(self, port=8080, bind="0.0.0.0"):
+        if not self.settings.get("webhook_secret"):
+            raise ValueError(f'webhook_secret is required for serve mode')
+
+        self.warm_up()
+
+        async def run_server():
+            app = tornado.web.Application([
+                (r"/webhook", WebhookHandler, { "server": self }),
+                *self.app.preview_handlers()
+            ])
+            app.listen(port, address=bind)
+            logger.info(f'serve started at http://{bind}:{port}, webhook=http://{bind}:{port}/webhook')
+
+            await asyncio.Event().wait()
+
+        asyncio.run(run_server())
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Github Webhook 接收入口，Content type 支持 application/json 以及 application/x-www-form-urlencoded
+    """
+    def initialize(self, server: TreeHoleServer):
+        self.server = server
+
+    def post(self):
+        # 注意：签名按原始请求内容计算，必须在解析 payload 之前校验
+        signature = self.request.headers.get("X-Hub-Signature-256")
+        if not self.server.verify_signature(self.request.body, signature):
+            raise tornado.web.HTTPError(403, "invalid signature")
+
+        event = self.request.headers.get("X-GitHub-Event")
+        try:
+            if self.request.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                payload = json.loads(self.get_body_argument("payload"))
+            else:
+                payload = json.loads(self.request.body)
+        except (ValueError, tornado.web.MissingArgumentError) as e:
+            raise tornado.web.HTTPError(400, f"invalid payload: {e}")
+
+        self.write(self.server.handle(event, payload))
+
+
+
+class MemoryWriter:
+    """将渲染结果保存在内存中，用于预览服务器直接输出，不写入 output_dir
+
+    - 注意：写入时即计算 ETag 每次请求无需重新计算
+    """
+    def __init__(self):
+        self.files = {} # filepath → (body, etag)
+
+    def key(self, filepath: str):
+        return os.path.normpath(filepath).replace(os.sep, "/")
+
+    def write(self, filepath: str, filetext: str):
+        body = filetext.encode("utf-8")
+        self.files[self.key(filepath)] = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+
+    def remove(self, filepath: str):
+        self.files.pop(self.key(filepath), None)
+
+    def get(self, filepath: str):
+        return self.files.get(self.key(filepath))
+
+
+def fingerprint(value):
+    """返回页面数据的指纹，指纹相同的页面渲染结果必然相同，无需重新渲染
+
+    - 注意：此处直接展开 Record 全部字段比较，包括 reactions 等不会改变 updated_at 的字段
+    """
+    if isinstance(value, (Record, dict)):
+        return tuple( (key, fingerprint(item)) for key, item in value.items() )
+    if isinstance(value, (list, tuple)):
+        return tuple( fingerprint(item) for item in value )
+    return value
+
+
+class TreeHolePreview:
+    """内存预览服务器，全部页面渲染到内存中直接输出，不写入 output_dir
+
+    - 注意：目录链接 `/2019/03/` 直接输出对应的 `2019/03/index.html` 无需重定向，支持 ETag/304
+    - 注意：静态文件直接从 static_path 输出，修改之后刷新即可生效，因此预览时不使用 hash_assets 的压缩文件名，也不注册 service worker
+    - 注意：定时检查模板文件和缓存数据的修改时间
+        - 模板修改之后只重新渲染使用该模板（包括 extends/include/post_card 引用）的页面
+        - 缓存数据修改之后只重新渲染页面数据指纹发生变化的页面，并删除已经不存在的页面
+    - 注意：只有 debug 状态并且本地缓存 `_treehole.sqlite3` 存在时才检查缓存数据修改
+    """
+    poll_interval = 500 # ms
+
+    def __init__(self, app: TreeHoleApp):
+        self.app = app
+        self.settings = app.settings
+
+        # 注意：此处替换 app.writer 之后 feedmap/sitemap 同样只输出到内存
+        # 注意：预览时不注册 service worker，以免缓存的旧页面/静态文件影响修改之后刷新
+        self.settings["static_urls"] = {}
+        self.settings["offline"] = False
+        self.writer = MemoryWriter()
+        self.app.writer = self.writer
+
+        self.renderers = {}    # locale_code → TreeHoleRenderer
+        self.pages = {}        # filepath → page
+        self.fingerprints = {} # filepath → 页面数据指纹
+        self.posts = {}        # post.id → 文章数据指纹
+        self.mtimes = {}       # path → mtime
+
+    def build(self):
+        """首次完整渲染全部页面到内存
+        """
+        if self.settings.get("shard") or self.settings.get("merge_shards"):
+            raise ValueError(f'preview can not be used with shard/merge_shards')
+        if self.settings.get("output_artifact"):
+            raise ValueError(f'preview can not be used with output_artifact')
+
+        started = time.perf_counter()
+        self.renderers = {
+            locale_code: TreeHoleRenderer(self.settings, locale_code, self.writer)
+            for locale_code in self.app.locales()
+        }
+        self.templates_changed()
+        self.data_changed()
+        rendered, removed = self.reload_data()
+        logger.info(f'preview build, pages={rendered}, elapsed={(time.perf_counter() - started) * 1000:.3f}ms')
+
+    def reload_data(self):
+        """重新加载数据，只重新渲染数据指纹发生变化的页面，返回 (渲染页面数, 删除页面数)
+        """
+        posts, comments = self.app.load_data()
+        archives = [
+            IndexArchive(posts),
+            DailyArchive(posts),
+            MonthlyArchive(posts),
+            YearlyArchive(posts),
+            PostArchive(posts, comments, self.settings.get("comments_per_page") or 0),
+        ]
+        pages = { page["filepath"]: page for archive in archives for page in archive }
+        fingerprints = { filepath: fingerprint(page["template_vars"]) for filepath, page in pages.items() }
+
+        # 注意：文章卡片片段按 updated_at 缓存，此处丢弃内容发生变化的文章的全部卡片片段
+        posts_fingerprints = { post.id: fingerprint(post) for post in posts }
+        for post_id, value in self.posts.items():
+            if posts_fingerprints.get(post_id) != value:
+                for renderer in self.renderers.values():
+                    renderer.discard_post_cards(post_id)
+
+        changed = [
+            page for filepath, page in pages.items()
+            if self.fingerprints.get(filepath) != fingerprints[filepath]
+        ]
+        removed = [ filepath for filepath in self.pages if filepath not in pages ]
+
+        self.pages = pages
+        self.fingerprints = fingerprints
+        self.posts = posts_fingerprints
+        self.app.render_generators(posts)
+        if self.settings.get("counters"):
+            self.app.render_counters(posts, comments)
+        if self.settings.get("json_api"):
+            self.app.render_api(posts, comments)
+
+        # 站内搜索索引只重新输出发生变化的分片
+        if self.settings.get("search"):
+            if self.app.search_index is None:
+                self.app.search_index = SearchIndex()
+            self.app.search_index.update(posts)
+            self.app.search_index.write(self.writer)
+        return self.render_pages(changed, removed)
+
+    def render_pages(self, pages: list[dict], removed: list[str]):
+        count = 0
+        for renderer in self.renderers.values():
+            for page in pages:
+                renderer.render_page(page)
+                count += 1
+            for filepath in removed:
+                renderer.writer.remove(os.path.join(renderer.url_prefix.lstrip("/"), filepath))
+        return (count, len(removed) * len(self.renderers))
+
+    def template_dependencies(self):
+        """返回每个模板直接/间接引用的全部模板名称
+
+        - 注意：此处只解析 extends/include 以及 post_card() 对 card.html 的引用
+        """
+        template_path = self.settings.get("template_path")
+        references = {}
+        for name in os.listdir(template_path):
+            if not name.endswith(".html"):
+                continue
+            with open(os.path.join(template_path, name), "rt") as fd:
+                text = fd.read()
+            names = set(re.findall(r'{%\s*(?:extends|include)\s+["\']([^"\']+)["\']', text))
+            if "post_card(" in text:
+                names.add(TreeHoleRenderer.card_template)
+            references[name] = names
+
+        dependencies = {}
+        for name in references:
+            seen, stack = set(), [name]
+            while stack:
+                current = stack.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                stack.extend(references.get(current, ()))
+            dependencies[name] = seen
+        return dependencies
+
+    def changed_files(self, paths: list[str]):
+        """返回修改时间发生变化的文件，首次检查的文件同样视为修改
+        """
+        changed = []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if self.mtimes.get(path, -1) != mtime:
+                self.mtimes[path] = mtime
+                changed.append(path)
+        return changed
+
+    def templates_changed(self):
+        template_path = self.settings.get("template_path")
+        paths = [ os.path.join(template_path, name) for name in sorted(os.listdir(template_path)) ]
+        return [ os.path.basename(path) for path in self.changed_files(paths) ]
+
+    def data_changed(self):
+        cache_store = self.settings.get("cache_store")
+        if not (self.settings.get("debug") and cache_store and os.path.exists(cache_store)):
+            return False
+        # 注意：sqlite3 使用 WAL 模式，写入首先落在 -wal 文件中，此处需要同时检查
+        return bool(self.changed_files([ cache_store, f"{cache_store}-wal" ]))
+
+    def check(self):
+        """定时检查模板/缓存数据修改，并重新渲染受影响的页面
+        """
+        templates = set(self.templates_changed())
+        data = self.data_changed()
+        if not templates and not data:
+            return
+
+        started = time.perf_counter()
+        rendered, removed = (0, 0)
+        if templates:
+            # 注意：模板修改之后需要重置 Loader 中已经编译的模板，卡片模板修改则需要丢弃全部卡片片段
+            for renderer in self.renderers.values():
+                renderer.loader.reset()
+                if TreeHoleRenderer.card_template in templates:
+                    renderer.fragments = {}
+
+            dependencies = self.template_dependencies()
+            pages = [
+                page for page in self.pages.values()
+                if dependencies.get(page["template_name"], { page["template_name"] }) & templates
+            ]
+            rendered, removed = self.render_pages(pages, [])
+
+        if data:
+            data_rendered, removed = self.reload_data()
+            rendered += data_rendered
+
+        logger.info(
+            f'preview rebuild, templates={",".join(sorted(templates))}, data={data}, '
+            f'rendered={rendered}, removed={removed}, elapsed={(time.perf_counter() - started) * 1000:.3f}ms'
+        )
+
+    def resolve(self, path: str):
+        """返回请求路径对应的 (filepath, body, etag)，目录路径直接对应其中的 index.html
+        """
+        path = path.strip("/")
+        candidates = [ path ] if path else []
+        candidates.append(posixpath.join(path, "index.html"))
+        for filepath in candidates:
+            hit = self.writer.get(filepath)
+            if hit is not None:
+                return (filepath, *hit)
+
+        # 注意：静态文件不渲染到内存，直接从 static_path 读取，并且禁止访问 static_path 之外的文件
+        static_path = os.path.abspath(self.settings.get("static_path"))
+        filepath = os.path.abspath(os.path.join(static_path, path))
+        if filepath.startswith(static_path + os.sep) and os.path.isfile(filepath):
+            with open(filepath, "rb") as fd:
+                body = fd.read()
+            return (path, body, f'"{hashlib.sha1(body).hexdigest()}"')
+        return None
+
+    def serve(self, port=8080, bind="0.0.0.0"):
+        self.build()
+
+        async def run_preview():
+            app = tornado.web.Application([
+                (r"/(.*)", PreviewHandler, { "preview": self })
+            ])
+            app.listen(port, address=bind)
+            tornado.ioloop.PeriodicCallback(self.check, self.poll_interval).start()
+            logger.info(f'preview server started at http://{bind}:{port}')
+
+            await asyncio.Event().wait()
+
+        asyncio.run(run_preview())
+
+
+class PreviewHandler(tornado.web.RequestHandler):
+    """内存预览输出，ETag 在写入内存时已经计算，If-None-Match 匹配时由 tornado 直接返回 304
+    """
+    def initialize(self, preview: TreeHolePreview):
+        self.preview = preview
+        self.etag = None
+
+    def compute_etag(self):
+        return self.etag
+
+    def get(self, path: str):
+        resolved = self.preview.resolve(path)
+        if resolved is None:
+            raise tornado.web.HTTPError(404)
+
+        filepath, body, self.etag = resolved
+        content_type, _ = mimetypes.guess_type(filepath)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type.endswith("xml"):
+            content_type = f"{content_type}; charset=UTF-8"
+        self.set_header("Content-Type", content_type)
+        self.set_header("Cache-Control", "no-cache")
+        self.write(body)
@@ -45,19 +45,169 @@ const sort_comments = (selector = ".comments", order = "asc") => {
 const sort_comments_oldest_first = (btn = "oldest-first") => {
     const element = document.getElementById(btn)
     element && element.addEventListener("click", event => {
-        sort_comments(".comments", "asc")
+        lazy_comments_reorder ? lazy_comments_reorder("asc") : sort_comments(".comments", "asc")
     })
 }
 const sort_comments_newest_first = (btn = "newest-first") => {
     const element = document.getElementById(btn)
     element && element.addEventListener("click", event => {
-        sort_comments(".comments", "desc")
+        lazy_comments_reorder ? lazy_comments_reorder("desc") : sort_comments(".comments", "desc")
     })
 }
 on_dom_content_loaded(sort_comments_oldest_first)
 on_dom_content_loaded(sort_comments_newest_first)
 
 
+// lazy_comments
+// 注意：评论分页片段在构建时预先生成 desc（按最新排序）/asc（按最旧排序）两种排序，切换排序时直接加载对应的分页片段
+let lazy_comments_reorder = null
+const lazy_comments = (selector = ".comments[data-url]") => {
+    const element = document.querySelector(selector)
+    const more = element && element.querySelector(".comments-more")
+    if (!more) {
+        return
+    }
+    const url = element.dataset.url
+    const pages = parseInt(element.dataset.pages, 10)
+    const state = { order: "desc", page: 0, loading: null, visible: false }
+
+    const fetch_page = async () => {
+        const order = state.order
+        const response = await fetch(`${url}${order}-${state.page + 1}.html`)
+        if (!response.ok) {
+            throw new Error(`fail to load comments, status=${response.status}`)
+        }
+        const html = await response.text()
+        // 注意：加载过程中切换了排序时，直接丢弃旧排序的分页片段
+        if (order === state.order) {
+            more.insertAdjacentHTML("beforebegin", html)
+            state.page += 1
+            counters_hydrate(element)
+        }
+    }
+    const load = () => {
+        if (!state.loading && state.page < pages) {
+            state.loading = fetch_page()
+                .then(() => {
+                    state.loading = null
+                    more.hidden = state.page >= pages
+                    // 注意：加载之后按钮仍然在可视区域内时继续加载下一页
+                    state.visible && load()
+                })
+                .catch(() => {
+                    // 注意：加载失败时停止自动加载，点击按钮重试
+                    state.loading = null
+                    state.visible = false
+                })
+        }
+        return state.loading || Promise.resolve()
+    }
+
+    lazy_comments_reorder = order => {
+        state.order = order
+        state.page = 0
+        element.querySelectorAll(".comment").forEach(comment => comment.remove())
+        more.hidden = false
+        // 注意：旧排序的分页片段仍在加载时，等待其结束之后再加载新排序的第一页
+        const pending = state.loading || Promise.resolve()
+        pending.then(load)
+    }
+    more.addEventListener("click", event => load())
+    more.hidden = false
+
+    if ("IntersectionObserver" in window) {
+        const observer = new IntersectionObserver(entries => {
+            state.visible = entries.some(entry => entry.isIntersecting)
+            state.visible && load()
+        }, { rootMargin: "200px 0px" })
+        observer.observe(more)
+    } else {
+        load()
+    }
+
+    // 注意：链接指向单一评论时，依次加载分页片段直到该评论出现
+    const target = location.hash.startsWith("#comment-") ? location.hash.slice(1) : null
+    const seek = () => {
+        const page = state.page
+        load().then(() => {
+            const comment = document.getElementById(target)
+            if (comment) {
+                comment.scrollIntoView()
+            } else if (state.page > page && state.page < pages) {
+                seek()
+            }
+        })
+    }
+    target && seek()
+}
+on_dom_content_loaded(lazy_comments)
+
+
+// counters
+// 注意：启用 counters 时页面中的 reactions/评论数量由 counters.json 填充，格式与 treehole.py 中 CountersGenerator 一致
+const counters_version = 1
+const counters_emojis = {
+    "+1": "👍", "-1": "👎", "laugh": "😄", "hooray": "🎉",
+    "confused": "😕", "heart": "❤️", "rocket": "🚀", "eyes": "👀",
+}
+let counters_data = null
+const counters_hydrate = (root = document) => {
+    const data = counters_data
+    if (!data) {
+        return
+    }
+    for (const element of root.querySelectorAll("[data-reactions]")) {
+        // 注意：p 开头为文章 reactions，c 开头为评论 reactions，输出结构分别与 card.html/comments.html 一致
+        const key = element.dataset.reactions
+        const is_post = key[0] === "p"
+        const values = (is_post ? data.posts : data.comments)[key.slice(1)] || []
+        const nodes = []
+        data.reactions.forEach((reaction, i) => {
+            if (!values[i]) {
+                return
+            }
+            const emoji = counters_emojis[reaction] || "YES"
+            const small = document.createElement("small")
+            if (is_post) {
+                const span = document.createElement("span")
+                small.textContent = `+${values[i]}`
+                span.append(emoji, small)
+                nodes.push(span, " ")
+            } else {
+                small.textContent = `${emoji}+${values[i]}`
+                nodes.push(small, " ")
+            }
+        })
+        element.replaceChildren(...nodes)
+        element.hidden = !nodes.length
+        if (is_post && element.previousElementSibling) {
+            element.previousElementSibling.hidden = !nodes.length
+        }
+    }
+    for (const element of root.querySelectorAll("[data-comments]")) {
+        const values = data.posts[element.dataset.comments]
+        element.textContent = values ? values[data.reactions.length] : 0
+    }
+}
+const counters = async (url = "/counters.json") => {
+    if (!document.querySelector("[data-reactions], [data-comments]")) {
+        return
+    }
+    try {
+        // 注意：counters.json 随时可能单独刷新，此处每次都向服务器确认是否修改
+        const response = await fetch(url, { cache: "no-cache" })
+        const data = response.ok ? await response.json() : null
+        if (data && data.version === counters_version) {
+            counters_data = data
+            counters_hydrate()
+        }
+    } catch (error) {
+        // 注意：加载失败时 reactions 保持隐藏，不影响页面其余内容
+    }
+}
+on_dom_content_loaded(counters)
+
+
 // new_reaction
 const new_reaction = (btn = "new-reaction") => {
     const element = document.getElementById(btn)
@@ -68,3 +218,118 @@ const new_reaction = (btn = "new-reaction") => {
 }
 on_dom_content_loaded(new_reaction)
 
+
+// search
+// 注意：此处的分词规则必须与 treehole/search.py 中 tokenize 完全一致
+const search_latin = /^[0-9a-z\u00c0-\u024f]+$/
+const search_token = /[0-9a-z\u00c0-\u024f]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+/g
+const search_tokenize = text => {
+    const tokens = []
+    for (const token of text.normalize("NFKC").toLowerCase().match(search_token) || []) {
+        if (search_latin.test(token)) {
+            // 注意：拉丁字母词项长度为 2-32 个字符
+            if (token.length >= 2 && token.length <= 32) {
+                tokens.push(token)
+            }
+        } else if (token.length === 1) {
+            tokens.push(token)
+        } else {
+            for (let i = 0; i < token.length - 1; i++) {
+                tokens.push(token.slice(i, i + 2))
+            }
+        }
+    }
+    return tokens
+}
+const search_shard = (token, buckets) => {
+    const prefix = token.slice(0, 2)
+    if (/^[0-9a-z]{2}$/.test(prefix)) {
+        return prefix
+    }
+    return "u" + (token.codePointAt(0) % buckets).toString(16).padStart(2, "0")
+}
+const search_files = {}
+const search_fetch = path => {
+    // 注意：每个索引分片只请求一次，请求失败（比如分片不存在）视为空分片
+    search_files[path] = search_files[path] || fetch(path)
+        .then(response => response.ok ? response.json() : {})
+        .catch(() => ({}))
+    return search_files[path]
+}
+const search_query = async (query, limit = 20) => {
+    const meta = await search_fetch("/search/meta.json")
+    const tokens = search_tokenize(query)
+    if (!tokens.length || !meta.buckets) {
+        return []
+    }
+    const shards = await Promise.all(tokens.map(token => search_fetch(`/search/${search_shard(token, meta.buckets)}.json`)))
+
+    // 全部词项取交集，得分累加；最后一个词项按前缀匹配
+    let scores = null
+    tokens.forEach((token, i) => {
+        const shard = shards[i]
+        const terms = i === tokens.length - 1 ? Object.keys(shard).filter(term => term.startsWith(token)) : [token]
+        const matched = new Map()
+        for (const term of terms) {
+            const postings = shard[term] || []
+            let id = 0
+            for (let k = 0; k < postings.length; k += 2) {
+                id += postings[k]
+                matched.set(id, (matched.get(id) || 0) + postings[k + 1])
+            }
+        }
+        if (scores === null) {
+            scores = matched
+        } else {
+            for (const [id, score] of scores) {
+                matched.has(id) ? scores.set(id, score + matched.get(id)) : scores.delete(id)
+            }
+        }
+    })
+
+    const ranked = Array.from(scores).sort((a, b) => b[1] - a[1] || b[0] - a[0]).slice(0, limit)
+    const chunks = await Promise.all(ranked.map(([id]) => search_fetch(`/search/d${Math.floor(id / meta.chunk)}.json`)))
+    return ranked.map(([id], i) => chunks[i][id]).filter(doc => doc)
+}
+const search = (input = "search", output = "search-results") => {
+    const element = document.getElementById(input)
+    const results = document.getElementById(output)
+    if (!element || !results) {
+        return
+    }
+    let timer = null
+    element.addEventListener("input", event => {
+        clearTimeout(timer)
+        timer = setTimeout(async () => {
+            const query = element.value.trim()
+            if (!query) {
+                results.hidden = true
+                return
+            }
+            const docs = await search_query(query)
+            if (query !== element.value.trim()) {
+                return
+            }
+            // 注意：此处全部使用 textContent 输出，避免标题中的 HTML 被执行
+            const list = document.createElement("ul")
+            for (const [title, url, date] of docs) {
+                const item = document.createElement("li")
+                const link = document.createElement("a")
+                link.href = element.dataset.prefix + url
+                link.textContent = title
+                const small = document.createElement("small")
+                small.textContent = date
+                item.append(link, small)
+                list.appendChild(item)
+            }
+            if (!docs.length) {
+                const item = document.createElement("li")
+                item.textContent = element.dataset.empty
+                list.appendChild(item)
+            }
+            results.replaceChildren(list)
+            results.hidden = false
+        }, 200)
+    })
+}
+on_dom_content_loaded(search)
@@ -0,0 +1,426 @@
+#
+# 使用 sqlite3 实现的本地内容存储，替代原来 indent=2 的 JSON 缓存文件
+#
+
+import json
+import logging
+import os
+import os.path
+import sqlite3
+
+from .github import GithubIssue, GithubComment, GithubLabel, GithubReactions, GithubUser
+from .utils import intern
+
+
+
+logger = logging.getLogger("treehole")
+
+
+
+# 注意：此处 reactions 按固定顺序展开为独立字段，方便按需读取而无需反序列化
+REACTIONS = ("+1", "-1", "laugh", "hooray", "confused", "heart", "rocket", "eyes")
+REACTION_COLUMNS = (
+    "reaction_up", "reaction_down", "reaction_laugh", "reaction_hooray",
+    "reaction_confused", "reaction_heart", "reaction_rocket", "reaction_eyes"
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    login TEXT PRIMARY KEY,
+    avatar_url TEXT,
+    user_url TEXT
+);
+CREATE TABLE IF NOT EXISTS labels (
+    name TEXT PRIMARY KEY,
+    color TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS issues (
+    number INTEGER PRIMARY KEY,
+    issue_url TEXT,
+    title TEXT,
+    state TEXT,
+    is_pull_request INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT,
+    body TEXT,
+    user_login TEXT REFERENCES users(login),
+    {", ".join(f"{column} INTEGER" for column in REACTION_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS issue_labels (
+    issue_number INTEGER REFERENCES issues(number) ON DELETE CASCADE,
+    label_name TEXT REFERENCES labels(name),
+    position INTEGER,
+    PRIMARY KEY (issue_number, label_name)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    issue_number INTEGER,
+    issue_url TEXT,
+    comment_url TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    body TEXT,
+    user_login TEXT REFERENCES users(login),
+    {", ".join(f"{column} INTEGER" for column in REACTION_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS rendered (
+    number INTEGER PRIMARY KEY,
+    updated_at TEXT,
+    body_html TEXT,
+    title TEXT,
+    image TEXT,
+    paragraph TEXT,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS search_terms (
+    number INTEGER PRIMARY KEY,
+    updated_at TEXT,
+    terms TEXT
+);
+CREATE INDEX IF NOT EXISTS issues_created_at ON issues(created_at);
+CREATE INDEX IF NOT EXISTS issues_state_created_at ON issues(state, is_pull_request, created_at);
+CREATE INDEX IF NOT EXISTS issue_labels_label_name ON issue_labels(label_name);
+CREATE INDEX IF NOT EXISTS comments_issue_number ON comments(issue_number, created_at);
+"""
+
+
+
+class TreeHoleStore:
+    """TreeHole 本地内容存储，按 issue_number/created_at/label 建立索引
+
+    - 注意：此处只保存 GithubIssue/GithubComment 转换后的字段，不保存原始接口返回的冗余字段
+    - 注意：所有查询均只读取需要的字段和行，不再整体加载全部的缓存数据
+
+    使用方法：
+        store = TreeHoleStore("./data/_treehole.sqlite3")
+        store.save_issues(issues)
+        for issue in store.iter_issues(state="open"):
+            print(issue["title"])
+        store.close()
+    """
+    schema_version = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        dirpath = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirpath, exist_ok=True)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+        version = self.get_meta("schema_version")
+        if version is None:
+            self.set_meta("schema_version", str(self.schema_version))
+        elif int(version) != self.schema_version:
+            raise ValueError(f'unsupported store schema_version={version}, path={path}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def count_issues(self):
+        return self.conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+
+    def save_issues(self, issues):
+        """写入/更新全部 issues，要求 issues 为 GithubIssue 转换后的数据结构
+        """
+        count = 0
+        with self.conn:
+            for issue in issues:
+                self._save_user(issue.get("user"))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO issues (number, issue_url, title, state, is_pull_request, "
+                    f"created_at, updated_at, body, user_login, {', '.join(REACTION_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * (9 + len(REACTION_COLUMNS)))})",
+                    (
+                        int(issue.get("issue_number")),
+                        issue.get("issue_url"),
+                        issue.get("title"),
+                        issue.get("state"),
+                        int(bool(issue.get("is_pull_request"))),
+                        issue.get("created_at"),
+                        issue.get("updated_at"),
+                        issue.get("body"),
+                        (issue.get("user") or {}).get("login"),
+                        *self._reaction_values(issue.get("reactions")),
+                    )
+                )
+                # 注意：此处 labels 需要整体替换，否则修改过的 labels 会残留
+                self.conn.execute("DELETE FROM issue_labels WHERE issue_number = ?", (int(issue.get("issue_number")),))
+                for position, label in enumerate(issue.get("labels") or []):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO labels (name, color, description) VALUES (?, ?, ?)",
+                        (label.get("name"), label.get("color"), label.get("description"))
+                    )
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO issue_labels (issue_number, label_name, position) VALUES (?, ?, ?)",
+                        (int(issue.get("issue_number")), label.get("name"), position)
+                    )
+                count += 1
+
+        logger.info(f'store save_issues, items={count}')
+        return count
+
+    def save_comments(self, comments):
+        """写入/更新全部 comments，要求 comments 为 GithubComment 转换后的数据结构
+        """
+        count = 0
+        with self.conn:
+            for comment in comments:
+                self._save_user(comment.get("user"))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO comments (id, issue_number, issue_url, comment_url, "
+                    f"created_at, updated_at, body, user_login, {', '.join(REACTION_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * (8 + len(REACTION_COLUMNS)))})",
+                    (
+                        int(comment.get("comment_id")),
+                        int(comment.get("issue_number")),
+                        comment.get("issue_url"),
+                        comment.get("comment_url"),
+                        comment.get("created_at"),
+                        comment.get("updated_at"),
+                        comment.get("body"),
+                        (comment.get("user") or {}).get("login"),
+                        *self._reaction_values(comment.get("reactions")),
+                    )
+                )
+                count += 1
+
+        logger.info(f'store save_comments, items={count}')
+        return count
+
+    def clear_data(self):
+        """删除全部 issues/comments 数据，保留 markdown 渲染结果/分词结果缓存，用于整体替换为最新拉取的数据
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM issue_labels")
+            self.conn.execute("DELETE FROM issues")
+            self.conn.execute("DELETE FROM comments")
+        logger.info(f'store clear_data')
+
+    def delete_issue(self, number: int):
+        """删除单一 issue 及其对应的 labels/comments/渲染缓存，用于处理 Github 删除/转移 issue 的情况
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM issues WHERE number = ?", (int(number),))
+            self.conn.execute("DELETE FROM comments WHERE issue_number = ?", (int(number),))
+            self.conn.execute("DELETE FROM rendered WHERE number = ?", (int(number),))
+            self.conn.execute("DELETE FROM search_terms WHERE number = ?", (int(number),))
+        logger.info(f'store delete_issue, number={number}')
+
+    def delete_comment(self, comment_id: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM comments WHERE id = ?", (int(comment_id),))
+        logger.info(f'store delete_comment, comment_id={comment_id}')
+
+    def iter_issues(self,
+        state: str = None,
+        pull_request: bool = False,
+        since: str = None,
+        until: str = None,
+        label: str = None,
+        user: str = None
+    ):
+        """按条件返回 GithubIssue 数据
+
+        - 注意：since/until 为 created_at 范围，使用 ISO8601 字符串比较，左闭右开
+        - 注意：user 为 issue 创建者，不区分大小写
+        - 注意：返回结果按 issue_number 顺序排列，与 Github 接口返回顺序无关
+        """
+        where, params = ["is_pull_request = ?"], [int(pull_request)]
+        if state is not None:
+            where.append("state = ?")
+            params.append(state)
+        if user is not None:
+            where.append("user_login = ? COLLATE NOCASE")
+            params.append(user)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        if label is not None:
+            where.append("number IN (SELECT issue_number FROM issue_labels WHERE label_name = ?)")
+            params.append(label)
+
+        rows = self.conn.execute(
+            "SELECT issues.*, users.avatar_url, users.user_url FROM issues "
+            "LEFT JOIN users ON users.login = issues.user_login "
+            f"WHERE {' AND '.join(where)} ORDER BY number", params
+        )
+        labels_maps = self._labels_maps(where, params)
+        for row in rows:
+            yield GithubIssue.from_dict({
+                "issue_url": row["issue_url"],
+                "issue_number": row["number"],
+                "title": row["title"],
+                "created_at": row["created_at"],
+                "updated_at": row["updated_at"],
+                "state": row["state"],
+                "is_pull_request": bool(row["is_pull_request"]),
+                "body": row["body"],
+                "labels": tuple(labels_maps.get(row["number"], ())),
+                "reactions": self._reactions(row),
+                "user": self._user(row),
+            })
+
+    def iter_comments(self, state: str = None, pull_request: bool = False, user: str = None):
+        """返回 GithubComment 数据
+
+        - 注意：此处只返回符合 state/pull_request/user 条件的 issues 对应的 comments，其余评论不会出现在网站中
+        """
+        where, params = ["is_pull_request = ?"], [int(pull_request)]
+        if state is not None:
+            where.append("state = ?")
+            params.append(state)
+        if user is not None:
+            where.append("user_login = ? COLLATE NOCASE")
+            params.append(user)
+
+        rows = self.conn.execute(
+            "SELECT comments.*, users.avatar_url, users.user_url FROM comments "
+            "LEFT JOIN users ON users.login = comments.user_login "
+            f"WHERE issue_number IN (SELECT number FROM issues WHERE {' AND '.join(where)}) "
+            "ORDER BY comments.id", params
+        )
+        for row in rows:
+            yield GithubComment.from_dict({
+                "issue_url": row["issue_url"],
+                "issue_number": row["issue_number"],
+                "comment_url": row["comment_url"],
+                "comment_id": row["id"],
+                "created_at": row["created_at"],
+                "updated_at": row["updated_at"],
+                "body": row["body"],
+                "reactions": self._reactions(row),
+                "user": self._user(row),
+            })
+
+    def get_rendered(self, version: str):
+        """返回已经缓存的 markdown 渲染结果，按 issue_number 索引
+
+        - 注意：version 为 markdown 渲染器版本，版本不一致时清空全部缓存，避免使用过期的渲染结果
+        """
+        if self.get_meta("rendered_version") != version:
+            with self.conn:
+                self.conn.execute("DELETE FROM rendered")
+            self.set_meta("rendered_version", version)
+            return {}
+
+        rows = self.conn.execute("SELECT * FROM rendered")
+        return { row["number"]: dict(row) for row in rows }
+
+    def save_rendered(self, rendered: list[dict]):
+        """写入 markdown 渲染结果缓存，要求 rendered=list(dict(number, updated_at, body_html, ...)) 数据结构
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rendered (number, updated_at, body_html, title, image, paragraph, summary) "
+                "VALUES (:number, :updated_at, :body_html, :title, :image, :paragraph, :summary)",
+                rendered
+            )
+        logger.info(f'store save_rendered, items={len(rendered)}')
+
+    def get_search_terms(self, version: str):
+        """返回已经缓存的站内搜索分词结果，按 issue_number 索引
+
+        - 注意：version 为搜索索引版本，版本不一致时清空全部缓存
+        """
+        if self.get_meta("search_version") != version:
+            with self.conn:
+                self.conn.execute("DELETE FROM search_terms")
+            self.set_meta("search_version", version)
+            return {}
+
+        rows = self.conn.execute("SELECT * FROM search_terms")
+        return {
+            row["number"]: { "updated_at": row["updated_at"], "terms": json.loads(row["terms"]) }
+            for row in rows
+        }
+
+    def save_search_terms(self, search_terms: list[dict]):
+        """写入站内搜索分词结果缓存，要求 search_terms=list(dict(number, updated_at, terms)) 数据结构
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO search_terms (number, updated_at, terms) VALUES (?, ?, ?)",
+                [
+                    (item["number"], item["updated_at"], json.dumps(item["terms"], ensure_ascii=False))
+                    for item in search_terms
+                ]
+            )
+        logger.info(f'store save_search_terms, items={len(search_terms)}')
+
+    def _labels_maps(self, where: list, params: list):
+        labels_maps = {}
+        rows = self.conn.execute(
+            "SELECT issue_labels.issue_number, labels.* FROM issue_labels "
+            "JOIN labels ON labels.name = issue_labels.label_name "
+            f"WHERE issue_labels.issue_number IN (SELECT number FROM issues WHERE {' AND '.join(where)}) "
+            "ORDER BY issue_labels.issue_number, issue_labels.position", params
+        )
+        for row in rows:
+            labels_maps.setdefault(row["issue_number"], []).append(GithubLabel.from_dict({
+                "name": intern(row["name"]),
+                "color": row["color"],
+                "description": row["description"],
+            }).shared())
+        return labels_maps
+
+    def _save_user(self, user: dict):
+        if not user:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO users (login, avatar_url, user_url) VALUES (?, ?, ?)",
+            (user.get("login"), user.get("avatar_url"), user.get("user_url"))
+        )
+
+    def _reaction_values(self, reactions: dict):
+        reactions = reactions or {}
+        return tuple(reactions.get(reaction) for reaction in REACTIONS)
+
+    def _reactions(self, row: sqlite3.Row):
+        return GithubReactions({
+            reaction: row[column]
+            for reaction, column in zip(REACTIONS, REACTION_COLUMNS)
+        }).shared()
+
+    def _user(self, row: sqlite3.Row):
+        return GithubUser.from_dict({
+            "login": intern(row["user_login"]),
+            "avatar_url": row["avatar_url"],
+            "user_url": row["user_url"],
+        }).shared()
+
+
+def import_json_cache(store: TreeHoleStore, cache_issues: str, cache_comments: str):
+    """将旧版本 _issues.json/_comments.json 缓存文件一次性导入 store
+    """
+    logger.info(f'import legacy cache_data, issues={cache_issues}, comments={cache_comments}')
+
+    with open(cache_issues, "rt") as fd:
+        store.save_issues(GithubIssue(issue) for issue in json.load(fd))
+    with open(cache_comments, "rt") as fd:
+        store.save_comments(GithubComment(comment) for comment in json.load(fd))
@@ -0,0 +1,94 @@
+/*! (c) mywaiting */
+
+// 注意：此文件由 ServiceWorkerGenerator 渲染输出到网站根目录 /sw.js，version 为 precache.json 全部输入内容的 hash
+// 注意：version 不变时 sw.js 内容逐字节不变，浏览器不会重新安装 service worker 也不会重新下载预缓存内容
+const version = "{{ version }}"
+const precache_name = `treehole-precache-${version}`
+const pages_name = `treehole-pages-${version}`
+
+
+// install: 预缓存 precache.json 中带 hash 的静态文件以及首页/最新文章页面
+self.addEventListener("install", event => {
+    event.waitUntil((async () => {
+        const response = await fetch(`{{ manifest_url }}?v=${version}`, { cache: "no-cache" })
+        const manifest = await response.json()
+        const cache = await caches.open(precache_name)
+        await cache.addAll(manifest.assets)
+        // 注意：页面预缓存失败（比如文章已删除）不影响 service worker 安装
+        const pages = await caches.open(pages_name)
+        await Promise.all(manifest.pages.map(url => pages.add(url).catch(() => null)))
+        await self.skipWaiting()
+    })())
+})
+
+
+// activate: 删除旧版本的全部缓存，旧页面引用的旧 hash 文件已经不存在，此处必须同时删除旧页面缓存
+self.addEventListener("activate", event => {
+    event.waitUntil((async () => {
+        for (const name of await caches.keys()) {
+            if (name.startsWith("treehole-") && name !== precache_name && name !== pages_name) {
+                await caches.delete(name)
+            }
+        }
+        await self.clients.claim()
+    })())
+})
+
+
+// 带 hash 的静态文件内容永远不会改变，直接使用 cache-first
+const cache_first = async request => {
+    const cached = await caches.match(request)
+    if (cached) {
+        return cached
+    }
+    const response = await fetch(request)
+    if (response.ok) {
+        const cache = await caches.open(precache_name)
+        cache.put(request, response.clone())
+    }
+    return response
+}
+
+
+// 页面等其余内容使用 stale-while-revalidate，优先返回缓存内容，同时在后台更新缓存
+const stale_while_revalidate = async (event, request) => {
+    const cache = await caches.open(pages_name)
+    const cached = await cache.match(request)
+    const fetching = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone())
+        }
+        return response
+    })
+    if (cached) {
+        event.waitUntil(fetching.catch(() => null))
+        return cached
+    }
+    try {
+        return await fetching
+    } catch (error) {
+        // 注意：离线并且页面未缓存时，页面导航返回已缓存的首页
+        const fallback = request.mode === "navigate" ? await cache.match("/") : null
+        if (fallback) {
+            return fallback
+        }
+        throw error
+    }
+}
+
+
+self.addEventListener("fetch", event => {
+    const request = event.request
+    const url = new URL(request.url)
+    if (request.method !== "GET" || url.origin !== self.location.origin) {
+        return
+    }
+    if (url.pathname === "/sw.js" || url.pathname === "{{ manifest_url }}") {
+        return
+    }
+    if (/\.[0-9a-f]{12}\.(css|js)$/.test(url.pathname)) {
+        event.respondWith(cache_first(request))
+    } else {
+        event.respondWith(stale_while_revalidate(event, request))
+    }
+})
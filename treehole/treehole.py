@@ -1,14 +1,16 @@
 import asyncio
 import collections
-import copy
+import concurrent.futures
 import datetime
+import hashlib
 import io
 import json
 import logging
-import re
+import multiprocessing
 import os
 import os.path
 import shutil
+import time
 import urllib.parse
 import xml.etree.ElementTree as ET
 
@@ -17,13 +19,143 @@ import tornado.locale
 import tornado.template
 import tornado.web
 
-from .github import GithubClient, GithubIssue, GithubComment, github_reactions
-from .utils import H1AndImageExtractor, only_english, from_iso8601_date, slugify, fwrite
+from .api import StaticApi
+from .artifact import ArtifactWriter
+from .assets import AssetPipeline, minify_html
+from .backup import MarkdownBackup
+from .bundle import CacheBundle
+from .generations import OutputGenerations
+from .publish import S3Client, S3Publisher
+from .github import GithubClient, GithubIssue, GithubComment, GithubReactions, github_reactions
+from .images import ImageMirror
+from .search import SearchIndex
+from .store import TreeHoleStore, import_json_cache
+from .utils import H1AndImageExtractor, Record, only_english, from_iso8601_date, slugify, fread, fwrite
 
 
 base_dir = os.path.dirname(__file__)
 logger = logging.getLogger("treehole")
-markdown = mistune.create_markdown(plugins=[
+
+
+# 
+# markdown
+# 
+
+class PostExtraction:
+    """单次 markdown 渲染过程中抽取的 h1/img/段落 内容
+
+    - 注意：此处只保存第一个 h1/img、第一个不为空的段落、第一个超过 130 长度的段落
+    - 注意：全部找到之后 done=True 停止继续收集，后续 token 只渲染不抽取
+    """
+    __slots__ = ("title", "image", "paragraph", "summary")
+
+    # 注意：抽取规则修改时需要同步修改此版本号，store 中缓存的渲染结果将全部失效
+    version = "1"
+    summary_length = 130
+
+    def __init__(self):
+        self.title = None     # 第一个 h1 文本
+        self.image = None     # 第一张 img 图片链接
+        self.paragraph = None # 第一个不为空的段落文本
+        self.summary = None   # 第一个超过 130 长度的段落文本
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        extraction = cls()
+        for key in cls.__slots__:
+            setattr(extraction, key, data.get(key))
+        return extraction
+
+    def to_dict(self):
+        return { key: getattr(self, key) for key in self.__slots__ }
+
+    @property
+    def done(self):
+        return self.title is not None and self.image is not None and self.summary is not None
+
+    def add_title(self, text: str):
+        if self.title is None:
+            self.title = text.strip()
+
+    def add_image(self, src: str):
+        if self.image is None and src:
+            self.image = src
+
+    def add_paragraph(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        if self.paragraph is None:
+            self.paragraph = text
+        if self.summary is None and len(text) > self.summary_length:
+            self.summary = text
+
+    def add_html(self, html: str):
+        """原始 HTML 片段（如 Github 上传图片生成的 `<img>` 标签）只解析当前片段
+        """
+        parser = H1AndImageExtractor()
+        parser.feed(html)
+        parser.close()
+        for title in parser.titles:
+            self.add_title(title)
+        for image in parser.images:
+            self.add_image(image)
+        for paragraph in parser.paragraphs:
+            self.add_paragraph(paragraph)
+
+
+class PostHTMLRenderer(mistune.HTMLRenderer):
+    """渲染 markdown 为 HTML 的同时，直接从 AST 中抽取 h1/img/段落 内容
+
+    - 注意：抽取结果保存在 state.env["extraction"] 中，不存在时只渲染不抽取
+    - 注意：此处不再需要将渲染好的 body_html 重新使用 HTMLParser 完整解析一遍
+    - 注意：默认 escape=True 原始 HTML 会被转义输出为文本，抽取时同样按文本处理
+    """
+    def render_token(self, token: dict, state: mistune.BlockState):
+        extraction = state.env.get("extraction")
+        if extraction is not None and not extraction.done:
+            token_type = token["type"]
+            if token_type == "heading" and token["attrs"]["level"] == 1:
+                extraction.add_title(self.plain_text(token.get("children", ())))
+            elif token_type == "paragraph":
+                extraction.add_paragraph(self.plain_text(token.get("children", ())))
+            elif token_type == "image":
+                extraction.add_image(token["attrs"].get("url"))
+            elif token_type == "block_html":
+                if self._escape:
+                    extraction.add_paragraph(token.get("raw", ""))
+                else:
+                    extraction.add_html(token.get("raw", ""))
+            elif token_type == "inline_html" and not self._escape:
+                extraction.add_html(token.get("raw", ""))
+
+        return super().render_token(token, state)
+
+    def plain_text(self, tokens: list):
+        """返回 inline tokens 对应的纯文本，与渲染后 HTML 去除全部标签的文本一致
+        """
+        texts = []
+        for token in tokens:
+            token_type = token["type"]
+            if token_type in ("text", "codespan", "footnote_ref"):
+                texts.append(token["raw"])
+            elif token_type == "inline_html":
+                # 注意：转义输出的原始 HTML 标签本身就是文本内容
+                if self._escape:
+                    texts.append(token["raw"])
+            elif token_type in ("softbreak", "linebreak"):
+                texts.append("\n")
+            elif token_type == "inline_math":
+                texts.append(f'\\({token["raw"]}\\)')
+            elif token_type == "image":
+                # 注意：图片的 alt 文本只出现在属性中，不属于段落文本
+                continue
+            elif "children" in token:
+                texts.append(self.plain_text(token["children"]))
+        return "".join(texts)
+
+
+markdown = mistune.create_markdown(renderer=PostHTMLRenderer(), plugins=[
     "strikethrough", # 默认开启 mistune 所有插件功能支持
     "footnotes", 
     "table",
@@ -41,35 +173,82 @@ markdown = mistune.create_markdown(plugins=[
 ])
 
 
+def markdown_version():
+    """markdown 渲染器版本，用于判断 store 中缓存的渲染结果是否可用
+    """
+    return f"mistune-{mistune.__version__}/extraction-{PostExtraction.version}"
+
+
+def markdown_extract(text: str):
+    """渲染 markdown 文档，同时返回单次渲染过程中抽取的 h1/img/段落 内容
+    """
+    state = markdown.block.state_cls()
+    extraction = PostExtraction()
+    state.env["extraction"] = extraction
+    html, _ = markdown.parse(text or "", state=state)
+    return html, extraction
+
+
 # 
 # models
 # 
 
-class TreeHolePost(dict):
-    """TreeHole Post 单一文章数据模型，方便将外部数据转换到当前数据类型，并提前完成数据清洗
+class TreeHoleRepo(Record):
+    """多仓库聚合构建中的单一仓库，index 为仓库在 github_repos 中的序号
+
+    - 注意：文章 post.id 为 `index * id_stride + issue_number`，第一个仓库的 post.id/永久链接与单仓库构建完全一致
+    - 注意：调整 github_repos 中仓库的顺序会改变 post.id，新增仓库只能追加到最后
     """
-    def __init__(self, post: dict):
-        self._origin_data = post # type: dict[GithubIssue]
+    __slots__ = ("owner", "repo", "index")
+
+    id_stride = 1000000
+
+    def __init__(self, owner: str, repo: str, index: int = 0):
+        self.owner = owner
+        self.repo = repo
+        self.index = index
+
+    @property
+    def full_name(self):
+        return f"{self.owner}/{self.repo}"
+
+    @property
+    def id_offset(self):
+        return self.index * self.id_stride
+
 
-        self["id"] = post.get("issue_number")
-        self["created_at"] = post.get("created_at")
-        self["updated_at"] = post.get("updated_at")
-        self["body"] = post.get("body")
+class TreeHolePost(Record):
+    """TreeHole Post 单一文章数据模型，方便将外部数据转换到当前数据类型，并提前完成数据清洗
+
+    - 注意：此处直接复用 GithubIssue 中共享的 labels/reactions/user 实例，不再重复转换
+    """
+    __slots__ = (
+        "id", "created_at", "updated_at", "datetime", "body", "body_html", "image",
+        "title", "slug", "summary", "permanent_url", "permanent_fullurl", "source_url",
+        "labels", "reactions", "user", "filepath", "repo"
+    )
+
+    def __init__(self, post: GithubIssue, rendered: dict = None, source: "TreeHoleRepo" = None):
+        # 注意：多仓库聚合构建时 source 为文章所属仓库，post.id 按仓库序号偏移，避免不同仓库 issue_number 冲突
+        self.id = post.get("issue_number") + (source.id_offset if source else 0)
+        self.repo = source.full_name if source else None
+        self.created_at = post.get("created_at")
+        self.updated_at = post.get("updated_at")
+        self.body = post.get("body")
         # 由于 Github 返回的 body_html 图片部分无法使用
         # 此处只能本地渲染 markdown 文档输出
-        self["body_html"] = markdown(post.get("body"))
-
-        # 抽取 body_html 中全部的 h1/img 内容作为标题/头图的参考
-        parser = H1AndImageExtractor()
-        parser.feed(self["body_html"] or "")
-        parser.close()
-        # 已经解析好的全部符合要求的 h1/img/p 内容
-        parsed_titles = parser.titles
-        parsed_images = parser.images
-        parsed_paragraphs = parser.paragraphs
+        # 注意：渲染过程中同时抽取 h1/img/段落 内容作为标题/头图/简介的参考
+        # 注意：rendered 为 store 中缓存的渲染结果，存在时直接使用无需重新渲染
+        if rendered is not None:
+            self.body_html = rendered.get("body_html")
+            extraction = PostExtraction.from_dict(rendered)
+        else:
+            self.body_html, extraction = markdown_extract(post.get("body"))
 
         # 计算当前所有时间，按帖子 created_at 时间戳计算
+        # 注意：此处计算一次之后保存，归档/生成器排序和输出均直接使用
         dt = from_iso8601_date(post.get("created_at"))
+        self.datetime = dt
 
         # 计算标题，请特别注意其 slugify 计算过程
         # 如果 Issue 标题是英文，那么可以生成对应的 `slug=slugify(title)` 内容链接
@@ -78,66 +257,66 @@ class TreeHolePost(dict):
         title = post.get("title")
         if only_english(title):
             slug = slugify(title)
-            if parsed_titles:
-                title = parsed_titles[0]
+            if extraction.title is not None:
+                title = extraction.title
             
             logger.info(f'parsed title={title}, slug={slug}')
+        elif source and source.index:
+            slug = slugify(f'{source.repo}-{post.get("issue_number")}')
         else:
             slug = slugify(post.get("issue_number"))
         
         # 计算当前文章是否存在题图/头图，默认使用第一张 Img 图片作为头图/题图
-        if parsed_images:
-            self["image"] = parsed_images[0]
-        else:
-            self["image"] = None
+        self.image = extraction.image
         
-        # 计算得到当前文章全部段落，取出第一个不少于 130 长度的段落作为其简介/内容简介
-        summary = ""
-        for paragraph in parsed_paragraphs:
-            if len(paragraph) > 130:
-                summary = paragraph
-                break
+        # 取出第一个不少于 130 长度的段落作为其简介/内容简介
         # 如果此时 summary 不存在，那么默认使用第一个不为空段落作为其简介/内容简介
-        if not summary:
-            for paragraph in parsed_paragraphs:
-                if paragraph:
-                    summary = paragraph
-                    break
+        summary = extraction.summary or extraction.paragraph or ""
         
-        self["title"] = title
-        self["slug"] = slug
-        self["summary"] = summary
-        self["permanent_url"] = f'/{dt.year}/{dt.month:02d}/{dt.day:02d}/{slug}/'               # 永久链接
-        self["permanent_fullurl"] = f'/{dt.year}/{dt.month:02d}/{dt.day:02d}/{slug}/index.html' # 永久链接/全称形式，用于写入文件
-        self["source_url"] = post.get("issue_url") # 原始链接
-        self["labels"]  = post.get("labels")      # list
-        self["reactions"] = post.get("reactions") # dict
-        self["user"] = post.get("user")
+        self.title = title
+        self.summary = summary
+        self.source_url = post.get("issue_url") # 原始链接
+        self.labels = post.get("labels")        # tuple[GithubLabel]
+        self.reactions = post.get("reactions")  # GithubReactions
+        self.user = post.get("user")            # GithubUser
+        self.set_slug(slug)
+
+    def set_slug(self, slug: str):
+        """设置 slug 以及对应的永久链接/文件路径，只用于创建文章以及聚合构建时处理永久链接冲突
+        """
+        dt = self.datetime
+        self.slug = slug
+        self.permanent_url = f'/{dt.year}/{dt.month:02d}/{dt.day:02d}/{slug}/'               # 永久链接
+        self.permanent_fullurl = f'/{dt.year}/{dt.month:02d}/{dt.day:02d}/{slug}/index.html' # 永久链接/全称形式，用于写入文件
         # 用于标识当前文件路径
-        self["filepath"] = f'./{dt.year}/{dt.month:02d}/{dt.day:02d}/{slug}/index.html' # 当前文件路径
+        self.filepath = f'./{dt.year}/{dt.month:02d}/{dt.day:02d}/{slug}/index.html' # 当前文件路径
 
 
-class TreeHoleComment(dict):
+class TreeHoleComment(Record):
     """TreeHole Comment 单一评论数据模型
     """
-    def __init__(self, comment: dict):
-        self._origin_data = comment # type: dict[GithubComment]
-
-        self["post_id"] = comment.get("issue_number")      # 原始 issue 序列号
-        self["post_source_url"] = comment.get("issue_url") # 原始 issue 链接
-
-        self["id"] = comment.get("comment_id")
-        self["source_url"] = comment.get("comment_url") # 当前 comment 原始链接
-
-        self["created_at"] = comment.get("created_at")
-        self["updated_at"] = comment.get("updated_at")
-        self["body"] = comment.get("body")
+    __slots__ = (
+        "post_id", "post_source_url", "id", "source_url", "created_at", "updated_at",
+        "datetime", "body", "body_html", "reactions", "user"
+    )
+
+    def __init__(self, comment: GithubComment, source: "TreeHoleRepo" = None):
+        self.post_id = comment.get("issue_number") + (source.id_offset if source else 0) # 原始 issue 序列号，聚合构建时按仓库序号偏移
+        self.post_source_url = comment.get("issue_url") # 原始 issue 链接
+
+        self.id = comment.get("comment_id")
+        self.source_url = comment.get("comment_url") # 当前 comment 原始链接
+
+        self.created_at = comment.get("created_at")
+        self.updated_at = comment.get("updated_at")
+        self.datetime = from_iso8601_date(comment.get("created_at"))
+        self.body = comment.get("body")
         # 由于 Github 返回的 body_html 图片部分无法使用
         # 此处只能本地渲染 markdown 文档输出
-        self["body_html"] = mistune.markdown(comment.get("body"))
+        self.body_html = mistune.markdown(comment.get("body"))
 
-        self["reactions"] = comment.get("reactions") # list
-        self["user"] = comment.get("user")
+        self.reactions = comment.get("reactions") # GithubReactions
+        self.user = comment.get("user")           # GithubUser
 
 
 # 
@@ -148,14 +327,9 @@ class IndexArchive:
     """首页输出最新三篇文章/内容列表归档实现，按日列出最新三篇文章列表（标题、日期、文章全部文本、精简标签显示）
     """
     def __init__(self, posts: list[TreeHolePost]):
-        self.posts = copy.deepcopy(posts)
-
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"], reverse=True)
+        # 全部 posts 按照时间从最新到最旧排序
+        # 注意：所有 post 均为只读的 Record 此处直接排序引用即可，无需 deepcopy 整个列表
+        self.posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
 
         # 首页只需要输出最新的三篇文章
         posts = self.posts[0:3]
@@ -185,14 +359,9 @@ class DailyArchive:
     """按天文章列表归档实现，按日列出全部的文章列表（标题、日期、文章截断长文本、精简标签显示）
     """
     def __init__(self, posts: list[TreeHolePost]):
-        self.posts = copy.deepcopy(posts)
-
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"], reverse=True)
+        # 全部 posts 按照时间从最新到最旧排序
+        # 注意：所有 post 均为只读的 Record 此处直接排序引用即可，无需 deepcopy 整个列表
+        self.posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
 
         # 构建 年 → 月 → 日 → [posts] 的嵌套结构
         posts = collections.defaultdict(         # year
@@ -205,7 +374,7 @@ class DailyArchive:
 
         # 遍历全部 posts 按照上述数据嵌套结构分类
         for post in self.posts:
-            dt = post["_datetime"]
+            dt = post.datetime
             posts[dt.year][dt.month][dt.day].append(post)
         
         # 此处可以清理全部的 self.posts 此变量后面作为最终结果输出
@@ -250,14 +419,9 @@ class MonthlyArchive:
     """按月份文章列表归档实现，按日列出对应月份的文章列表（标题、日期、文章截断短文本、精简标签显示）
     """
     def __init__(self, posts: list[TreeHolePost]):
-        self.posts = copy.deepcopy(posts)
-
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"], reverse=True)
+        # 全部 posts 按照时间从最新到最旧排序
+        # 注意：所有 post 均为只读的 Record 此处直接排序引用即可，无需 deepcopy 整个列表
+        self.posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
 
         # 构建 年 → 月 → [posts] 的嵌套结构
         posts = collections.defaultdict(         # year
@@ -270,7 +434,7 @@ class MonthlyArchive:
 
         # 遍历全部 posts 按照上述数据嵌套结构分类
         for post in self.posts:
-            dt = post["_datetime"]
+            dt = post.datetime
             posts[dt.year][dt.month][dt.day].append(post)
         
         # 此处可以清理全部的 self.posts 此变量后面作为最终结果输出
@@ -324,14 +488,9 @@ class YearlyArchive:
     """按年份文章列表归档实现，按月份列出对应年份的文章列表（标题、日期）
     """
     def __init__(self, posts: list[TreeHolePost]):
-        self.posts = copy.deepcopy(posts)
-
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"], reverse=True)
+        # 全部 posts 按照时间从最新到最旧排序
+        # 注意：所有 post 均为只读的 Record 此处直接排序引用即可，无需 deepcopy 整个列表
+        self.posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
 
         # 构建 年 → 月 → [posts] 的嵌套结构
         posts = collections.defaultdict(     # year
@@ -342,7 +501,7 @@ class YearlyArchive:
 
         # 遍历全部 posts 按照上述数据嵌套结构分类
         for post in self.posts:
-            dt = post["_datetime"]
+            dt = post.datetime
             posts[dt.year][dt.month].append(post)
         
         # 此处可以清理全部的 self.posts 此变量后面作为最终结果输出
@@ -393,17 +552,14 @@ class YearlyArchive:
 
 class PostArchive:
     """按单一博客文章归档实现
-    """
-    def __init__(self, posts: list[TreeHolePost], comments: list[TreeHoleComment]):
-        self.posts = copy.deepcopy(posts)
-        self.comments = copy.deepcopy(comments)
-
-        # 短暂为所有 comments 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for comment in self.comments:
-            comment["_datetime"] = from_iso8601_date(comment.get("created_at"))
 
-        # 全部 comments 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.comments.sort(key=lambda comment: comment["_datetime"], reverse=True)
+    - 注意：comments_per_page 大于 0 时，评论不再直接输出到文章页面中，而是按页输出为独立的 HTML 片段
+        `<post>/comments/desc-<n>.html`（按最新排序）/`<post>/comments/asc-<n>.html`（按最旧排序），
+        由 app.js 在评论区域进入可视区域时按需加载，两种排序均在构建时预先生成
+    """
+    def __init__(self, posts: list[TreeHolePost], comments: list[TreeHoleComment], comments_per_page: int = 0):
+        # 全部 comments 按照时间从最新到最旧排序
+        self.comments = sorted(comments, key=lambda comment: comment.datetime, reverse=True)
 
         # 直接遍历处理得到所有按照 issue_number 的评论序列
         # 注意：此处显式转换数字为字符串作为 Key 务必注意！使用 Int 提取对应数据将返回 list()
@@ -411,12 +567,8 @@ class PostArchive:
         for comment in self.comments:
             comments_maps[str(comment.get("post_id"))].append(comment)
 
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"], reverse=True)
+        # 全部 posts 按照时间从最新到最旧排序
+        self.posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
 
         # 构建 年 → 月 → [posts] 的嵌套结构
         posts = list(self.posts)
@@ -427,12 +579,6 @@ class PostArchive:
             for post in posts
         }
 
-        # 计算两集合 Jaccard 相似度，比较简单
-        def jaccard_similarity(set1: set[str], set2: set[str]):
-            if not set1 and not set2:
-                return 0.0
-            return len(set1 & set2) / len(set1 | set2)
-        
         # 单纯使用文章 post_id/labels.name 执行计算
         labels_maps = {
             post.get("id"): set(label.get("name") for label in post.get("labels"))
@@ -445,7 +591,7 @@ class PostArchive:
         for i in range(len(labels_ids)):
             for j in range(i + 1, len(labels_ids)):
                 id1, id2 = labels_ids[i], labels_ids[j]
-                sim = jaccard_similarity(labels_maps[id1], labels_maps[id2])
+                sim = self.jaccard_similarity(labels_maps[id1], labels_maps[id2])
                 if sim > 0.0:
                     similarity_maps[id1].append((id2, sim))
                     similarity_maps[id2].append((id1, sim))
@@ -457,28 +603,106 @@ class PostArchive:
         # 遍历全部处理好的 posts 数据嵌套结构，按天汇总输出所有的 post_archive 页面数据
         for i, value in enumerate(posts):
             post = posts[i]
-            next_post = posts[i-1] if i > 0 else None              # 时间排序：下一个文章/按当前文章顺序
-            prev_post = posts[i+1] if i < len(posts) - 1 else None # 时间排序：上一个文章/按当前文章顺序
             # 得到当前文章，根据 labels 相似度计算的结果
             related = similarity_maps.get(post.get("id"), [])
             related_sorted = sorted(related, key=lambda x: x[1], reverse=True)[0:3] # 此处每次取三篇相似文章
             related_posts = [ posts_maps.get(post_id) for post_id, _ in related_sorted]
             # 所有数据缓存到 self.posts 方便外部使用
-            self.posts.append({
-                "filepath": post.get("filepath"), # 单一页面输出文件路径，直接提取其 filepath 此处不重复计算
-                "template_name": "post.html",
+            # 注意：此处必须转换 id 为字符串
+            post_comments = comments_maps[str(post.get("id"))]
+            self.posts.append(self.make_page(posts, i, related_posts, post_comments, comments_per_page))
+            self.posts.extend(self.make_comments_pages(post, post_comments, comments_per_page))
+
+    @staticmethod
+    def jaccard_similarity(set1: set[str], set2: set[str]):
+        """计算两集合 Jaccard 相似度，比较简单
+        """
+        if not set1 and not set2:
+            return 0.0
+        return len(set1 & set2) / len(set1 | set2)
+
+    @classmethod
+    def find_related(cls, post: TreeHolePost, posts: list[TreeHolePost]):
+        """只计算单一文章的相似文章，用于增量渲染单一文章页面
+
+        - 注意：要求 posts 按照时间从最新到最旧排序，计算结果与 __init__ 中全量两两计算的结果一致
+        """
+        labels = set(label.get("name") for label in post.get("labels"))
+        related = []
+        for other in posts:
+            if other.get("id") == post.get("id"):
+                continue
+            sim = cls.jaccard_similarity(labels, set(label.get("name") for label in other.get("labels")))
+            if sim > 0.0:
+                related.append((other, sim))
+        related_sorted = sorted(related, key=lambda x: x[1], reverse=True)[0:3] # 此处每次取三篇相似文章
+        return [ other for other, _ in related_sorted ]
+
+    @staticmethod
+    def make_page(
+        posts: list[TreeHolePost], i: int, related_posts: list[TreeHolePost], comments: list[TreeHoleComment],
+        comments_per_page: int = 0
+    ):
+        """返回 posts[i] 对应的 post_archive 页面数据，要求 posts 按照时间从最新到最旧排序
+
+        - 注意：comments_per_page 大于 0 时，页面中不输出任何评论，只输出评论数量和评论分页数量
+        """
+        post = posts[i]
+        next_post = posts[i-1] if i > 0 else None              # 时间排序：下一个文章/按当前文章顺序
+        prev_post = posts[i+1] if i < len(posts) - 1 else None # 时间排序：上一个文章/按当前文章顺序
+        return {
+            "filepath": post.get("filepath"), # 单一页面输出文件路径，直接提取其 filepath 此处不重复计算
+            "template_name": "post.html",
+            "template_vars": {
+                "page": "post",
+                "page_title": post.get("title"),
+                "page_desc": post.get("summary"),
+                "page_class": "single-post",
+                "post": post,
+                "prev_post": prev_post,
+                "next_post": next_post,
+                "related_posts": related_posts, # 根据 labels 计算得到的相似文章
+                "comments": [] if comments_per_page else comments,
+                "comments_count": len(comments),
+                "comments_pages": -(-len(comments) // comments_per_page) if comments_per_page else 0,
+            }
+        }
+
+    @staticmethod
+    def comments_filepaths(post: TreeHolePost, pages: int):
+        """返回单一文章全部评论分页片段的 (order, page, filepath)，desc 为按最新排序，asc 为按最旧排序
+        """
+        dirname = os.path.dirname(post.get("filepath"))
+        return [
+            (order, page, f"{dirname}/comments/{order}-{page}.html")
+            for order in ("desc", "asc")
+            for page in range(1, pages + 1)
+        ]
+
+    @classmethod
+    def make_comments_pages(cls, post: TreeHolePost, comments: list[TreeHoleComment], comments_per_page: int = 0):
+        """返回单一文章全部评论分页片段的页面数据，要求 comments 按照时间从最新到最旧排序
+        """
+        if not comments_per_page or not comments:
+            return []
+
+        orders = {
+            "desc": comments,
+            "asc": comments[::-1],
+        }
+        pages = -(-len(comments) // comments_per_page)
+        return [
+            {
+                "filepath": filepath,
+                "template_name": "comments.html",
                 "template_vars": {
-                    "page": "post",
-                    "page_title": post.get("title"),
-                    "page_desc": post.get("summary"),
-                    "page_class": "single-post",
+                    "page": "comments",
                     "post": post,
-                    "prev_post": prev_post,
-                    "next_post": next_post,
-                    "related_posts": related_posts, # 根据 labels 计算得到的相似文章
-                    "comments": comments_maps[str(post.get("id"))], # 注意：此处必须转换 id 为字符串
+                    "comments": orders[order][(page - 1) * comments_per_page:page * comments_per_page],
                 }
-            })
+            }
+            for order, page, filepath in cls.comments_filepaths(post, pages)
+        ]
     
     def __iter__(self):
         return iter(self.posts)
@@ -495,14 +719,9 @@ class FeedmapGenerator:
     """按 Feed/Atom 列表输出，按日列出最新十篇文章列表（标题、日期、文章截断长文本、精简标签显示）
     """
     def __init__(self, posts: list[TreeHolePost], feed_info: dict, base_url: str):
-        self.posts = copy.deepcopy(posts)
-
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最新到最旧排序，此处原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"], reverse=True)
+        # 全部 posts 按照时间从最新到最旧排序
+        # 注意：所有 post 均为只读的 Record 此处直接排序引用即可，无需 deepcopy 整个列表
+        self.posts = sorted(posts, key=lambda post: post.datetime, reverse=True)
 
         # Feed 只需要输出最新的十篇文章
         posts = self.posts[0:10]
@@ -595,14 +814,8 @@ class SitemapGenerator:
     """输出 sitemap.xml 全站所有的 urls 
     """
     def __init__(self, posts: list[TreeHolePost], base_url: str):
-        self.posts = copy.deepcopy(posts)
-
-        # 短暂为所有 posts 增加单独的 _datetime 字段用于排序和输出，避免重复转换
-        for post in self.posts:
-            post["_datetime"] = from_iso8601_date(post.get("created_at"))
-
-        # 全部 posts 按照时间从最旧到最新排序，此处**不要**原地排序/逆序
-        self.posts.sort(key=lambda post: post["_datetime"])
+        # 全部 posts 按照时间从最旧到最新排序，此处**不要**逆序
+        self.posts = sorted(posts, key=lambda post: post.datetime)
 
         # Sitemap 需要输出全站所有的文章链接
         posts = []
@@ -647,6 +860,429 @@ class SitemapGenerator:
         return fd.getvalue().decode("utf-8")
 
 
+class CountersGenerator:
+    """输出 counters.json 全站文章/评论的 reactions 数量以及文章评论数量，由 app.js 加载之后填充到页面中
+
+    - 注意：启用 counters 时页面中不再输出这些数量，reactions 变化时只需要重新输出 counters.json 无需重新渲染页面
+    - 注意：posts 为 { post_id: [reactions..., comments_count] }，comments 为 { comment_id: [reactions...] }
+        reactions 按 `reactions` 字段中的顺序排列，全部为 0 的条目直接省略
+    - 注意：version 为文件格式版本，格式修改时需要同步修改 app.js 中的 counters_version
+    """
+    version = 1
+
+    def __init__(self, posts: list, comments: list):
+        # 注意：此处 posts/comments 只需要 id/post_id/reactions 字段，计数刷新时无需完整的 TreeHolePost/TreeHoleComment
+        reactions = GithubReactions.reactions_maps.keys()
+        comments_count = collections.Counter( comment.get("post_id") for comment in comments )
+
+        posts_counters = {}
+        for post in sorted(posts, key=lambda post: post.get("id")):
+            values = [ post.get("reactions").get(reaction) or 0 for reaction in reactions ]
+            values.append(comments_count.get(post.get("id"), 0))
+            if any(values):
+                posts_counters[str(post.get("id"))] = values
+
+        comments_counters = {}
+        for comment in sorted(comments, key=lambda comment: comment.get("id")):
+            values = [ comment.get("reactions").get(reaction) or 0 for reaction in reactions ]
+            if any(values):
+                comments_counters[str(comment.get("id"))] = values
+
+        self.posts = [{
+            "filepath": "./counters.json",
+            "filetext": json.dumps({
+                "version": self.version,
+                "reactions": list(reactions),
+                "posts": posts_counters,
+                "comments": comments_counters,
+            }, ensure_ascii=False, separators=(",", ":"))
+        }]
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+
+class ServiceWorkerGenerator:
+    """输出 service worker `sw.js` 以及预缓存清单 `precache.json`，离线访问以及再次访问时直接从缓存加载
+
+    - 注意：预缓存清单包含带 hash 的静态文件、首页以及与 feedmap 相同的最新十篇文章页面
+    - 注意：version 为预缓存清单以及 sw.js 模板内容的 hash，文章内容修改不会改变 version，只有清单链接变化才会改变
+    - 注意：version 不变时输出内容逐字节不变，浏览器不会重新安装 service worker
+    """
+    template_name = "sw.js"
+    manifest_url = "/precache.json"
+    recent_posts = 10
+
+    def __init__(self, posts: list[TreeHolePost], static_urls: dict, template_path: str):
+        # 全部 posts 按照时间从最新到最旧排序，与 IndexArchive/FeedmapGenerator 相同
+        posts = sorted(posts, key=lambda post: post.datetime, reverse=True)[0:self.recent_posts]
+
+        template = tornado.template.Loader(template_path, whitespace="single").load(self.template_name)
+        manifest = {
+            "assets": sorted((static_urls or {}).values()),
+            "pages": [ "/" ] + [ post.get("permanent_url") for post in posts ],
+        }
+        self.version = hashlib.sha256(
+            json.dumps(manifest, sort_keys=True).encode("utf-8")
+            + fread(os.path.join(template_path, self.template_name)).encode("utf-8")
+        ).hexdigest()[:12]
+
+        self.posts = [{
+            "filepath": f".{self.manifest_url}",
+            "filetext": json.dumps({ "version": self.version, **manifest }, ensure_ascii=False, indent=2)
+        }, {
+            "filepath": f"./{self.template_name}",
+            "filetext": template.generate(version=self.version, manifest_url=self.manifest_url).decode()
+        }]
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+
+# 
+# render
+# 
+
+class FileWriter:
+    """将渲染结果写入 output_dir，所有 filepath 均为相对 output_dir 的路径
+
+    - 注意：指定 previous_dir 时，内容与 previous_dir 中同一文件完全一致的文件直接硬链接，不再重复写入
+    - 注意：硬链接共享的文件先删除再写入，不能修改其他目录中的同一文件
+    """
+    def __init__(self, output_dir: str, previous_dir: str = None):
+        self.output_dir = output_dir
+        self.previous_dir = previous_dir
+
+    def write(self, filepath: str, filetext: str):
+        if self.previous_dir is not None and self.reuse(filepath, data=filetext.encode("utf-8")):
+            return
+        path = os.path.join(self.output_dir, filepath)
+        self.unshare(path)
+        fwrite(path, filetext)
+
+    def copy(self, src_path: str, filepath: str, link: bool = False):
+        """复制单一文件，link 为 True 时优先使用硬链接，只用于内容不会改变的源文件
+        """
+        if self.previous_dir is not None and self.reuse(filepath, stat=os.stat(src_path)):
+            return
+        path = os.path.join(self.output_dir, filepath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.unshare(path)
+        if link:
+            try:
+                os.link(src_path, path)
+                return
+            except OSError:
+                pass
+        shutil.copy2(src_path, path)
+
+    def reuse(self, filepath: str, data: bytes = None, stat: os.stat_result = None):
+        """previous_dir 中同一文件内容一致时直接硬链接，返回是否复用
+
+        - 注意：渲染结果按字节比较，复制的文件按 (size, mtime) 比较，copy2 复制的文件保留源文件 mtime
+        """
+        previous = os.path.join(self.previous_dir, filepath)
+        try:
+            previous_stat = os.stat(previous)
+        except OSError:
+            return False
+        if data is not None:
+            if previous_stat.st_size != len(data):
+                return False
+            with open(previous, "rb") as fd:
+                if fd.read() != data:
+                    return False
+        elif (previous_stat.st_size, previous_stat.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return False
+
+        path = os.path.join(self.output_dir, filepath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.unshare(path)
+        try:
+            os.link(previous, path)
+        except OSError:
+            return False
+        return True
+
+    def unshare(self, path: str):
+        try:
+            if os.lstat(path).st_nlink > 1:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, filepath: str):
+        """删除单一文件，并删除因此变为空的目录
+        """
+        output_dir = os.path.normpath(self.output_dir)
+        path = os.path.normpath(os.path.join(output_dir, filepath))
+        if os.path.exists(path):
+            os.remove(path)
+
+        dirpath = os.path.dirname(path)
+        while dirpath.startswith(output_dir + os.sep) and os.path.isdir(dirpath) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+            dirpath = os.path.dirname(dirpath)
+
+
+class BufferWriter:
+    """按写入顺序在内存中缓存渲染结果，多进程渲染时由 worker 进程返回给主进程统一写入
+    """
+    def __init__(self):
+        self.files = [] # (filepath, filetext)
+
+    def write(self, filepath: str, filetext: str):
+        self.files.append((filepath, filetext))
+
+
+class TreeHoleRenderer:
+    """模板渲染层，编译好的模板和文章卡片片段在整个构建过程中复用
+
+    - 注意：模板只在第一次使用时编译，此后全部页面共享同一个 tornado.template.Loader
+    - 注意：文章卡片片段按 (variant, post.id, post.updated_at, locale) 缓存，
+        同一篇文章出现在 index/daily/monthly/yearly/post 多个页面时只渲染一次
+    - 注意：default_locale 页面输出到根目录，其余 locale 页面输出到 `/<locale>/` 目录
+    """
+    card_template = "card.html"
+
+    def __init__(self, settings: dict, locale_code: str = None, writer: FileWriter = None):
+        self.settings = settings
+        self.writer = writer or FileWriter(self.settings.get("output_dir"), self.settings.get("output_previous"))
+        self.loader = tornado.template.Loader(self.settings.get("template_path"), whitespace="single")
+        self.locale_code = locale_code or self.settings.get("default_locale")
+        self.locale = tornado.locale.get(self.locale_code)
+        if self.locale_code == self.settings.get("default_locale"):
+            self.url_prefix = ""
+        else:
+            self.url_prefix = f"/{self.locale_code}"
+        self.fragments = {}
+        self.fragments_hits = 0
+        self.fragments_misses = 0
+        self.minify_stats = {} # page → [pages, bytes_before, bytes_after, minify_seconds, render_seconds]
+
+    def namespace(self):
+        return {
+            "datetime": datetime,
+            # tornado module
+            "locale": self.locale,
+            "_": self.locale.translate,
+            "pgettext": self.locale.pgettext,
+            # global template_vars
+            "default_locale": self.settings.get("default_locale"),
+            "locale_code": self.locale_code,
+            "url_prefix": self.url_prefix,
+            "base_url": self.settings.get("base_url"),
+            "site_title": self.settings.get("site_title"),
+            "site_desc": self.settings.get("site_desc"),
+            "search": self.settings.get("search"),
+            "offline": self.settings.get("offline"),
+            "counters": self.settings.get("counters"),
+            # ui_methods
+            "github_reactions":  github_reactions,
+            "post_card": self.post_card,
+            "static_url": self.static_url,
+        }
+
+    def render(self, template_name: str, **kwargs):
+        t = self.loader.load(template_name)
+        namespace = self.namespace()
+        namespace.update(kwargs)
+
+        # 注意：此处必须单独使用 try 方便直接显示出错的模板行数
+        try:
+            return t.generate(**namespace).decode()
+        except Exception as e:
+            logger.exception(f'fail to render: {template_name}, exception={e}')
+            return ""
+
+    def static_url(self, path: str):
+        """返回静态文件的链接，启用 hash_assets 时返回压缩之后带内容 hash 的文件名
+        """
+        return (self.settings.get("static_urls") or {}).get(path) or f"/{path}"
+
+    def render_page(self, page: dict):
+        """渲染单一 Archive/归档 页面，并写入当前 locale 对应的输出路径
+
+        - 注意：启用 minify_html 时在写入之前压缩 HTML，并按页面类型统计压缩前后的字节数和耗时
+        """
+        if not self.settings.get("minify_html"):
+            filetext = self.render(page.get("template_name"), **page.get("template_vars"))
+        else:
+            started = time.perf_counter()
+            filetext = self.render(page.get("template_name"), **page.get("template_vars"))
+            rendered = time.perf_counter()
+            before = len(filetext.encode("utf-8"))
+            filetext = minify_html(filetext)
+            stats = self.minify_stats.setdefault(page["template_vars"].get("page") or page.get("template_name"), [0, 0, 0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += before
+            stats[2] += len(filetext.encode("utf-8"))
+            stats[3] += time.perf_counter() - rendered
+            stats[4] += rendered - started
+        self.writer.write(os.path.join(self.url_prefix.lstrip("/"), page.get("filepath")), filetext)
+
+    def discard_post_cards(self, post_id: int):
+        """丢弃单一文章全部已缓存的卡片片段，用于常驻进程中文章修改后释放旧的片段
+        """
+        self.fragments = { key: fragment for key, fragment in self.fragments.items() if key[1] != post_id }
+
+    def post_card(self, post: TreeHolePost, variant: str):
+        """渲染单一文章卡片片段，同一篇文章同一 variant 只渲染一次
+
+        - 注意：归档中按日/按月的链接条目（dict 无 id 字段）不缓存，每次直接渲染
+        """
+        post_id = post.get("id")
+        if post_id is None:
+            return self._render_card(post, variant)
+
+        key = (variant, post_id, post.get("updated_at"), self.locale_code)
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            self.fragments_misses += 1
+            fragment = self._render_card(post, variant)
+            self.fragments[key] = fragment
+        else:
+            self.fragments_hits += 1
+        return fragment
+
+    def _render_card(self, post: TreeHolePost, variant: str):
+        t = self.loader.load(self.card_template)
+        namespace = self.namespace()
+        namespace.update(post=post, variant=variant)
+        return t.generate(**namespace).decode()
+
+
+class RenderScheduler:
+    """按进程池并行渲染全部归档页面，渲染结果由 worker 进程直接写入 output_dir
+
+    - 注意：tornado.template 渲染是纯 Python 代码受 GIL 限制，此处只能使用多进程
+    - 注意：每个 worker 进程拥有独立的 TreeHoleRenderer（模板 Loader/locale/卡片片段缓存）
+    - 注意：每个页面只由一个 worker 渲染写入，输出结果与串行渲染逐字节一致
+    - 注意：优先使用 fork 直接继承全部页面数据，只传递页面序号范围，避免重复序列化全部文章
+    - 注意：多语言构建时按 (locale, 页面范围) 切分任务，全部 locale 共享同一份页面数据
+    - 注意：指定 writer 时（比如直接写入压缩包）worker 进程不写入文件，渲染结果按任务顺序返回主进程写入
+    """
+    def __init__(self, settings: dict, workers: int, writer = None):
+        self.settings = settings
+        self.workers = workers
+        self.writer = writer
+        self.minify_stats = {}
+
+    def run(self, pages: list[dict], locales: list[str] = None):
+        global _worker_pages
+
+        locales = locales or [ self.settings.get("default_locale") ]
+        if not pages:
+            return 0
+
+        # 注意：按连续区间切分页面，相邻页面通常共享相同的文章卡片，方便 worker 内部复用片段缓存
+        # 注意：切分数量为 workers 的四倍，避免单个 worker 分到过多的大页面
+        chunk_size = max(1, -(-len(pages) * len(locales) // (self.workers * 4)))
+        ranges = [
+            (locale_code, start, min(start + chunk_size, len(pages)))
+            for locale_code in locales
+            for start in range(0, len(pages), chunk_size)
+        ]
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            _worker_pages = pages
+            tasks = ranges
+        else:
+            context = multiprocessing.get_context("spawn")
+            tasks = [ (locale_code, pages[start:end]) for locale_code, start, end in ranges ]
+
+        logger.info(
+            f'render scheduler, pages={len(pages)}, locales={",".join(locales)}, '
+            f'workers={self.workers}, chunks={len(tasks)}'
+        )
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_render_worker,
+                initargs=(self.settings, self.writer is not None)
+            ) as executor:
+                count = 0
+                for pages_count, minify_stats, files in executor.map(_render_worker_pages, tasks):
+                    count += pages_count
+                    merge_minify_stats(self.minify_stats, minify_stats)
+                    for filepath, filetext in files or ():
+                        self.writer.write(filepath, filetext)
+                return count
+        finally:
+            _worker_pages = None
+
+
+# 注意：以下为 worker 进程全局变量，每个 worker 进程各自初始化一次
+_worker_pages = None
+_worker_settings = None
+_worker_renderers = {}
+_worker_buffered = False
+
+
+def _init_render_worker(settings: dict, buffered: bool = False):
+    global _worker_settings, _worker_buffered
+
+    # 注意：spawn 方式启动的 worker 进程需要重新加载 gettext 翻译，fork 方式重复加载也无影响
+    locale_path = settings.get("locale_path")
+    if locale_path and os.path.isdir(locale_path):
+        tornado.locale.load_gettext_translations(locale_path, settings.get("locale_domain") or "treehole")
+    if settings.get("default_locale"):
+        tornado.locale.set_default_locale(settings.get("default_locale"))
+
+    _worker_settings = settings
+    _worker_buffered = buffered
+    _worker_renderers.clear()
+
+
+def _render_worker_pages(task: tuple):
+    if len(task) == 3:
+        locale_code, start, end = task
+        pages = _worker_pages[start:end]
+    else:
+        locale_code, pages = task
+
+    # 注意：每个 locale 使用独立的 renderer 各自缓存文章卡片片段
+    renderer = _worker_renderers.get(locale_code)
+    if renderer is None:
+        renderer = _worker_renderers[locale_code] = TreeHoleRenderer(_worker_settings, locale_code)
+
+    # 注意：minify_stats 只返回本次任务的统计结果，由主进程累加
+    renderer.minify_stats = {}
+    if _worker_buffered:
+        renderer.writer = BufferWriter()
+    for page in pages:
+        renderer.render_page(page)
+    return (len(pages), renderer.minify_stats, renderer.writer.files if _worker_buffered else None)
+
+
+def merge_minify_stats(stats: dict, other: dict):
+    for page, values in other.items():
+        merged = stats.setdefault(page, [0, 0, 0, 0.0, 0.0])
+        for i, value in enumerate(values):
+            merged[i] += value
+    return stats
+
+
+def log_minify_stats(stats: dict):
+    """按页面类型输出 HTML 压缩节省的字节数，以及压缩耗时相对于模板渲染耗时的占比
+    """
+    for page, (pages, before, after, minify_seconds, render_seconds) in sorted(stats.items()):
+        logger.info(
+            f'minify html, page={page}, pages={pages}, before={before / 1024:.0f}KiB, after={after / 1024:.0f}KiB, '
+            f'saved={(before - after) * 100 / max(before, 1):.1f}%, minify={minify_seconds * 1000:.0f}ms '
+            f'({minify_seconds * 100 / max(render_seconds, 1e-9):.0f}% of render), '
+            f'throughput={before / 1024 / 1024 / max(minify_seconds, 1e-9):.1f}MiB/s'
+        )
+
+
 # 
 # app
 # 
@@ -667,13 +1303,30 @@ class TreeHoleApp:
         os.makedirs(self.settings.get("output_dir"), exist_ok=True)
         os.makedirs(self.settings.get("backup_dir"), exist_ok=True)
         
+        self.settings.setdefault("cache_assets", os.path.join(data_path, "_assets.json"))
+        self.settings.setdefault("cache_images", os.path.join(data_path, "_images.json"))
+        self.settings.setdefault("images_path", os.path.join(data_path, "_images"))
+        self.settings.setdefault("cache_backup", os.path.join(data_path, "_backup.json"))
+        self.settings.setdefault("cache_publish", os.path.join(data_path, "_publish.json"))
+
+        self.writer = FileWriter(self.settings.get("output_dir"))
+        self.renderer = TreeHoleRenderer(self.settings, writer=self.writer)
+        self.search_index = None
+        self.static_api = None
+        self.service_worker_version = None
+        self.assets = AssetPipeline(self.settings.get("static_path"), self.settings.get("cache_assets"))
+        self.images = None
+
         if self.settings.get("cache_data", True):
+            self.settings.setdefault("cache_store", os.path.join(data_path, "_treehole.sqlite3"))
+            # 注意：旧版本的 JSON 缓存文件，仅用于一次性导入 cache_store
             self.settings.setdefault("cache_issues", os.path.join(data_path, "_issues.json"))
             self.settings.setdefault("cache_comments", os.path.join(data_path, "_comments.json"))
 
     def clean_up(self):
         output_dir = self.settings.get("output_dir")
         logger.info(f'clean up folder: {output_dir}')
+        self.service_worker_version = None
 
         for rel_path in os.listdir(output_dir):
             path = os.path.join(output_dir, rel_path)
@@ -685,207 +1338,707 @@ class TreeHoleApp:
                 except Exception as e:
                     logger.exception(f'no delete: {path}, exception: {e}')
     
-    def load_data(self):
-        """加载数据
-        - debug 状态而且 ./data 目录有对应文件，那么从本地加载数据
-        - 否则从 github 加载数据
+    def repositories(self):
+        """返回需要构建的全部仓库，未指定 github_repos 时只有 github_owner/github_repo 一个仓库
+
+        - 注意：github_repos 格式为逗号分隔的 `owner/repo` 列表，全部仓库的文章合并到同一个网站中
+        """
+        github_repos = self.settings.get("github_repos")
+        if not github_repos:
+            return [ TreeHoleRepo(self.settings.get("github_owner"), self.settings.get("github_repo")) ]
+
+        repos = []
+        for full_name in github_repos.split(","):
+            owner, _, repo = full_name.strip().partition("/")
+            if not owner or not repo or "/" in repo:
+                raise ValueError(f'invalid github_repos={github_repos}, expected comma separated owner/repo')
+            repos.append(TreeHoleRepo(owner, repo, len(repos)))
+
+        if len(set( source.full_name.lower() for source in repos )) != len(repos):
+            raise ValueError(f'invalid github_repos={github_repos}, duplicated repo')
+        return repos
+
+    def repo_store_path(self, source: TreeHoleRepo):
+        """返回仓库对应的 store 缓存路径，聚合构建时每个仓库使用各自独立的 store
+
+        - 注意：聚合构建时 cache_store 只保存按 post.id 缓存的分词结果，不保存任何仓库的 issues/comments
         """
+        cache_store = self.settings.get("cache_store")
+        if not cache_store or not self.settings.get("github_repos"):
+            return cache_store
+        return os.path.join(os.path.dirname(cache_store), f"_treehole-{source.owner}-{source.repo}.sqlite3")
+
+    def load_stores(self):
+        """返回全部仓库各自包含全部 issues/comments 数据的 [(repo, store)] 列表
+        - debug 状态而且 ./data 目录有对应 store 缓存，那么直接使用本地缓存
+        - 否则从 github 加载数据，调试状态下同时写入本地缓存，否则只使用内存中的 store
+        - 启用 persist_cache 时同样从 github 加载数据，但整体替换本地缓存中的数据，并复用其中的 markdown 渲染/分词结果缓存
+        - 聚合构建时全部需要拉取的仓库共用同一个 GithubClient 并发拉取，评论请求共享 client.concurrency 并发上限
+        """
+        cache_store = self.settings.get("cache_store")
         cache_issues = self.settings.get("cache_issues")
         cache_comments = self.settings.get("cache_comments")
 
-        if (self.settings.get("debug") and os.path.exists(cache_issues) and os.path.exists(cache_comments)):
-            logger.info(
-                f'use cache_data, issues={self.settings.get("cache_issues")}, '
-                f'comments={self.settings.get("cache_comments")}'
-            )
-            with open(cache_issues, "rt") as fd:
-                issues = json.load(fd)
-            with open(cache_comments, "rt") as fd:
-                comments = json.load(fd)
-        
-        else:
-            owner = self.settings.get("github_owner")
-            repo = self.settings.get("github_repo")
-            token = self.settings.get("github_token")
-
-            logger.info(f'use github_data, github_owner={owner}, github_repo={repo}')
+        # 注意：旧版本的 _issues.json/_comments.json 缓存文件，仅在 store 不存在时一次性导入
+        if (self.settings.get("debug") and cache_store and not os.path.exists(cache_store)
+                and not self.settings.get("github_repos")
+                and os.path.exists(cache_issues) and os.path.exists(cache_comments)):
+            with TreeHoleStore(cache_store) as store:
+                import_json_cache(store, cache_issues, cache_comments)
+
+        repos = self.repositories()
+        stores = {}
+        fetches = []
+        for source in repos:
+            store_path = self.repo_store_path(source)
+            if (self.settings.get("debug") and store_path and os.path.exists(store_path)):
+                logger.info(f'use cache_data, store={store_path}')
+                stores[source.index] = TreeHoleStore(store_path)
+            else:
+                fetches.append(source)
 
+        if fetches:
+            token = self.settings.get("github_token")
             client = GithubClient(token)
 
             # 注意：此处需要将异步函数转为同步执行，注意下面的定义函数
             # 注意：由于函数返回异步生成器 yield+async 此处需要包裹中间的异步函数来执行
-            async def get_repo_issues():
+            async def get_repo_issues(source: TreeHoleRepo):
+                logger.info(f'use github_data, github_owner={source.owner}, github_repo={source.repo}')
                 issues = []
-                async for issue in client.get_repo_issues(owner, repo):
-                    issues.append(issue)
+                async for issue in client.get_repo_issues(source.owner, source.repo):
+                    issues.append(GithubIssue(issue))
                 return issues
-            
-            async def get_issue_comments():
-                comments = []
-                async for comment in client.get_issue_comments(owner, repo):
-                    comments.append(comment)
-                return comments
+
+            # 注意：此处不再拉取整个仓库的全部 comments（包括 closed/pull_request/其他用户 issue 的 comments）
+            # 注意：只对会出现在网站中并且 comments 数量不为 0 的 issue 并发拉取各自的 comments
+            # 注意：任意 issue 的 comments 拉取失败时，等待其余请求完成之后汇总全部失败的 issue 并终止构建，
+            #           不能发布缺少 comments 的文章页面
+            async def get_issue_comments(source: TreeHoleRepo, issues: list[GithubIssue], semaphore: asyncio.Semaphore):
+                async def get_comments(issue: GithubIssue):
+                    comments = []
+                    async with semaphore:
+                        async for comment in client.get_issue_comments(source.owner, source.repo, issue_number=issue.issue_number):
+                            comments.append(GithubComment(comment))
+                    return comments
+
+                results = await asyncio.gather(*( get_comments(issue) for issue in issues ), return_exceptions=True)
+                failed = [ issue.issue_number for issue, result in zip(issues, results) if isinstance(result, BaseException) ]
+                if failed:
+                    raise RuntimeError(f'get_issue_comments failed, repo={source.full_name}, issues={len(failed)}, numbers={",".join(map(str, failed[:10]))}')
+                return [ comment for comments in results for comment in comments ]
+
+            async def get_repo_data(source: TreeHoleRepo, semaphore: asyncio.Semaphore):
+                issues = await get_repo_issues(source)
+                commented = [ issue for issue in issues if self.is_published(issue, source.owner) and issue.comments ]
+                comments = await get_issue_comments(source, commented, semaphore)
+                logger.info(f'get_issue_comments, repo={source.full_name}, issues={len(issues)}, commented={len(commented)}, comments={len(comments)}')
+                return (issues, comments)
+
+            # 注意：全部仓库在同一个事件循环中并发拉取，不再按仓库依次拉取
+            async def get_repos_data():
+                semaphore = asyncio.Semaphore(client.concurrency)
+                return await asyncio.gather(*( get_repo_data(source, semaphore) for source in fetches ))
 
             # 注意：此处使用 asyncio.get_event_loop() 在 3.12 及更高版本中，
             #           如果当前线程没有正在运行的事件循环，调用该方法会直接抛出 RuntimeError
             # 使用 asyncio.run 自动创建和管理生命周期
-            issues = asyncio.run(get_repo_issues())
-            comments = asyncio.run(get_issue_comments())
+            results = asyncio.run(get_repos_data())
+            client.tokens.report()
+
+            for source, (issues, comments) in zip(fetches, results):
+                store_path = self.repo_store_path(source)
+                # 调试状态下缓存数据，否则只使用内存中的 store 完成本次构建
+                # 注意：此处缓存 GithubModels 转换后的精简数据，原始接口返回的冗余字段不再保存
+                if self.settings.get("debug") and store_path:
+                    logger.info(f'save cache_data, store={store_path}')
+                    store = TreeHoleStore(store_path)
+                elif self.settings.get("persist_cache") and store_path:
+                    # 注意：此处 Github 已经删除/关闭的 issue 不能残留在缓存中，先清空再写入最新数据
+                    logger.info(f'refresh cache_data, store={store_path}')
+                    store = TreeHoleStore(store_path)
+                    store.clear_data()
+                else:
+                    store = TreeHoleStore(":memory:")
+
+                store.save_issues(issues)
+                store.save_comments(comments)
+                stores[source.index] = store
+
+        return [ (source, stores[source.index]) for source in repos ]
 
-            # 调试状态下缓存数据
-            # 注意：此处是缓存 Github 接口返回的原始数据，方便后续 debug 使用
-            if self.settings.get("debug"):
-                logger.info(
-                    f'save cache_data, issues={self.settings.get("cache_issues")}, '
-                    f'comments={self.settings.get("cache_comments")}'
-                )
+    def load_data(self):
+        """加载数据，返回全部需要出现在网站内容中的 (posts, comments)
 
-                with open(cache_issues, "w") as fd:
-                    json.dump(issues, fd, ensure_ascii=False, indent=2)
-                with open(cache_comments, "w") as fd:
-                    json.dump(comments, fd, ensure_ascii=False, indent=2)
-        
-        # 所有的数据按照 GithubModels 转换一遍
-        issues = [ dict(GithubIssue(issue)) for issue in issues ]
-        comments = [ dict(GithubComment(comment)) for comment in comments ]
+        - 注意：聚合构建时全部仓库的文章合并为同一个时间线，post.id 按仓库序号偏移，永久链接冲突时追加仓库名
+        """
+        aggregated = bool(self.settings.get("github_repos"))
+        posts = []
+        comments = []
+        for source, store in self.load_stores():
+            # 注意：此处直接在 store 查询中完成筛选，只读取需要出现在网站内容中的 issues/comments
+            #   - 跳过所有带有 pull_request 的 issue 这个没有必要出现在网站内容中
+            #   - 筛选所有 issue.state='open' 的 issue 其余状态的 issue 不适宜出现在网站内容中
+            #   - 筛选仓库拥有者创建的 issue，与常驻进程模式中的筛选条件一致
+            owner = source.owner or None
+            source = source if aggregated else None
+            with store:
+                issues = list(store.iter_issues(state="open", pull_request=False, user=owner))
+                repo_comments = list(store.iter_comments(state="open", pull_request=False, user=owner))
+
+                logger.info(f'count data after filters, issues={len(issues)}, comments={len(repo_comments)}')
+
+                # 所有数据按照 TreeHoleModels 再转换一遍，符合当前程序使用要求
+                # 注意：markdown 渲染结果按 issue_number/updated_at 缓存在 store 中，未修改的 issue 无需重新渲染
+                rendered_maps = store.get_rendered(markdown_version())
+                rendered_updates = []
+                repo_posts = []
+                for issue in issues:
+                    rendered = rendered_maps.get(issue.issue_number)
+                    if rendered is None or rendered.get("updated_at") != issue.updated_at:
+                        body_html, extraction = markdown_extract(issue.body)
+                        rendered = {
+                            "number": issue.issue_number,
+                            "updated_at": issue.updated_at,
+                            "body_html": body_html,
+                            **extraction.to_dict()
+                        }
+                        rendered_updates.append(rendered)
+                    repo_posts.append(TreeHolePost(issue, rendered, source))
 
-        logger.info(f'count data before filters, issues={len(issues)}, comments={len(comments)}')
+                if rendered_updates:
+                    store.save_rendered(rendered_updates)
+                logger.info(f'render markdown, cached={len(repo_posts) - len(rendered_updates)}, rendered={len(rendered_updates)}')
 
-        # 跳过所有带有 pull_request 的 issue 这个没有必要出现在网站内容中
-        issues = [ issue for issue in issues if "pull_request" not in issue ]
-        # 筛选所有 issue.state='open' 的 issue 其余状态的 issue 不适宜出现在网站内容中
-        issues = [ issue for issue in issues if issue.get("state") == "open" ]
+            posts.extend(repo_posts)
+            comments.extend( (source, comment) for comment in repo_comments )
 
-        logger.info(f'count data after filters, issues={len(issues)}, comments={len(comments)}')
+        if aggregated:
+            self.unique_permalinks(posts)
 
-        # 所有数据按照 TreeHoleModels 再转换一遍，符合当前程序使用要求
-        posts = [ dict(TreeHolePost(issue)) for issue in issues ]
-        comments = [ dict(TreeHoleComment(comment)) for comment in comments ]
+        # 分片构建只需要当前分片年份内文章的评论
+        shard = self.shard_years()
+        if shard:
+            shard_ids = set( post.id for post in posts if shard[0] <= post.datetime.year <= shard[1] )
+            comments = [
+                (source, comment) for source, comment in comments
+                if comment.issue_number + (source.id_offset if source else 0) in shard_ids
+            ]
+
+        comments = [ TreeHoleComment(comment, source) for source, comment in comments ]
 
         return (posts, comments)
 
-    def render(self, template_name: str, **kwargs):
-        template_path = self.settings.get("template_path")
-        template_kwargs = {
-            "whitespace": "single"
-        }
-        loader = tornado.template.Loader(template_path, **template_kwargs)
-        t = loader.load(template_name)
-        locale = tornado.locale.get(self.settings.get("default_locale"))
-        namespace = {
-            "datetime": datetime,
-            # tornado module
-            "locale": locale,
-            "_": locale.translate,
-            "pgettext": locale.pgettext,
-            # global template_vars
-            "default_locale": self.settings.get("default_locale"),
-            "base_url": self.settings.get("base_url"),
-            "site_title": self.settings.get("site_title"),
-            "site_desc": self.settings.get("site_desc"),
-            # ui_methods
-            "github_reactions":  github_reactions,
-        }
-        namespace.update(kwargs)
+    def unique_permalinks(self, posts: list[TreeHolePost]):
+        """聚合构建时处理不同仓库文章的永久链接冲突，冲突的文章 slug 依次追加 repo/owner-repo/post.id
 
-        # 注意：此处必须单独使用 try 方便直接显示出错的模板行数
-        try:
-            return t.generate(**namespace).decode()
-        except Exception as e:
-            logger.exception(f'fail to render: {template_name}, exception={e}')
-            return ""
+        - 注意：按 post.id 顺序处理，第一个仓库的文章永久链接始终保持不变
+        """
+        filepaths = set()
+        for post in sorted(posts, key=lambda post: post.id):
+            if post.filepath in filepaths and post.id >= TreeHoleRepo.id_stride:
+                owner, _, repo = post.repo.partition("/")
+                slug = post.slug
+                for suffix in (repo, f"{owner}-{repo}", post.id):
+                    post.set_slug(slugify(f"{slug}-{suffix}"))
+                    if post.filepath not in filepaths:
+                        break
+                logger.info(f'permalink conflict, repo={post.repo}, slug={slug}, renamed={post.slug}')
+            filepaths.add(post.filepath)
+
+    def is_published(self, issue: GithubIssue, owner: str = None):
+        """返回 issue 是否出现在网站中，只有仓库拥有者创建的 open 状态 issue 才会出现在网站中
+
+        - 注意：聚合构建时 owner 为 issue 所属仓库的拥有者，未指定时使用 github_owner
+        """
+        owner = owner or self.settings.get("github_owner")
+        return (
+            issue.state == "open" and not issue.is_pull_request
+            and (not owner or issue.user.login.lower() == owner.lower())
+        )
+
+    def shard_years(self):
+        """返回分片构建的年份范围 (first_year, last_year)，非分片构建返回 None
+
+        - 注意：shard 参数格式为 `2019` 或者 `2019-2021` 均包含首尾年份
+        """
+        shard = self.settings.get("shard")
+        if not shard:
+            return None
+
+        first, _, last = str(shard).partition("-")
+        first, last = int(first), int(last or first)
+        if first > last:
+            raise ValueError(f'invalid shard={shard}, first year must not be after last year')
+        return (first, last)
+
+    def render(self, template_name: str, **kwargs):
+        return self.renderer.render(template_name, **kwargs)
 
     def copy_file(self):
         static_path = self.settings.get("static_path")
         output_dir = self.settings.get("output_dir")
 
         logger.info(f'copy_file/static_file, from_dir={static_path}, to_dir={output_dir}')
-        os.makedirs(output_dir, exist_ok=True)
+        self.copy_tree(static_path)
 
-        for rel_path in os.listdir(static_path):
-            src_path = os.path.join(static_path, rel_path)
-            dst_path = os.path.join(output_dir, rel_path)
+    def copy_tree(self, src_dir: str):
+        """按文件路径顺序将 src_dir 中的全部文件通过 writer 复制到输出目录/压缩包
+        """
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                src_path = os.path.join(dirpath, filename)
+                self.writer.copy(src_path, os.path.relpath(src_path, src_dir))
 
-            if os.path.isdir(src_path):
-                shutil.copytree(src_path, dst_path, dirs_exist_ok=True)
-            else:
-                shutil.copy2(src_path, dst_path)
+    def build_assets(self):
+        """压缩 CSS/JS 并计算带内容 hash 的文件名，模板通过 static_url() 引用
 
-    def run(self):
-        logger.info(f'app started')
+        - 注意：必须在渲染页面之前执行，结果保存在 settings 中，多进程渲染时 worker 进程同样可以使用
+        """
+        if not self.settings.get("hash_assets"):
+            self.settings["static_urls"] = {}
+            return
+        self.settings["static_urls"] = self.assets.build()
 
-        # 首先清理输出目录
-        self.clean_up()
+    def write_assets(self):
+        """输出压缩之后带内容 hash 的 CSS/JS 文件，以及可选的 `_headers` 缓存设置文件
+        """
+        if not self.settings.get("hash_assets"):
+            return
+        self.assets.write(self.writer)
+        if self.settings.get("headers_file"):
+            self.writer.write("_headers", self.assets.headers())
 
-        # 加载数据
-        posts, comments = self.load_data()
+    def backup(self, posts: list[TreeHolePost], comments: list[TreeHoleComment]):
+        """将全部文章备份为 backup_dir 中的 markdown 文件，只写入内容发生变化的文章
 
-        # 按照 Archive/归档 类别处理输出
-        archives = {
-            "index": IndexArchive(posts),
-            "daily": DailyArchive(posts),
-            "monthly": MonthlyArchive(posts),
-            "yearly": YearlyArchive(posts),
-            "post": PostArchive(posts, comments)
-        }
-        for archive, _posts in archives.items():
-            logger.info(f'render {archive}, items={len(archives[archive])}')
-            for post in _posts:
-                filetext = self.render(post.get("template_name"), **post.get("template_vars"))
-                fwrite(os.path.join(self.settings.get("output_dir"), post.get("filepath")), filetext)
-        
-        # 按照 Generator/生成器 类别处理输出
-        feedmap = FeedmapGenerator(posts, {
-                "title": self.settings.get("site_title"),
-                "link": self.settings.get("base_url")
-            }, self.settings.get("base_url")
+        - 注意：启用 backup_archive 时同时将文章/评论追加写入 `backup_dir/treehole.jsonl.gz` 单一压缩归档文件
+        """
+        backup = MarkdownBackup(
+            self.settings.get("backup_dir"),
+            self.settings.get("cache_backup"),
+            archive=self.settings.get("backup_archive"),
+        )
+        return backup.run(posts, comments)
+
+    def mirror_images(self, posts: list[TreeHolePost]):
+        """并发下载全部文章中的 Github 图片到本地存储，并将 body_html/image 改写为本地链接
+
+        - 注意：必须在渲染页面之前执行，分片构建时同样只改写当前分片的文章
+        - 注意：下载失败的图片保留原始链接，不影响本次构建
+        """
+        hosts = [ host.strip() for host in (self.settings.get("mirror_images_hosts") or "").split(",") if host.strip() ]
+        self.images = ImageMirror(self.settings.get("images_path"), self.settings.get("cache_images"), hosts)
+
+        urls = [ url for post in posts for url in self.images.post_urls(post) ]
+        fetched, failed = asyncio.run(self.images.fetch(urls))
+        rewritten = sum( self.images.rewrite(post, self.settings.get("base_url")) for post in posts )
+        logger.info(
+            f'mirror images, urls={len(set(urls))}, cached={len(set(urls)) - fetched - failed}, '
+            f'fetched={fetched}, failed={failed}, posts={rewritten}'
         )
+
+    def locales(self):
+        """返回需要构建的全部 locale 列表，default_locale 始终排在第一位
+
+        - 注意：locales 参数格式为 `en,zh_CN,zh_TW,zh_HK` 未指定时只构建 default_locale
+        """
+        default_locale = self.settings.get("default_locale")
+        locales = [ default_locale ]
+        for locale_code in (self.settings.get("locales") or "").split(","):
+            locale_code = locale_code.strip()
+            if locale_code and locale_code not in locales:
+                locales.append(locale_code)
+
+        supported_locales = tornado.locale.get_supported_locales()
+        for locale_code in locales[1:]:
+            if locale_code not in supported_locales:
+                logger.warning(f'locale={locale_code} has no translations, fallback to default_locale')
+        return locales
+
+    def render_archives(self, archives: dict):
+        """渲染全部 Archive/归档 页面并写入 output_dir
+
+        - 注意：多语言构建时全部 locale 共享同一份 markdown 渲染结果和归档分组结果，只重复执行模板渲染
+        """
+        locales = self.locales()
+        for archive, _posts in archives.items():
+            logger.info(f'render {archive}, items={len(archives[archive])}, locales={",".join(locales)}')
+
+        # 注意：render_workers > 1 时使用多进程并行渲染，否则在当前进程串行渲染
+        render_workers = self.settings.get("render_workers") or 1
+        minify_stats = {}
+        if render_workers > 1:
+            pages = [ post for _posts in archives.values() for post in _posts ]
+            scheduler = RenderScheduler(self.settings, render_workers, self.writer if not isinstance(self.writer, FileWriter) else None)
+            scheduler.run(pages, locales)
+            minify_stats = scheduler.minify_stats
+        else:
+            for locale_code in locales:
+                # 注意：每次构建使用新的 renderer 文章卡片片段缓存只在单次构建中有效
+                self.renderer = TreeHoleRenderer(self.settings, locale_code, self.writer)
+                for archive, _posts in archives.items():
+                    for post in _posts:
+                        self.renderer.render_page(post)
+
+                logger.info(
+                    f'render post_card, locale={locale_code}, fragments={len(self.renderer.fragments)}, '
+                    f'hits={self.renderer.fragments_hits}, misses={self.renderer.fragments_misses}'
+                )
+                merge_minify_stats(minify_stats, self.renderer.minify_stats)
+        log_minify_stats(minify_stats)
+
+    def render_generators(self, posts: list[TreeHolePost]):
+        """输出 feedmap.xml/sitemap.xml 等 Generator/生成器 内容
+        """
+        feed_info = {
+            "title": self.settings.get("site_title"),
+            "link": self.settings.get("base_url")
+        }
+        # 注意：设置 SOURCE_DATE_EPOCH 时 feedmap 更新时间使用此时间，相同输入多次构建的输出逐字节一致
+        source_date_epoch = os.environ.get("SOURCE_DATE_EPOCH") or ""
+        if source_date_epoch.isdigit():
+            updated = datetime.datetime.fromtimestamp(int(source_date_epoch), datetime.timezone.utc)
+            feed_info["updated"] = updated.replace(tzinfo=None).isoformat() + "Z"
+        feedmap = FeedmapGenerator(posts, feed_info, self.settings.get("base_url"))
         sitemap = SitemapGenerator(posts, self.settings.get("base_url"))
         generators = {
             "feedmap": feedmap,
             "sitemap": sitemap,
         }
+
+        # 注意：service worker 只在 version 发生变化时重新输出，常驻进程/预览服务器中文章修改时无需重复写入
+        if self.settings.get("offline"):
+            service_worker = ServiceWorkerGenerator(posts, self.settings.get("static_urls"), self.settings.get("template_path"))
+            if service_worker.version != self.service_worker_version:
+                generators["service_worker"] = service_worker
+                self.service_worker_version = service_worker.version
+            else:
+                logger.info(f'make service_worker, unchanged, version={service_worker.version}')
+
         for generator, _posts in generators.items():
             logger.info(f'make {generator}, items={len(_posts)}')
             for post in _posts:
-                filetext = post.get("filetext")
-                fwrite(os.path.join(self.settings.get("output_dir"), post.get("filepath")), filetext)
+                self.writer.write(post.get("filepath"), post.get("filetext"))
+
+    def render_counters(self, posts: list, comments: list):
+        """输出 counters.json，启用 counters 时页面中的 reactions/评论数量由 app.js 按此文件填充
+        """
+        counters = CountersGenerator(posts, comments)
+        logger.info(f'make counters, posts={len(posts)}, comments={len(comments)}')
+        for post in counters:
+            self.writer.write(post.get("filepath"), post.get("filetext"))
+
+    def run_counters(self):
+        """只重新输出 counters.json，不渲染任何页面也不渲染 markdown，用于定时刷新 reactions 数量
+
+        - 注意：与完整构建相同，调试状态并且本地缓存存在时从缓存读取，否则从 Github 拉取
+        """
+        aggregated = bool(self.settings.get("github_repos"))
+        posts = []
+        comments = []
+        for source, store in self.load_stores():
+            owner = source.owner or None
+            id_offset = source.id_offset if aggregated else 0
+            with store:
+                posts.extend(
+                    { "id": issue.issue_number + id_offset, "reactions": issue.reactions }
+                    for issue in store.iter_issues(state="open", pull_request=False, user=owner)
+                )
+                comments.extend(
+                    { "id": comment.comment_id, "post_id": comment.issue_number + id_offset, "reactions": comment.reactions }
+                    for comment in store.iter_comments(state="open", pull_request=False, user=owner)
+                )
+        self.render_counters(posts, comments)
+        logger.info(f'app exited, counters only')
+
+    def render_api(self, posts: list[TreeHolePost], comments: list[TreeHoleComment]):
+        """输出 `api/` 目录下的静态 JSON API，只写入内容发生变化的文件
+
+        - 注意：预览模式中复用同一个 StaticApi，每次更新只重新写入发生变化的文件，
+            常驻进程模式中 Webhook 使用 StaticApi.update() 只重新生成受影响的文件
+        """
+        if self.static_api is None:
+            self.static_api = StaticApi(self.settings.get("base_url"), self.settings.get("json_api_per_page") or 20)
+        archives = {
+            "yearly": YearlyArchive(posts),
+            "monthly": MonthlyArchive(posts),
+            "daily": DailyArchive(posts),
+        }
+        return self.static_api.write(self.writer, posts, comments, archives)
+
+    def render_search(self, posts: list[TreeHolePost]):
+        """输出站内搜索索引到 `search/` 目录
+
+        - 注意：调试状态或者启用 persist_cache 并且本地缓存存在时，分词结果缓存在 store 中，未修改的文章无需重新分词
+        """
+        cache_store = self.settings.get("cache_store")
+        store = None
+        # 注意：聚合构建时 cache_store 只用于保存分词结果，此处直接创建
+        if ((self.settings.get("debug") or self.settings.get("persist_cache")) and cache_store
+                and (os.path.exists(cache_store) or self.settings.get("github_repos"))):
+            store = TreeHoleStore(cache_store)
+
+        cache = store.get_search_terms(SearchIndex.version) if store else {}
+        self.search_index = SearchIndex(cache)
+        added, removed = self.search_index.update(posts)
+        self.search_index.write(self.writer)
+        logger.info(f'search terms, cached={added - len(self.search_index.cache_updates)}, tokenized={len(self.search_index.cache_updates)}')
+
+        if store:
+            with store:
+                store.save_search_terms(self.search_index.cache_updates)
+            self.search_index.cache_updates = []
+        return self.search_index
+
+    def merge_shards(self, shard_dirs: list[str]):
+        """将全部分片构建的输出目录合并到 output_dir
+
+        - 注意：分片之间按年份划分，输出文件不会重叠，此处直接复制即可
+        """
+        output_dir = self.settings.get("output_artifact") or self.settings.get("output_dir")
+        for shard_dir in shard_dirs:
+            logger.info(f'merge shard, from_dir={shard_dir}, to_dir={output_dir}')
+            if not os.path.isdir(shard_dir):
+                raise ValueError(f'shard output not found: {shard_dir}')
+            self.copy_tree(shard_dir)
+
+    def run(self):
+        """完整构建整个网站，返回本次构建使用的 (posts, comments) 数据
+
+        - 注意：指定 output_artifact 时全部输出直接写入压缩包，不写入也不清理 output_dir
+        - 注意：指定 output_generations 时输出到新的 generation 目录，构建完成之后原子切换 output_dir 符号链接
+        """
+        output_artifact = self.settings.get("output_artifact")
+        output_generations = self.settings.get("output_generations") or 0
+        if output_artifact and output_generations:
+            raise ValueError(f'output_artifact and output_generations can not be used together')
+        if output_generations:
+            return self.run_generation(output_generations)
+        if not output_artifact:
+            return self.build()
+
+        if self.shard_years():
+            raise ValueError(f'shard and output_artifact can not be used together')
+        writer = self.writer
+        self.writer = ArtifactWriter(output_artifact)
+        self.service_worker_version = None
+        try:
+            result = self.build()
+            self.writer.close()
+            return result
+        except BaseException:
+            self.writer.abort()
+            raise
+        finally:
+            self.writer = writer
+
+    def publish(self):
+        """将 output_dir 同步到 S3 兼容的对象存储，只上传新增/修改的文件并删除已经不存在的文件
+
+        - 注意：s3_access_key/s3_secret_key 未指定时使用 AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY 环境变量
+        """
+        if self.settings.get("output_artifact"):
+            raise ValueError(f'publish can not be used with output_artifact')
+        if not self.settings.get("s3_endpoint") or not self.settings.get("s3_bucket"):
+            raise ValueError(f's3_endpoint and s3_bucket are required for publish')
+
+        client = S3Client(
+            self.settings.get("s3_endpoint"),
+            self.settings.get("s3_bucket"),
+            self.settings.get("s3_access_key") or os.environ.get("AWS_ACCESS_KEY_ID"),
+            self.settings.get("s3_secret_key") or os.environ.get("AWS_SECRET_ACCESS_KEY"),
+            self.settings.get("s3_region") or "us-east-1",
+        )
+        publisher = S3Publisher(client, self.settings.get("output_dir"),
+            prefix=self.settings.get("s3_prefix") or "",
+            concurrency=self.settings.get("publish_concurrency") or 8,
+            cache_path=self.settings.get("cache_publish"),
+        )
+        return asyncio.run(publisher.publish())
+
+    def get_cache_bundle(self):
+        """返回 data_path 中全部可复用缓存对应的 CacheBundle
+
+        - 注意：仓库或者 store schema_version 不一致的缓存包不能使用，markdown 渲染器版本不一致时只会重新渲染
+        """
+        files = {
+            "_treehole.sqlite3": self.settings.get("cache_store"),
+            "_assets.json": self.settings.get("cache_assets"),
+            "_images.json": self.settings.get("cache_images"),
+            "_images": self.settings.get("images_path"),
+            "_backup.json": self.settings.get("cache_backup"),
+            "_publish.json": self.settings.get("cache_publish"),
+        }
+        # 注意：聚合构建时每个仓库各自的 store 同样打包
+        repos = self.repositories()
+        for source in repos:
+            store_path = self.repo_store_path(source)
+            if store_path:
+                files[os.path.basename(store_path)] = store_path
+        identity = {
+            "repo": ",".join( source.full_name for source in repos ),
+            "schema_version": TreeHoleStore.schema_version,
+        }
+        return CacheBundle({ name: path for name, path in files.items() if path }, identity, self.settings.get("data_path"))
+
+    def export_cache(self, bundle_path: str):
+        """将 data_path 中的缓存导出为单一缓存包，用于 CI 等临时环境之间保存缓存
+        """
+        from .__version__ import __version__
+        return self.get_cache_bundle().export(bundle_path,
+            treehole_version=__version__,
+            markdown_version=markdown_version(),
+            search_version=SearchIndex.version,
+        )
+
+    def import_cache(self, bundle_path: str):
+        """从缓存包恢复 data_path 中的缓存，损坏或者过期的缓存包直接忽略，之后的构建重新从 Github 获取全部数据
+        """
+        manifest = self.get_cache_bundle().load(bundle_path)
+        if manifest and manifest.get("markdown_version") != markdown_version():
+            logger.info(f'cache bundle markdown_version changed, rendered cache will be rebuilt')
+        return bool(manifest)
+
+    def run_generation(self, keep: int):
+        """构建到新的 generation 目录，与上一个 generation 内容一致的文件直接硬链接，完成之后原子切换 output_dir
+
+        - 注意：构建过程中 settings 中的 output_dir 指向新的 generation，多进程渲染的 worker 进程同样写入新的 generation
+        - 注意：构建失败时删除新的 generation，output_dir 仍然指向上一次完整的构建结果
+        """
+        output_dir = self.settings.get("output_dir")
+        generations = OutputGenerations(output_dir, keep)
+        previous = generations.current()
+        generation = generations.create()
+        logger.info(f'build generation, generation={generation}, previous={previous}')
+
+        writer = self.writer
+        self.writer = FileWriter(generation, previous)
+        self.settings["output_dir"] = generation
+        self.settings["output_previous"] = previous
+        self.service_worker_version = None
+        try:
+            result = self.build()
+        except BaseException:
+            generations.discard(generation)
+            raise
+        finally:
+            self.writer = writer
+            self.settings["output_dir"] = output_dir
+            self.settings.pop("output_previous", None)
+
+        files, linked = generations.stats(generation)
+        logger.info(f'generation files={files}, linked={linked}, written={files - linked}')
+        generations.publish(generation)
+        return result
+
+    def build(self):
+        """依次执行全部构建步骤，全部输出均通过 self.writer 写入
+        """
+        logger.info(f'app started')
+
+        shard = self.shard_years()
+        merge_shards = [ path for path in (self.settings.get("merge_shards") or "").split(",") if path ]
+        if shard and merge_shards:
+            raise ValueError(f'shard and merge_shards can not be used together')
+
+        # 注意：每次完整构建输出到全新的目录/压缩包，JSON API 需要全部重新输出
+        self.static_api = None
+
+        # 首先清理输出目录
+        # 注意：输出到压缩包或者新的 generation 目录时无需清理
+        if not self.settings.get("output_artifact") and not self.settings.get("output_generations"):
+            self.clean_up()
+
+        # 加载数据
+        posts, comments = self.load_data()
+
+        # 注意：分片构建只处理分片年份内的文章，其余年份的文章只用于计算 prev/next/related
+        if shard:
+            shard_posts = [ post for post in posts if shard[0] <= post.datetime.year <= shard[1] ]
+
+        # 下载文章中的 Github 图片到本地，并改写为本地链接
+        # 注意：分片构建只下载/改写当前分片文章中的图片，完整构建以及合并构建处理全部文章
+        if self.settings.get("mirror_images"):
+            self.mirror_images(shard_posts if shard else posts)
+
+        # 压缩 CSS/JS 并计算带内容 hash 的文件名，页面渲染时需要使用
+        self.build_assets()
+
+        # 按照 Archive/归档 类别处理输出
+        if shard:
+            # 分片构建：只输出分片年份内的文章页面和 daily/monthly/yearly 归档页面
+            # 注意：PostArchive 仍然使用全部文章计算 prev/next/related，分片边界处的链接与完整构建一致
+            shard_ids = set( post.id for post in shard_posts )
+            logger.info(f'build shard, years={shard[0]}-{shard[1]}, posts={len(shard_posts)}')
+            archives = {
+                "daily": DailyArchive(shard_posts),
+                "monthly": MonthlyArchive(shard_posts),
+                "yearly": YearlyArchive(shard_posts),
+                "post": [
+                    page for page in PostArchive(posts, comments, self.settings.get("comments_per_page") or 0)
+                    if page["template_vars"]["post"].id in shard_ids
+                ]
+            }
+        elif merge_shards:
+            # 合并构建：合并全部分片输出，只输出 index 等跨越全部年份的页面
+            self.merge_shards(merge_shards)
+            archives = {
+                "index": IndexArchive(posts),
+            }
+        else:
+            archives = {
+                "index": IndexArchive(posts),
+                "daily": DailyArchive(posts),
+                "monthly": MonthlyArchive(posts),
+                "yearly": YearlyArchive(posts),
+                "post": PostArchive(posts, comments, self.settings.get("comments_per_page") or 0)
+            }
+        self.render_archives(archives)
+
+        # 分片构建不输出 feedmap/sitemap/静态文件/备份等全局内容，全部由合并构建输出
+        if shard:
+            logger.info(f'app exited, shard={shard[0]}-{shard[1]}')
+            return (posts, comments)
+        
+        # 按照 Generator/生成器 类别处理输出
+        self.render_generators(posts)
+
+        # reactions/评论数量
+        if self.settings.get("counters"):
+            self.render_counters(posts, comments)
+
+        # 站内搜索索引
+        if self.settings.get("search"):
+            self.render_search(posts)
+
+        # 静态 JSON API
+        if self.settings.get("json_api"):
+            self.render_api(posts, comments)
 
         # 复制静态文件
         self.copy_file()
+        self.write_assets()
+        if self.images is not None:
+            logger.info(f'export images to output_dir, items={self.images.write(self.writer)}')
 
         # 在 output 目录/根目录输出 CNAME/.nojekyll 目录
         logger.info(f'export CNAME/.nojekyll to output_dir')
         cname = urllib.parse.urlparse(self.settings.get("base_url")).hostname
-        fwrite(os.path.join(self.settings.get("output_dir"), "CNAME"), str(cname))
-        fwrite(os.path.join(self.settings.get("output_dir"), ".nojekyll"), "")
+        self.writer.write("CNAME", str(cname))
+        self.writer.write(".nojekyll", "")
 
         # 生成 backup/备份文件夹
-        # 特别注意：此处 backup/备份文件夹每次 build 都不会清理删除再写入，而是直接写入新文件
-        logger.info(f'backup all posts, items={len(posts)}')
-        for post in posts:
-            filetext = f'# [{post.get("title")}]({post.get("source_url")}) \n\n {post.get("body")}'
-            # 此处执行全部的非法文件名字符过滤
-            filepath = f'{post.get("id")}_{re.sub(r"[\/\\\:\*\?\"\<\>\|\n\r]", "-", post.get("title"))}.md'
-            fwrite(os.path.join(self.settings.get("backup_dir"), filepath), filetext)
+        # 特别注意：此处 backup/备份文件夹每次 build 都不会清理删除再写入，只写入内容发生变化的文章
+        self.backup(posts, comments)
 
         logger.info(f'app exited')
-    
-    def preview(self, port=8080, bind="0.0.0.0"):
-        logger.info(f'prepare preview server')
-
-        async def run_preview():
-            app = tornado.web.Application([
-                (r"/", tornado.web.RedirectHandler, { "url": "/index.html" }),                                     # index
-                (r"/(.*)/", tornado.web.RedirectHandler, { "url": "/{0}/index.html" }),                            # yearly
-                (r"/(.*)/(.*)/", tornado.web.RedirectHandler, { "url": "/{0}/{1}/index.html" }),                   # monthly
-                (r"/(.*)/(.*)/(.*)/", tornado.web.RedirectHandler, { "url": "/{0}/{1}/{2}/index.html" }),          # daily
-                (r"/(.*)/(.*)/(.*)/(.*)/", tornado.web.RedirectHandler, { "url": "/{0}/{1}/{2}/{4}/index.html" }), # post
-                (r"/(.*)", tornado.web.StaticFileHandler, { "path": self.settings.get("output_dir") })
-            ])
-            app.listen(port, address=bind)
-            logger.info(f'preview server started at http://{bind}:{port}')
-
-            await asyncio.Event().wait()
-        
-        asyncio.run(run_preview())
+        return (posts, comments)
+
+    def preview_handlers(self):
+        """直接输出 output_dir 中的文件，目录链接直接输出其中的 index.html 无需重定向
+        """
+        return [
+            (r"/(.*)", tornado.web.StaticFileHandler, { "path": self.settings.get("output_dir"), "default_filename": "index.html" })
+        ]
@@ -4,11 +4,27 @@
 
 import datetime
 import html.parser
+import json
+import logging
 import os
 import os.path
 import re
 import string
+import sys
 import unicodedata
+import weakref
+
+
+
+logger = logging.getLogger("treehole")
+
+
+def intern(text: str):
+    """驻留字符串（如 label.name/user.login），大量重复出现时只保留一份
+    """
+    if text is None:
+        return None
+    return sys.intern(text)
 
 
 def fread(filepath):
@@ -27,6 +43,30 @@ def fwrite(filepath, text):
         fd.write(text)
 
 
+def load_json_cache(filepath: str, version: str):
+    """读取 `{"version": ..., ...}` 格式的 JSON 缓存文件，文件不存在、内容损坏或者版本不一致时返回 None
+
+    - 注意：缓存只用于跳过重复计算，任何读取错误都只输出警告，调用者按没有缓存处理即可
+    """
+    if not filepath or not os.path.exists(filepath):
+        return None
+    try:
+        cache = json.loads(fread(filepath))
+    except ValueError as e:
+        logger.warning(f'invalid json cache, path={filepath}, exception={e}')
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != version:
+        return None
+    return cache
+
+
+def save_json_cache(filepath: str, version: str, data: dict):
+    """写入与 load_json_cache() 对应的 JSON 缓存文件，filepath 为空时不写入
+    """
+    if filepath:
+        fwrite(filepath, json.dumps({ "version": version, **data }, ensure_ascii=False))
+
+
 def slugify(value="", allow_unicode=False):
     """返回符合 URL要求的 slug url 格式 
     该函数抄袭自 django.utils.text.slugify 的实现
@@ -86,7 +126,8 @@ class H1AndImageExtractor(html.parser.HTMLParser):
         super().__init__()
         self.in_h1 = False
         self.in_p = False
-        self.current_text = ""
+        # 注意：此处使用列表收集文本片段，避免字符串反复拼接
+        self.current_text = []
 
         self.titles = []
         self.images = []
@@ -95,10 +136,10 @@ class H1AndImageExtractor(html.parser.HTMLParser):
     def handle_starttag(self, tag, attrs):
         if tag == 'h1':
             self.in_h1 = True
-            self.current_text = ''
+            self.current_text = []
         elif tag == 'p':
             self.in_p = True
-            self.current_text = ''
+            self.current_text = []
         elif tag == 'img':
             attrs_dict = dict(attrs)
             src = attrs_dict.get('src')
@@ -108,14 +149,95 @@ class H1AndImageExtractor(html.parser.HTMLParser):
     def handle_endtag(self, tag):
         if tag == 'h1' and self.in_h1:
             self.in_h1 = False
-            self.titles.append(self.current_text.strip())
+            self.titles.append("".join(self.current_text).strip())
         elif tag == 'p' and self.in_p:
-            text = self.current_text.strip()
+            text = "".join(self.current_text).strip()
             if text:
                 self.paragraphs.append(text)
             self.in_p = False
 
     def handle_data(self, data):
         if self.in_h1 or self.in_p:
-            self.current_text += data
+            self.current_text.append(data)
+
 
+
+class Record:
+    """使用 __slots__ 实现的精简数据模型基类，替代原来的 dict 子类数据模型
+
+    - 注意：此处兼容 dict 的 get/[]/keys/items 读取方式，模板中 `post.get('title')` 无需修改
+    - 注意：Record 本身并不阻止修改字段，约定创建后不再修改；通过 shared() 获得的共享实例会被多个对象引用，
+        修改其字段会同时影响全部引用者，需要修改时必须创建新的 Record
+    """
+    __slots__ = ("__weakref__",)
+
+    # 全部 Record 共享实例缓存，按 (类型, 全部字段值) 去重
+    # 注意：此处只保留弱引用，不再被任何 post/comment 引用的实例会自动释放，常驻进程/预览模式中反复加载数据时不会无限增长
+    _shared_records = weakref.WeakValueDictionary()
+
+    # 全部字段名称，按继承顺序排列，定义子类时计算一次
+    # 注意：keys/values/items/[]/in 均位于热路径，此处不再每次调用都遍历 __mro__
+    _fields = ()
+    _fields_set = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            fields.extend( key for key in getattr(klass, "__slots__", ()) if key != "__weakref__" )
+        cls._fields = tuple(fields)
+        cls._fields_set = frozenset(fields)
+
+    @classmethod
+    def fields(cls):
+        return cls._fields
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """从已经转换好的字段数据创建 Record，跳过原始接口数据的转换过程
+        """
+        record = cls.__new__(cls)
+        for key in cls.fields():
+            setattr(record, key, data.get(key))
+        return record
+
+    def shared(self):
+        """返回与当前 Record 字段值完全相同的共享实例，相同数据只保留一份
+        """
+        key = (type(self), tuple(self.values()))
+        record = Record._shared_records.get(key)
+        if record is None:
+            Record._shared_records[key] = record = self
+        return record
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        if key not in self._fields_set:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key):
+        return key in self._fields_set
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return [ self.get(key) for key in self.keys() ]
+
+    def items(self):
+        return [ (key, self.get(key)) for key in self.keys() ]
+
+    def to_dict(self):
+        def convert(value):
+            if isinstance(value, Record):
+                return value.to_dict()
+            if isinstance(value, (list, tuple)):
+                return [ convert(item) for item in value ]
+            return value
+        return { key: convert(value) for key, value in self.items() }
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{key}={value!r}' for key, value in self.items())})"